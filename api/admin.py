@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Q
 from .models import CustomUser
+from .pagination import LargeTableAdminMixin
 
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     model = CustomUser
     fieldsets = (
         (None, {"fields": ("email", "password")}),
@@ -32,8 +34,27 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
     list_display = ("email", "first_name", "last_name", "is_staff", "role")
-    search_fields = ("email", "first_name", "last_name")
+    # Role choices come from the model, so the filter sidebar needs no
+    # query, and the (role, email) index serves the filtered list in email
+    # order.
+    list_filter = ("role",)
+    list_select_related = False
+    # Searches match the start of the email, which the email index serves,
+    # instead of scanning every row for a substring.
+    search_fields = ("email",)
+    search_help_text = "Search by the start of an email address."
     ordering = ("email",)
+    keyset_field = "email"
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        prefixes = {search_term, search_term.lower()}
+        query = Q()
+        for prefix in prefixes:
+            query |= Q(email__startswith=prefix)
+        return queryset.filter(query), False
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
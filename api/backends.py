@@ -0,0 +1,136 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, get_backends, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db.models import DEFERRED
+from django.views.decorators.debug import sensitive_variables
+
+from .hashing import acheck_password, get_hashing_pool
+
+# Bump the version when the snapshot's layout changes.
+SNAPSHOT_KEY = "user-snapshot:v2:{}"
+
+
+def snapshot_fields(user):
+    """The values of the user's columns, as cached."""
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+    }
+
+
+def user_from_snapshot(fields):
+    """
+    A real user instance, as if loaded from the database, built from cached
+    column values. Columns missing from the snapshot are deferred.
+    """
+    UserModel = get_user_model()
+    names = [field.attname for field in UserModel._meta.concrete_fields]
+    return UserModel.from_db(
+        UserModel._default_manager.db,
+        names,
+        [fields.get(name, DEFERRED) for name in names],
+    )
+
+
+def snapshot_cache():
+    return caches[getattr(settings, "USER_SNAPSHOT_CACHE", "default")]
+
+
+def get_user_snapshot(user_id):
+    """The user, from the cache or loaded on a miss. None if gone."""
+    cache = snapshot_cache()
+    key = SNAPSHOT_KEY.format(user_id)
+    fields = cache.get(key)
+    if fields is not None:
+        return user_from_snapshot(fields)
+
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.get(pk=user_id)
+    except UserModel.DoesNotExist:
+        return None
+    cache.set(
+        key,
+        snapshot_fields(user),
+        getattr(settings, "USER_SNAPSHOT_TIMEOUT", 300),
+    )
+    return user
+
+
+def invalidate_user_snapshot(user_id):
+    snapshot_cache().delete(SNAPSHOT_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose ``get_user()``, run on every request with a session,
+    rebuilds the user from a cached snapshot of its row instead of querying
+    the user table. Snapshots are dropped when the user is saved or deleted
+    (see ``api.signals``), and expire after ``USER_SNAPSHOT_TIMEOUT`` seconds
+    for changes that bypass signals, like ``QuerySet.update()``.
+    """
+
+    def get_user(self, user_id):
+        user = get_user_snapshot(user_id)
+        if user is None or not self.user_can_authenticate(user):
+            return None
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        """authenticate() with the password hashing done by the hashing pool."""
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget(
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        except UserModel.DoesNotExist:
+            # Hash anyway, so a missing user doesn't answer faster (#20760).
+            await get_hashing_pool().make_password(password)
+            return None
+        if await acheck_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+@sensitive_variables("credentials")
+async def aauthenticate(request, **credentials):
+    """
+    ``authenticate()`` for async views. Backends with an ``aauthenticate()``
+    run on the event loop, others in a thread. As with ``authenticate()``,
+    backends that don't take the credentials are skipped, a backend raising
+    PermissionDenied stops the search, and ``user_login_failed`` is sent
+    when no backend returns a user.
+    """
+    for backend in get_backends():
+        authenticate = getattr(backend, "aauthenticate", None)
+        if authenticate is None:
+            authenticate = sync_to_async(backend.authenticate)
+            signature = inspect.signature(backend.authenticate)
+        else:
+            signature = inspect.signature(authenticate)
+        try:
+            signature.bind(request, **credentials)
+        except TypeError:
+            continue
+        try:
+            user = await authenticate(request, **credentials)
+        except PermissionDenied:
+            break
+        if user is not None:
+            user.backend = f"{backend.__module__}.{backend.__class__.__qualname__}"
+            return user
+
+    await user_login_failed.asend(
+        sender=__name__, credentials=_clean_credentials(credentials), request=request
+    )
+    return None
@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class HashingPoolFull(Exception):
+    """Raised when ``max_pending`` hashes are already queued or running."""
+
+
+class HashingPool:
+    """
+    Runs password hashing in ``workers`` processes, so the tens of
+    milliseconds of CPU a hash takes neither blocks the event loop nor holds
+    the GIL for the rest of the server. At most ``max_pending`` hashes are
+    queued or running at once; past that, calls fail fast with
+    HashingPoolFull instead of piling up behind a login burst. With
+    ``workers=0`` hashes run in a thread instead.
+    """
+
+    def __init__(self, workers=2, max_pending=64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the server process runs threads
+                # (log writer, thread-sensitive executor) that a fork would
+                # copy mid-flight.
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolFull
+        try:
+            if not self.workers:
+                return await sync_to_async(function, thread_sensitive=False)(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor(), function, *args)
+        finally:
+            self._slots.release()
+
+    async def make_password(self, password):
+        return await self.run(make_password, password)
+
+    async def verify_password(self, password, encoded):
+        """``(is_correct, must_update)``, see django.contrib.auth.hashers."""
+        return await self.run(verify_password, password, encoded)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_pool = None
+
+
+@receiver(setting_changed)
+def reset_pool(*, setting, **kwargs):
+    global _pool
+    if setting in ("PASSWORD_HASHING_OPTIONS", "PASSWORD_HASHERS") and _pool:
+        _pool.shutdown()
+        _pool = None
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        _pool = HashingPool(**getattr(settings, "PASSWORD_HASHING_OPTIONS", {}))
+    return _pool
+
+
+async def acheck_password(user, password):
+    """
+    ``user.check_password()`` with the hashing done by the pool, upgrading
+    the stored hash when the preferred hasher or its work factor changed.
+    """
+    pool = get_hashing_pool()
+    is_correct, must_update = await pool.verify_password(password, user.password)
+    if is_correct and must_update:
+        user.password = await pool.make_password(password)
+        await user.asave(update_fields=["password"])
+    return is_correct
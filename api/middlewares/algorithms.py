@@ -0,0 +1,222 @@
+import math
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_ALGORITHM = "api.middlewares.algorithms.FixedWindow"
+
+# Slack for float rounding at exact boundaries, e.g. 7 * (60 / 7) > 60.
+EPSILON = 1e-9
+
+Decision = namedtuple("Decision", ["allowed", "remaining", "reset", "retry_after"])
+
+
+class FixedWindowState:
+    __slots__ = ("count", "start", "expires")
+
+    def __init__(self):
+        self.count = 0
+        self.start = -math.inf
+        self.expires = -math.inf
+
+
+class FixedWindow:
+    """
+    Counts every request in a window that starts with the first request.
+    The cache store aligns windows to the clock instead.
+    """
+
+    counter_based = True
+    uses_previous_window = False
+
+    def new_state(self, limit):
+        return FixedWindowState()
+
+    def consume(self, state, limit, window, now, cost=1):
+        if now - state.start >= window:
+            state.count = 0
+            state.start = now
+            state.expires = now + window
+
+        state.count += cost
+        return self.decide(0, state.count, state.start, limit, window, now)
+
+    def decide(self, previous, current, start, limit, window, now):
+        reset = start + window - now
+        if current <= limit:
+            return Decision(True, limit - current, reset, 0)
+        return Decision(False, 0, reset, reset)
+
+
+class SlidingWindowState:
+    __slots__ = ("index", "previous", "current", "expires")
+
+    def __init__(self):
+        self.index = None
+        self.previous = 0
+        self.current = 0
+        self.expires = -math.inf
+
+
+class SlidingWindowCounter:
+    """
+    Two clock-aligned buckets: the previous bucket's count is weighted by
+    how much of it still overlaps the sliding window.
+    """
+
+    counter_based = True
+    uses_previous_window = True
+
+    def new_state(self, limit):
+        return SlidingWindowState()
+
+    def consume(self, state, limit, window, now, cost=1):
+        index = int(now // window)
+        if index != state.index:
+            state.previous = state.current if state.index == index - 1 else 0
+            state.current = 0
+            state.index = index
+            state.expires = (index + 2) * window
+
+        state.current += cost
+        return self.decide(
+            state.previous, state.current, index * window, limit, window, now
+        )
+
+    def decide(self, previous, current, start, limit, window, now):
+        weight = 1 - (now - start) / window
+        used = previous * weight + current
+        reset = start + window - now
+        if used <= limit + EPSILON:
+            return Decision(True, int(limit - used + EPSILON), reset, 0)
+        return Decision(False, 0, reset, reset)
+
+
+class SlidingLogState:
+    __slots__ = ("log", "position", "expires")
+
+    def __init__(self, limit):
+        self.log = array("d", [-math.inf]) * limit
+        self.position = 0
+        self.expires = -math.inf
+
+
+class SlidingLog:
+    """
+    Exact sliding window. Only the timestamps of the last ``limit`` allowed
+    requests are kept, in a fixed-size ring, so a hit is O(cost) and memory
+    is bounded by the limit.
+    """
+
+    counter_based = False
+
+    def new_state(self, limit):
+        return SlidingLogState(limit)
+
+    def consume(self, state, limit, window, now, cost=1):
+        log = state.log
+        if len(log) != limit:
+            state.__init__(limit)
+            log = state.log
+
+        if cost > limit:
+            return Decision(False, self._remaining(state, window, now), 0, math.inf)
+
+        oldest = log[(state.position + cost - 1) % limit]
+        if oldest > now - window:
+            retry_after = oldest + window - now
+            reset = log[state.position - 1] + window - now
+            return Decision(
+                False, self._remaining(state, window, now), reset, retry_after
+            )
+
+        for _ in range(cost):
+            log[state.position] = now
+            state.position = (state.position + 1) % limit
+        state.expires = now + window
+        return Decision(True, self._remaining(state, window, now), window, 0)
+
+    def _remaining(self, state, window, now):
+        log, position = state.log, state.position
+        size = len(log)
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if log[(position + middle) % size] <= now - window:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+class TokenBucketState:
+    __slots__ = ("tokens", "updated", "expires")
+
+    def __init__(self, limit):
+        self.tokens = limit
+        self.updated = -math.inf
+        self.expires = -math.inf
+
+
+class TokenBucket:
+    """Bucket of ``limit`` tokens refilled continuously over ``window``."""
+
+    counter_based = False
+
+    def new_state(self, limit):
+        return TokenBucketState(limit)
+
+    def consume(self, state, limit, window, now, cost=1):
+        rate = limit / window
+        tokens = min(limit, state.tokens + (now - state.updated) * rate)
+        state.updated = now
+
+        if tokens + EPSILON >= cost:
+            tokens = max(tokens - cost, 0)
+            allowed, retry_after = True, 0
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate
+
+        state.tokens = tokens
+        reset = (limit - tokens) / rate
+        state.expires = now + reset
+        return Decision(allowed, int(tokens + EPSILON), reset, retry_after)
+
+
+class GCRAState:
+    __slots__ = ("tat", "expires")
+
+    def __init__(self):
+        self.tat = -math.inf
+        self.expires = -math.inf
+
+
+class GCRA:
+    """
+    Generic cell rate algorithm: a token bucket that stores only the
+    theoretical arrival time of the next request.
+    """
+
+    counter_based = False
+
+    def new_state(self, limit):
+        return GCRAState()
+
+    def consume(self, state, limit, window, now, cost=1):
+        interval = window / limit
+        tat = max(state.tat, now)
+        new_tat = tat + interval * cost
+
+        if new_tat - now <= window + EPSILON:
+            state.tat = state.expires = new_tat
+            remaining = int((window - (new_tat - now)) / interval + EPSILON)
+            return Decision(True, remaining, new_tat - now, 0)
+
+        remaining = int((window - (tat - now)) / interval + EPSILON)
+        return Decision(False, remaining, tat - now, new_tat - window - now)
+
+
+def get_algorithm():
+    return import_string(getattr(settings, "RATELIMIT_ALGORITHM", DEFAULT_ALGORITHM))()
@@ -0,0 +1,189 @@
+import ipaddress
+import socket
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+CLIENT_IP_HEADERS = {
+    "X-Forwarded-For": "HTTP_X_FORWARDED_FOR",
+    "Forwarded": "HTTP_FORWARDED",
+}
+
+
+def parse_ip(ip):
+    """
+    ``(version, integer)`` for an IPv4 or IPv6 address. IPv4-mapped IPv6
+    addresses count as IPv4. Raises ValueError for anything else.
+    """
+    try:
+        if ":" in ip:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+            if value >> 32 == 0xFFFF:
+                return 4, value & 0xFFFFFFFF
+            return 6, value
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError) as e:
+        raise ValueError(f"{ip!r} is not an IP address.") from e
+
+
+class IPNetworkSet:
+    """
+    Set of IP addresses and CIDR ranges, stored as merged integer intervals
+    sorted by start, so a lookup is one binary search whatever the number of
+    networks.
+    """
+
+    def __init__(self, networks=()):
+        spans = {4: [], 6: []}
+        for network in networks:
+            network = ipaddress.ip_network(network.strip(), strict=False)
+            spans[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+
+        self.starts = {}
+        self.ends = {}
+        for version, version_spans in spans.items():
+            merged = []
+            for start, end in sorted(version_spans):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, _ in merged]
+            self.ends[version] = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts[4]) + len(self.starts[6])
+
+    def __contains__(self, ip):
+        try:
+            version, value = parse_ip(ip)
+        except ValueError:
+            return False
+        index = bisect_right(self.starts[version], value) - 1
+        return index >= 0 and value <= self.ends[version][index]
+
+
+def parse_forwarded(value):
+    """The ``for=`` addresses of a Forwarded header (RFC 7239), in order."""
+    addresses = []
+    for element in value.split(","):
+        address = None
+        for pair in element.split(";"):
+            name, _, token = pair.partition("=")
+            if name.strip().lower() == "for":
+                address = strip_port(token.strip().strip('"'))
+        addresses.append(address)
+    return addresses
+
+
+def strip_port(address):
+    if address.startswith("["):
+        return address[1 : address.find("]")]
+    if address.count(":") == 1:
+        return address.partition(":")[0]
+    return address
+
+
+class ClientIPResolver:
+    """
+    Finds the client address behind ``trusted_proxies``.
+
+    The forwarding header is read from the right: every hop added by a
+    trusted proxy is skipped, and the first address not in
+    ``trusted_proxies`` is the client. Requests that do not come from a
+    trusted proxy are taken at their socket address, so the header can't be
+    forged from outside. IPv6 clients are bucketed by ``ipv6_prefix`` bits
+    for rate limiting, since one host usually controls a whole /64.
+    """
+
+    def __init__(self, trusted_proxies=(), header="X-Forwarded-For", ipv6_prefix=64):
+        if header not in CLIENT_IP_HEADERS:
+            raise ImproperlyConfigured(
+                f"CLIENT_IP_HEADER must be one of {', '.join(CLIENT_IP_HEADERS)}, "
+                f"not {header!r}."
+            )
+        self.trusted_proxies = IPNetworkSet(trusted_proxies)
+        self.has_proxies = len(self.trusted_proxies) > 0
+        self.header = header
+        self.meta_key = CLIENT_IP_HEADERS[header]
+        self.ipv6_mask = ((1 << ipv6_prefix) - 1) << (128 - ipv6_prefix)
+        self.ipv6_prefix = ipv6_prefix
+
+    def resolve(self, meta):
+        """``(client ip, rate limit bucket)`` for a request's META."""
+        ip = meta.get("REMOTE_ADDR")
+        if self.has_proxies and ip in self.trusted_proxies:
+            ip = self.walk(ip, meta.get(self.meta_key))
+        return ip, self.bucket(ip)
+
+    def walk(self, ip, header):
+        if not header:
+            return ip
+        if self.header == "Forwarded":
+            hops = parse_forwarded(header)
+        else:
+            hops = [hop.strip() for hop in header.split(",")]
+
+        for hop in reversed(hops):
+            try:
+                parse_ip(hop)
+            except ValueError:
+                break
+            ip = hop
+            if hop not in self.trusted_proxies:
+                break
+        return ip
+
+    def bucket(self, ip):
+        try:
+            version, value = parse_ip(ip)
+        except ValueError:
+            return ip
+        if version == 4:
+            return str(ipaddress.IPv4Address(value)) if ":" in ip else ip
+        network = ipaddress.IPv6Address(value & self.ipv6_mask)
+        return f"{network}/{self.ipv6_prefix}"
+
+
+_resolver = None
+
+
+@receiver(setting_changed)
+def reset_resolver(*, setting, **kwargs):
+    global _resolver
+    if setting in ("TRUSTED_PROXIES", "CLIENT_IP_HEADER", "CLIENT_IPV6_PREFIX"):
+        _resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = ClientIPResolver(
+            getattr(settings, "TRUSTED_PROXIES", ()),
+            getattr(settings, "CLIENT_IP_HEADER", "X-Forwarded-For"),
+            getattr(settings, "CLIENT_IPV6_PREFIX", 64),
+        )
+    return _resolver
+
+
+def resolve_client(request):
+    try:
+        return request.client_ip, request.client_bucket
+    except AttributeError:
+        request.client_ip, request.client_bucket = get_resolver().resolve(request.META)
+        return request.client_ip, request.client_bucket
+
+
+def get_client_ip(request):
+    """The client's address, resolved once per request."""
+    return resolve_client(request)[0]
+
+
+def get_client_bucket(request):
+    """The address rate limits apply to: the client IP, or its IPv6 network."""
+    return resolve_client(request)[1]
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from .clientip import get_client_bucket
+from .metrics import registry
+from .utils import aload_user, hold_until_closed
+
+CONCURRENCY_EXCEEDED_BODY = json.dumps(
+    {"error": "Too many requests in progress. Try again later."}
+).encode()
+
+DEFAULT_CLIENT_LIMITS = {
+    "gold": 8,
+    "silver": 4,
+    "bronze": 2,
+    "unauthenticated": 2,
+    "*": 2,
+}
+
+
+class Waiter:
+    __slots__ = ("client", "role", "wake", "granted")
+
+    def __init__(self, client, role, wake):
+        self.client = client
+        self.role = role
+        self.wake = wake
+        self.granted = False
+
+
+class ConcurrencyLimiter:
+    """
+    Counts requests in progress per client and per role, and admits a new
+    one only while both are under their limit. ``client_limits`` and
+    ``role_limits`` map roles to a limit, with ``"*"`` for any other role;
+    a role with neither is not limited.
+
+    When a request is over a limit, up to ``queue_size`` requests wait for a
+    slot for at most ``timeout`` seconds. A released slot is handed to the
+    oldest waiter it fits, so waiters are not overtaken by new arrivals.
+    """
+
+    def __init__(self, client_limits=None, role_limits=None, queue_size=0, timeout=1):
+        if client_limits is None:
+            client_limits = DEFAULT_CLIENT_LIMITS
+        self.client_limits = client_limits
+        self.role_limits = role_limits or {}
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._clients = {}
+        self._roles = {}
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, client, role):
+        """Take a slot, waiting in the queue if needed. False if none came."""
+        with self._lock:
+            if self._take(client, role):
+                return True
+            if len(self._waiters) >= self.queue_size:
+                return False
+            event = threading.Event()
+            waiter = Waiter(client, role, event.set)
+            self._waiters.append(waiter)
+
+        event.wait(self.timeout)
+        return self._settle(waiter)
+
+    async def aacquire(self, client, role):
+        with self._lock:
+            if self._take(client, role):
+                return True
+            if len(self._waiters) >= self.queue_size:
+                return False
+            # Slots can be released from other threads, e.g. when a
+            # streaming response is closed.
+            event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            waiter = Waiter(client, role, partial(loop.call_soon_threadsafe, event.set))
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(event.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._settle(waiter):
+                self.release(client, role)
+            raise
+        return self._settle(waiter)
+
+    def release(self, client, role):
+        with self._lock:
+            self._drop(self._clients, client)
+            self._drop(self._roles, role)
+            for waiter in list(self._waiters):
+                if self._take(waiter.client, waiter.role):
+                    waiter.granted = True
+                    self._waiters.remove(waiter)
+                    waiter.wake()
+
+    def _settle(self, waiter):
+        # A slot may have been handed over just as the wait timed out.
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+            return waiter.granted
+
+    def _take(self, client, role):
+        clients = self._clients.get(client, 0)
+        roles = self._roles.get(role, 0)
+        if self._full(self.client_limits, role, clients) or self._full(
+            self.role_limits, role, roles
+        ):
+            return False
+        self._clients[client] = clients + 1
+        self._roles[role] = roles + 1
+        return True
+
+    def _full(self, limits, role, count):
+        limit = limits.get(role, limits.get("*"))
+        return limit is not None and count >= limit
+
+    def _drop(self, counts, key):
+        count = counts[key] - 1
+        if count:
+            counts[key] = count
+        else:
+            del counts[key]
+
+
+def get_concurrency_limiter():
+    return ConcurrencyLimiter(**getattr(settings, "CONCURRENCY_LIMIT_OPTIONS", {}))
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Caps the requests each client (user, or IP for anonymous clients) and
+    each role can have in progress at once, so a few slow clients can't tie
+    up every worker. Requests over the cap wait in a short queue, and get a
+    503 when it is full or their wait times out. The slot is released when
+    the response is done, including after an exception, and only once the
+    body of a streaming response has been sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.limiter = get_concurrency_limiter()
+        self.exempt_paths = frozenset(getattr(settings, "RATELIMIT_EXEMPT_PATHS", ()))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self.is_exempt(request):
+            return self.get_response(request)
+
+        client, role = self.identify(request)
+        if not self.limiter.acquire(client, role):
+            return self.too_busy(role)
+
+        release = partial(self.limiter.release, client, role)
+        held = False
+        try:
+            response = self.get_response(request)
+            held = hold_until_closed(response, release)
+            return response
+        finally:
+            if not held:
+                release()
+
+    async def __acall__(self, request):
+        if self.is_exempt(request):
+            return await self.get_response(request)
+
+        await aload_user(request)
+        client, role = self.identify(request)
+        if not await self.limiter.aacquire(client, role):
+            return self.too_busy(role)
+
+        release = partial(self.limiter.release, client, role)
+        held = False
+        try:
+            response = await self.get_response(request)
+            held = hold_until_closed(response, release)
+            return response
+        finally:
+            if not held:
+                release()
+
+    def is_exempt(self, request):
+        return request.path_info in self.exempt_paths or getattr(
+            request, "ratelimit_exempt", False
+        )
+
+    def identify(self, request):
+        if request.user.is_authenticated:
+            return request.user.id, request.user.role
+        return get_client_bucket(request), "unauthenticated"
+
+    def too_busy(self, role):
+        registry.inc("concurrency_rejections_total", role=role)
+        response = HttpResponse(
+            CONCURRENCY_EXCEEDED_BODY, status=503, content_type="application/json"
+        )
+        response["Retry-After"] = "1"
+        return response
@@ -0,0 +1,74 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+DEFAULT_COST = 1
+
+
+def ratelimit_cost(cost, methods=None):
+    """
+    Make requests to a view count as ``cost`` requests against the client's
+    rate limit, optionally only for some HTTP ``methods``. Works on view
+    functions and on class-based views (decorate the class).
+    """
+
+    def decorator(view):
+        costs = dict(view.__dict__.get("ratelimit_costs", {}))
+        for method in methods or ["*"]:
+            costs[method.upper()] = cost
+        view.ratelimit_costs = costs
+        return view
+
+    return decorator
+
+
+def view_costs(func):
+    costs = getattr(func, "ratelimit_costs", None)
+    if costs is None:
+        costs = getattr(getattr(func, "view_class", None), "ratelimit_costs", None)
+    return costs
+
+
+class CostTable:
+    """
+    How many requests a request to a path counts as. ``costs`` maps URL
+    names to a cost, or to a dict of costs per method with ``"*"`` for the
+    others, and overrides costs set on views with ``ratelimit_cost``. Paths
+    with neither cost 1.
+
+    Like the PolicyTable, the costs a path resolves to are memoised, so the
+    URL is only resolved the first time a path is seen.
+    """
+
+    def __init__(self, costs=None, cache_size=10_000):
+        self.costs = {name: self.compile(cost) for name, cost in (costs or {}).items()}
+        self.costs_for = lru_cache(maxsize=cache_size)(self._costs_for)
+
+    def compile(self, cost):
+        if isinstance(cost, dict):
+            return {method.upper(): value for method, value in cost.items()}
+        return {"*": cost}
+
+    def _costs_for(self, path):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return None
+        costs = self.costs.get(match.view_name)
+        if costs is None:
+            costs = view_costs(match.func)
+        return costs
+
+    def resolve(self, path, method):
+        costs = self.costs_for(path)
+        if not costs:
+            return DEFAULT_COST
+        cost = costs.get(method)
+        if cost is None:
+            cost = costs.get("*", DEFAULT_COST)
+        return cost
+
+
+def get_cost_table():
+    return CostTable(getattr(settings, "RATELIMIT_COSTS", {}))
@@ -0,0 +1,178 @@
+import gzip
+import json
+import logging
+import struct
+
+RECORD_FORMATS = ("text", "jsonl", "binary")
+
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+def record_fields(record):
+    if isinstance(record.args, dict):
+        return record.args
+    return {"message": record.getMessage()}
+
+
+def to_json(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """One JSON object per line, built from the record's mapping argument."""
+
+    def format(self, record):
+        return json.dumps(record_fields(record), default=to_json, separators=(",", ":"))
+
+
+class BinaryRecordFormatter(logging.Formatter):
+    """
+    Each record is a 4-byte big-endian length followed by a MessagePack map,
+    so a reader can skip records without decoding them.
+    """
+
+    def format(self, record):
+        payload = bytearray()
+        pack(record_fields(record), payload)
+        return LENGTH_PREFIX.pack(len(payload)) + payload
+
+
+def get_formatter(record_format):
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(
+            f"record_format must be one of {', '.join(RECORD_FORMATS)}, "
+            f"not {record_format!r}."
+        )
+    if record_format == "jsonl":
+        return JSONLinesFormatter()
+    if record_format == "binary":
+        return BinaryRecordFormatter()
+    return None
+
+
+# The MessagePack subset needed for request records: nil, bool, int, float,
+# str and maps. Anything else is written as its ISO format or str().
+def pack(value, out):
+    if value is None:
+        out.append(0xC0)
+    elif value is True or value is False:
+        out.append(0xC3 if value else 0xC2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -0x20 <= value < 0:
+            out.append(value & 0xFF)
+        else:
+            out += b"\xd3" + struct.pack(">q", value)
+    elif isinstance(value, float):
+        out += b"\xcb" + struct.pack(">d", value)
+    elif isinstance(value, str):
+        data = value.encode()
+        size = len(data)
+        if size < 0x20:
+            out.append(0xA0 | size)
+        elif size < 0x100:
+            out += bytes((0xD9, size))
+        elif size < 0x10000:
+            out += b"\xda" + struct.pack(">H", size)
+        else:
+            out += b"\xdb" + struct.pack(">I", size)
+        out += data
+    elif isinstance(value, dict):
+        size = len(value)
+        if size < 0x10:
+            out.append(0x80 | size)
+        else:
+            out += b"\xde" + struct.pack(">H", size)
+        for key, item in value.items():
+            pack(key, out)
+            pack(item, out)
+    else:
+        pack(to_json(value), out)
+
+
+def unpack(data, offset=0):
+    tag = data[offset]
+    offset += 1
+    if tag < 0x80:
+        return tag, offset
+    if tag >= 0xE0:
+        return tag - 0x100, offset
+    if 0xA0 <= tag <= 0xBF:
+        size = tag & 0x1F
+        return data[offset : offset + size].decode(), offset + size
+    if 0x80 <= tag <= 0x8F:
+        return unpack_map(data, offset, tag & 0x0F)
+    if tag == 0xC0:
+        return None, offset
+    if tag in (0xC2, 0xC3):
+        return tag == 0xC3, offset
+    if tag == 0xD3:
+        return struct.unpack_from(">q", data, offset)[0], offset + 8
+    if tag == 0xCB:
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if tag in (0xD9, 0xDA, 0xDB):
+        width = {0xD9: ">B", 0xDA: ">H", 0xDB: ">I"}[tag]
+        size = struct.unpack_from(width, data, offset)[0]
+        offset += struct.calcsize(width)
+        return data[offset : offset + size].decode(), offset + size
+    if tag == 0xDE:
+        size = struct.unpack_from(">H", data, offset)[0]
+        return unpack_map(data, offset + 2, size)
+    raise ValueError(f"Unsupported MessagePack type 0x{tag:02x}.")
+
+
+def unpack_map(data, offset, size):
+    result = {}
+    for _ in range(size):
+        key, offset = unpack(data, offset)
+        result[key], offset = unpack(data, offset)
+    return result, offset
+
+
+def open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_records(*paths):
+    """
+    Stream request records back, as dicts, from JSON Lines or binary request
+    logs. Rotated ``.gz`` files are decompressed on the fly. A log that is
+    still being written can end with a partial record; reading stops before
+    it.
+    """
+    for path in paths:
+        with open_log(path) as log:
+            first = log.peek(1)[:1] if hasattr(log, "peek") else b""
+            if first == b"{":
+                yield from read_lines(log)
+            else:
+                yield from read_binary(log)
+
+
+def read_lines(log):
+    for line in log:
+        if not line.strip():
+            continue
+        if not line.endswith(b"\n"):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass
+            return
+        yield json.loads(line)
+
+
+def read_binary(log):
+    while header := log.read(LENGTH_PREFIX.size):
+        if len(header) < LENGTH_PREFIX.size:
+            return
+        (size,) = LENGTH_PREFIX.unpack(header)
+        payload = log.read(size)
+        if len(payload) < size:
+            return
+        yield unpack(payload)[0]
@@ -0,0 +1,371 @@
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import weakref
+from datetime import datetime
+from logging.handlers import QueueListener
+
+from .formats import get_formatter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+OVERFLOW_POLICIES = ("drop", "block", "sample")
+
+ROLLED_SUFFIX = "%Y%m%d-%H%M%S-%f"
+ROLLED_SUFFIX_LENGTH = len(datetime(2000, 1, 1).strftime(ROLLED_SUFFIX))
+
+if fcntl is not None:
+    LOCK_SH, LOCK_EX, LOCK_UN = fcntl.LOCK_SH, fcntl.LOCK_EX, fcntl.LOCK_UN
+else:
+    LOCK_SH = LOCK_EX = LOCK_UN = None
+
+
+class BatchingFileHandler(logging.FileHandler):
+    """
+    File handler that leaves flushing to the caller, once per batch.
+
+    After each flush the file is rolled over once it reaches ``max_bytes`` or
+    is older than ``rotate_interval`` seconds. Rolled files get a timestamp
+    suffix, are gzipped when ``compress`` is set, and only the newest
+    ``backup_count`` are kept (0 keeps all of them).
+
+    Several processes, e.g. gunicorn or uvicorn workers, can share one file.
+    Each batch is written under a shared ``flock`` on a sidecar lock file,
+    and a rollover takes it exclusively, so a file is only renamed while no
+    process is writing to it. A process that finds the file renamed reopens
+    it before its next batch. Without ``fcntl`` (Windows) only one process
+    per file is supported.
+    """
+
+    def __init__(
+        self,
+        filename,
+        encoding=None,
+        delay=True,
+        binary=False,
+        max_bytes=0,
+        rotate_interval=0,
+        backup_count=0,
+        compress=False,
+    ):
+        self.binary = binary
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.rollover_at = None
+        self._lock_file = None
+        self._lock_pid = None
+        self._in_batch = False
+        super().__init__(
+            filename, mode="ab" if binary else "a", encoding=encoding, delay=delay
+        )
+        directory, name = os.path.split(self.baseFilename)
+        # Hidden, so it is never mistaken for a rolled file.
+        self.lock_filename = os.path.join(directory, f".{name}.lock")
+
+    def _open(self):
+        if self.rotate_interval:
+            self.rollover_at = time.time() + self.rotate_interval
+        if self.binary:
+            return open(self.baseFilename, self.mode)
+        return super()._open()
+
+    def emit(self, record):
+        try:
+            if not self._in_batch:
+                self._begin_batch()
+            if self.stream is None:
+                self.stream = self._open()
+            if self.binary:
+                self.stream.write(self.format(record))
+            else:
+                self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        with self.lock:
+            if self._in_batch:
+                self._in_batch = False
+                self._flock(LOCK_UN)
+            if self.stream is not None and self.should_rollover():
+                self.rollover()
+
+    def close(self):
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = self._lock_pid = None
+        self._in_batch = False
+
+    def _begin_batch(self):
+        self._flock(LOCK_SH)
+        self._in_batch = True
+        if self.stream is not None and self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = None
+
+    def _rotated_elsewhere(self):
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        return not os.path.samestat(current, os.fstat(self.stream.fileno()))
+
+    def _flock(self, operation):
+        if fcntl is None:
+            return
+        # A forked child must not share its parent's lock.
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(self.lock_filename, "a")
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_file, operation)
+
+    def should_rollover(self):
+        if self.max_bytes and os.fstat(self.stream.fileno()).st_size >= self.max_bytes:
+            return True
+        return self.rollover_at is not None and time.time() >= self.rollover_at
+
+    def rollover(self):
+        self._flock(LOCK_EX)
+        try:
+            # Another process may have rolled the file over first.
+            if self._rotated_elsewhere():
+                self.stream.close()
+                self.stream = None
+                return
+            if not self._due_by_size() and not self._due_by_time():
+                return
+            self.stream.close()
+            self.stream = None
+            rolled = f"{self.baseFilename}.{datetime.now():{ROLLED_SUFFIX}}"
+            os.replace(self.baseFilename, rolled)
+        finally:
+            self._flock(LOCK_UN)
+
+        # Nobody writes to the rolled file any more.
+        if self.compress:
+            with open(rolled, "rb") as source, gzip.open(
+                f"{rolled}.gz", "wb"
+            ) as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rolled)
+
+        if self.backup_count:
+            for old in self.rolled_files()[: -self.backup_count]:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    # Pruned by another process.
+                    pass
+
+    def _due_by_size(self):
+        return self.max_bytes and os.stat(self.baseFilename).st_size >= self.max_bytes
+
+    def _due_by_time(self):
+        if self.rollover_at is None or time.time() < self.rollover_at:
+            return False
+        # Every process has its own clock; the last rolled file is shared.
+        last = self.last_rollover()
+        return last is None or time.time() - last >= self.rotate_interval
+
+    def last_rollover(self):
+        """When the file was last rolled over, as a timestamp, or None."""
+        prefix = len(self.baseFilename) + 1
+        for path in reversed(self.rolled_files()):
+            try:
+                rolled = datetime.strptime(
+                    path[prefix : prefix + ROLLED_SUFFIX_LENGTH], ROLLED_SUFFIX
+                )
+            except ValueError:
+                continue
+            return rolled.timestamp()
+        return None
+
+    def rolled_files(self):
+        """Rolled-over files, oldest first."""
+        prefix = os.path.basename(self.baseFilename) + "."
+        directory = os.path.dirname(self.baseFilename)
+        return sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.startswith(prefix)
+        )
+
+
+class BatchingQueueListener(QueueListener):
+    def __init__(self, queue, *handlers, batch_size=256, respect_handler_level=False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        stopping = False
+        while not stopping:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not self._sentinel]
+            stopping = len(records) != len(batch)
+            if records:
+                self.handle_batch(records)
+            for _ in batch:
+                self.queue.task_done()
+
+    def handle_batch(self, records):
+        for handler in self.handlers:
+            for record in records:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+            handler.flush()
+
+
+class QueueingFileHandler(logging.Handler):
+    """
+    Puts records on a bounded queue that a background thread writes to
+    ``filename`` in batches, so request threads never wait on the disk.
+
+    When the queue is full, ``overflow`` decides what happens: ``"drop"``
+    discards the record, ``"block"`` waits up to ``block_timeout`` seconds
+    for room, and ``"sample"`` starts keeping only one in ``sample_rate``
+    records once the queue is half full. Discarded records are counted in
+    ``dropped`` and ``sampled_out``.
+
+    ``record_format`` is ``"text"`` (the handler's formatter), ``"jsonl"`` or
+    ``"binary"``; the rotation options are passed to BatchingFileHandler.
+    """
+
+    def __init__(
+        self,
+        filename,
+        max_queue_size=10_000,
+        overflow="drop",
+        batch_size=256,
+        block_timeout=0.05,
+        sample_rate=10,
+        encoding=None,
+        record_format="text",
+        max_bytes=0,
+        rotate_interval=0,
+        backup_count=0,
+        compress=False,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}, "
+                f"not {overflow!r}."
+            )
+        super().__init__()
+        self.queue = queue.Queue(max_queue_size)
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.sampled_out = 0
+        self._seen_while_busy = 0
+        self._stats_lock = threading.Lock()
+
+        formatter = get_formatter(record_format)
+        self.record_format = record_format
+        self.target = BatchingFileHandler(
+            filename,
+            encoding=encoding,
+            binary=record_format == "binary",
+            max_bytes=max_bytes,
+            rotate_interval=rotate_interval,
+            backup_count=backup_count,
+            compress=compress,
+        )
+        if formatter is not None:
+            self.target.setFormatter(formatter)
+        self.listener = BatchingQueueListener(
+            self.queue, self.target, batch_size=batch_size
+        )
+        self.listener.start()
+        self._closed = False
+        handler_ref = weakref.ref(self)
+        os.register_at_fork(
+            after_in_child=lambda: handler_ref() and handler_ref()._restart_listener()
+        )
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        if self.record_format == "text":
+            self.target.setFormatter(fmt)
+
+    def handle(self, record):
+        # queue.Queue does its own locking, so skip the handler lock.
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        # Formatting happens on the writer thread, not the request thread.
+        if self.overflow == "block":
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self._count_dropped()
+            return
+
+        if self.overflow == "sample" and self.queue.qsize() >= self.max_queue_size // 2:
+            with self._stats_lock:
+                self._seen_while_busy += 1
+                if self._seen_while_busy % self.sample_rate:
+                    self.sampled_out += 1
+                    return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+    def flush(self):
+        if self.listener._thread is not None:
+            self.queue.join()
+
+    def close(self):
+        self._closed = True
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+    def _count_dropped(self):
+        with self._stats_lock:
+            self.dropped += 1
+
+    def _restart_listener(self):
+        # Threads do not survive fork; a preloaded master hands us a queue
+        # nobody drains.
+        if self._closed:
+            return
+        self._stats_lock = threading.Lock()
+        self.queue = queue.Queue(self.max_queue_size)
+        self.listener = BatchingQueueListener(
+            self.queue, self.target, batch_size=self.listener.batch_size
+        )
+        self.listener.start()
@@ -1,34 +1,107 @@
 import logging
 import os
+import time
 from datetime import datetime
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .clientip import get_client_bucket, get_client_ip
+from .handlers import QueueingFileHandler
+from .sampling import get_request_sampler
+from .utils import aload_user, is_user_loaded
+
 request_logger = logging.getLogger("request_logger")
 
+# Statuses the rate limiter, concurrency limit and load shedder reject with.
+REJECTED_STATUSES = frozenset((429, 503))
+
+LOG_FORMAT = (
+    "IP: %(ip)s, User: %(user)s, Request Time: %(time)s, Method: %(method)s, "
+    "Path: %(path)s, Status: %(status)s, Latency: %(latency_ms).1fms"
+)
+
 
 class LoggingMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sampler = get_request_sampler()
         self.setup_logging()
 
     def __call__(self, request):
-        ip_address = self.get_client_ip(request)
-
-        user = request.user.email if request.user.is_authenticated else "Anonymous"
-        request_time = datetime.now()
+        if self.async_mode:
+            return self.__acall__(request)
 
-        request_logger.info(
-            f"IP: {ip_address}, User: {user}, Request Time: {request_time}"
-        )
+        started = time.perf_counter()
+        sampled = self.should_sample(request)
         response = self.get_response(request)
+        if sampled or self.sampler.always_log(response.status_code):
+            self.log_request(request, response, time.perf_counter() - started)
         return response
 
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        return (
-            x_forwarded_for.split(",")[0]
-            if x_forwarded_for
-            else request.META.get("REMOTE_ADDR")
-        )
+    async def __acall__(self, request):
+        # Records only go onto an in-memory queue, so logging doesn't block
+        # the event loop (unless the handler's overflow policy is "block").
+        started = time.perf_counter()
+        sampled = self.should_sample(request)
+        response = await self.get_response(request)
+        if sampled or self.sampler.always_log(response.status_code):
+            elapsed = time.perf_counter() - started
+            if self.needs_user(request, response):
+                await aload_user(request)
+            self.log_request(request, response, elapsed)
+        return response
+
+    def should_sample(self, request):
+        """
+        Decide from the path and IP only, so requests that are not logged
+        never touch ``request.user`` or build a record.
+        """
+        if not request_logger.isEnabledFor(logging.INFO):
+            return False
+        ip = get_client_bucket(request) if self.sampler.per_ip_limit else None
+        return self.sampler.sample(request.path, ip)
+
+    def needs_user(self, request, response):
+        # A limiter that rejected a request without loading the user did so
+        # to spare the session lookup; don't make it for the log. The user
+        # is then logged as "-".
+        return response.status_code not in REJECTED_STATUSES or is_user_loaded(request)
+
+    def user_field(self, request, response):
+        # No user when a middleware above AuthenticationMiddleware answered.
+        user = getattr(request, "user", None)
+        if user is None:
+            return "Anonymous"
+        if not self.needs_user(request, response):
+            return "-"
+        return user.email if user.is_authenticated else "Anonymous"
+
+    def request_fields(self, request, response, elapsed):
+        return {
+            "ip": get_client_ip(request),
+            "user": self.user_field(request, response),
+            "time": datetime.fromtimestamp(time.time() - elapsed),
+            "method": request.method,
+            "path": request.path,
+        }
+
+    def log_request(self, request, response, elapsed):
+        fields = self.request_fields(request, response, elapsed)
+        fields["status"] = status = response.status_code
+        fields["latency_ms"] = elapsed * 1000
+        if status >= 500:
+            level = logging.ERROR
+        elif status >= 400:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        request_logger.log(level, LOG_FORMAT, fields)
 
     def setup_logging(self):
         log_dir = os.path.join(
@@ -40,7 +113,7 @@ class LoggingMiddleware:
             os.makedirs(log_dir)
 
         if not request_logger.handlers:
-            file_handler = logging.FileHandler(log_file)
+            file_handler = QueueingFileHandler(log_file)
             formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
             file_handler.setFormatter(formatter)
             request_logger.setLevel(logging.INFO)
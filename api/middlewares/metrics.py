@@ -0,0 +1,212 @@
+import threading
+import time
+from array import array
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Sub-buckets per power of two: 8 gives about 12% relative precision.
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Microsecond values up to 2**40 (about 12 days) fit in the fixed bucket array.
+MAX_VALUE_BITS = 40
+BUCKET_COUNT = (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS + 2 * SUB_BUCKETS
+
+# Bucket boundaries exported to Prometheus, in seconds.
+EXPORTED_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min((shift << SUB_BUCKET_BITS) + (value >> shift), BUCKET_COUNT - 1)
+
+
+def bucket_upper_bound(index):
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    sub_bucket = (index & (SUB_BUCKETS - 1)) | SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    HDR-style histogram of microsecond values: log-linear buckets in a fixed
+    array, so memory does not depend on how many values are recorded.
+    """
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        index = bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def percentile(self, percent):
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return bucket_upper_bound(index)
+        return 0
+
+    def cumulative(self, boundaries):
+        """Counts of values at or below each boundary (in microseconds)."""
+        result, seen, index = [], 0, 0
+        for boundary in boundaries:
+            while index < BUCKET_COUNT and bucket_upper_bound(index) <= boundary:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self, samples=()):
+        """
+        Prometheus text exposition format. ``samples`` adds values collected
+        at scrape time, as ``(name, type, labels, value)`` tuples.
+        """
+        # Requests can add series while we render.
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            declare(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, kind, labels, value in samples:
+            declare(name, kind)
+            lines.append(f"{name}{format_labels(tuple(labels.items()))} {value}")
+
+        boundaries = [round(bound * 1e6) for bound in EXPORTED_BUCKETS]
+        for (name, labels), histogram in sorted(histograms.items()):
+            declare(name, "histogram")
+            cumulative = histogram.cumulative(boundaries)
+            for bound, count in zip(EXPORTED_BUCKETS, cumulative):
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{format_labels(inf_labels)} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.total / 1e6}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape_label(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+class TimingMiddleware:
+    """
+    Records per-view request latency, and the time the middleware stack
+    spends before the view runs. Put it near the top of MIDDLEWARE.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django runs a sync process_view in a thread on an async stack.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started = time.perf_counter_ns()
+        response = self.get_response(request)
+        self.record(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter_ns()
+        response = await self.get_response(request)
+        self.record(request, started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_started = time.perf_counter_ns()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        request.view_started = time.perf_counter_ns()
+
+    def record(self, request, started):
+        elapsed = (time.perf_counter_ns() - started) // 1000
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unresolved"
+        registry.histogram("request_latency_seconds", view=view).record(elapsed)
+
+        view_started = getattr(request, "view_started", None)
+        if view_started is not None:
+            overhead = registry.histogram("middleware_overhead_seconds")
+            overhead.record((view_started - started) // 1000)
@@ -0,0 +1,63 @@
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class PenaltyBox:
+    """
+    Escalating blocks for clients that keep going over their rate limit.
+
+    Strike ``n`` blocks the client for ``base * factor ** (n - 1)`` seconds,
+    at most ``max_duration``. One strike is forgiven for every ``decay``
+    seconds without a new one, so a client that behaves drops back to short
+    blocks. At most ``max_entries`` clients are tracked, least recently
+    punished first out.
+    """
+
+    def __init__(
+        self, base=60, factor=2, max_duration=86_400, decay=3_600, max_entries=100_000
+    ):
+        self.base = base
+        self.factor = factor
+        self.max_duration = max_duration
+        self.decay = decay
+        self.max_entries = max_entries
+        # key -> [strikes, last strike time, blocked until]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def blocked_for(self, key, now):
+        """Seconds left on the client's block, 0 if it is not blocked."""
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= now:
+            return 0
+        return entry[2] - now
+
+    def punish(self, key, now):
+        """Add a strike and return how long the client is now blocked for."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            strikes = self.strikes(entry, now) + 1
+            exponent = min(strikes - 1, 64)
+            duration = min(self.base * self.factor**exponent, self.max_duration)
+            self._entries[key] = [strikes, now, now + duration]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return duration
+
+    def strikes(self, entry, now):
+        if entry is None:
+            return 0
+        strikes, last_strike, _ = entry
+        if self.decay:
+            strikes -= math.floor((now - last_strike) / self.decay)
+        return max(strikes, 0)
+
+
+def get_penalty_box():
+    return PenaltyBox(**getattr(settings, "RATELIMIT_PENALTY_OPTIONS", {}))
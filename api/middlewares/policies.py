@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+Policy = namedtuple("Policy", ["limit", "window", "scope"])
+
+DEFAULT_POLICIES = {
+    "limits": {
+        "gold": 10,
+        "silver": 5,
+        "bronze": 2,
+        "unauthenticated": 1,
+        "*": 1,
+    },
+    "rules": [],
+}
+
+GLOBAL_SCOPE = ""
+RULE_TARGETS = ("path", "prefix", "view")
+
+
+class PolicyTable:
+    """
+    Rate limit policies compiled into nested dicts, so resolving a request
+    is a handful of dict lookups.
+
+    ``limits`` maps roles to requests per window, with ``"*"`` for any other
+    role. Each rule targets one ``path``, every path under a ``prefix``, or
+    the URL name of a ``view``, optionally only for some ``methods``, and
+    sets ``limits`` (and a ``window``) for the roles it lists. Requests a
+    rule covers are counted separately from the rest of the client's
+    traffic; roles and methods it does not cover fall back to ``limits``.
+
+    The path a request resolves to is memoised, so only the first request
+    for a path pays for the prefix walk and the URL resolution.
+    """
+
+    def __init__(self, limits, rules=(), window=60, cache_size=10_000):
+        self.default = Policy(limits.get("*", 1), window, GLOBAL_SCOPE)
+        self.roles = self.compile_roles(limits, window, GLOBAL_SCOPE)
+        self.paths = {}
+        self.prefixes = {}
+        self.views = {}
+        self.scopes = {}
+
+        indexes = {"path": self.paths, "prefix": self.prefixes, "view": self.views}
+        grouped = {}
+        for rule in rules:
+            targets = [target for target in RULE_TARGETS if target in rule]
+            if len(targets) != 1:
+                raise ImproperlyConfigured(
+                    f"A rate limit rule needs exactly one of "
+                    f"{', '.join(RULE_TARGETS)}: {rule!r}"
+                )
+            target = targets[0]
+            scope = f"{target}:{rule[target]}"
+            indexes[target][rule[target]] = scope
+            grouped.setdefault(scope, []).append(rule)
+
+        for scope, scope_rules in grouped.items():
+            self.scopes[scope] = self.compile_scope(scope, scope_rules, window)
+
+        self.scope_for = lru_cache(maxsize=cache_size)(self._scope_for)
+
+    @classmethod
+    def from_config(cls, config, window=60):
+        return cls(
+            config.get("limits", DEFAULT_POLICIES["limits"]),
+            config.get("rules", ()),
+            config.get("window", window),
+        )
+
+    def compile_roles(self, limits, window, scope):
+        return {
+            role.lower(): Policy(limit, window, scope) for role, limit in limits.items()
+        }
+
+    def compile_scope(self, scope, rules, default_window):
+        by_method = {"*": {}}
+        for rule in rules:
+            roles = self.compile_roles(
+                rule.get("limits", {}), rule.get("window", default_window), scope
+            )
+            for method in rule.get("methods", ["*"]):
+                by_method.setdefault(method.upper(), {}).update(roles)
+
+        # Method specific entries inherit the roles set for every method.
+        any_method = by_method["*"]
+        return {
+            method: {**any_method, **roles} if method != "*" else roles
+            for method, roles in by_method.items()
+        }
+
+    def _scope_for(self, path):
+        """The compiled rules for ``path``, or None if no rule covers it."""
+        scope = self.paths.get(path)
+        if scope is None and self.views:
+            try:
+                scope = self.views.get(resolve(path).view_name)
+            except Resolver404:
+                pass
+
+        if scope is None and self.prefixes:
+            prefix = path
+            while prefix and scope is None:
+                scope = self.prefixes.get(prefix)
+                prefix = prefix[: prefix.rstrip("/").rfind("/") + 1]
+                if prefix == "/":
+                    scope = scope or self.prefixes.get("/")
+                    break
+
+        return self.scopes.get(scope)
+
+    def resolve(self, path, method, role):
+        if self.scopes:
+            by_method = self.scope_for(path)
+            if by_method is not None:
+                roles = by_method.get(method) or by_method["*"]
+                policy = roles.get(role)
+                if policy is None:
+                    policy = roles.get(role.lower()) or roles.get("*")
+                if policy is not None:
+                    return policy
+
+        roles = self.roles
+        policy = roles.get(role)
+        if policy is None:
+            policy = roles.get(role.lower()) or self.default
+        return policy
+
+
+class PolicyLoader:
+    """
+    Holds the current PolicyTable. With ``RATELIMIT_POLICY_FILE`` set, the
+    JSON file is checked for changes at most every ``reload_interval``
+    seconds and recompiled when it changes, so every worker picks up new
+    policies without a restart. An invalid file keeps the previous table.
+    """
+
+    def __init__(self, config, path=None, reload_interval=5, window=60):
+        self.config = config
+        self.path = path
+        self.reload_interval = reload_interval
+        self.window = window
+        self.mtime = None
+        self.next_check = 0
+        self._lock = threading.Lock()
+        self.table = PolicyTable.from_config(config, window)
+        if path is not None:
+            self.reload()
+
+    def resolve(self, path, method, role):
+        if self.path is not None and time.monotonic() >= self.next_check:
+            self.reload()
+        return self.table.resolve(path, method, role)
+
+    def reload(self):
+        with self._lock:
+            self.next_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self.mtime:
+                return
+
+            try:
+                if mtime is None:
+                    config = self.config
+                else:
+                    with open(self.path) as policy_file:
+                        config = json.load(policy_file)
+                table = PolicyTable.from_config(config, self.window)
+            except Exception:
+                logger.exception(
+                    "Could not load rate limit policies from %s", self.path
+                )
+                return
+
+            self.table = table
+            self.mtime = mtime
+
+
+def get_policy_loader():
+    return PolicyLoader(
+        getattr(settings, "RATELIMIT_POLICIES", DEFAULT_POLICIES),
+        path=getattr(settings, "RATELIMIT_POLICY_FILE", None),
+        reload_interval=getattr(settings, "RATELIMIT_POLICY_RELOAD_INTERVAL", 5),
+        window=getattr(settings, "RATELIMIT_WINDOW", 60),
+    )
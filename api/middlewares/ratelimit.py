@@ -1,62 +1,113 @@
+import json
 import time
-from collections import defaultdict
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from .algorithms import Decision, get_algorithm
+from .clientip import get_client_bucket
+from .costs import get_cost_table
+from .penalties import get_penalty_box
+from .stores import get_counter_store
+from .utils import aload_user, set_ratelimit_headers
+
+LIMIT_EXCEEDED_BODY = json.dumps(
+    {"error": "You are temporarily blocked due to too many requests. Try again later."}
+).encode()
+
 
 class RateLimitMiddleware(MiddlewareMixin):
     def __init__(self, get_response=None):
         self.get_response = get_response
-        self.user_request_counts = defaultdict(
-            lambda: {"count": 0, "timestamp": time.time(), "blocked": False}
-        )
+        self.store = get_counter_store()
+        self.algorithm = get_algorithm()
+        self.window = getattr(settings, "RATELIMIT_WINDOW", 60)
+        self.penalties = get_penalty_box()
+        self.costs = get_cost_table()
         super().__init__(get_response)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if getattr(request, "ratelimit_exempt", False):
+            return self.get_response(request)
+
         user_id = self.get_user_id(request)
-        user_data = self.user_request_counts[user_id]
         current_time = time.time()
+        request_limit = self.get_request_limit()
 
-        if user_data["blocked"] and current_time - user_data["timestamp"] > 60:
-            user_data["blocked"] = False
-            user_data["count"] = 0
-            user_data["timestamp"] = current_time
-
-        if user_data["blocked"]:
-            return JsonResponse(
-                {
-                    "error": "You are temporarily blocked due to too many requests. Try again in a minute."
-                },
-                status=429,
+        decision = self.check_penalty(user_id, current_time)
+        if decision is None:
+            decision = self.store.hit(
+                user_id,
+                self.algorithm,
+                request_limit,
+                self.window,
+                current_time,
+                self.get_cost(request, request_limit),
             )
+            decision = self.apply_penalty(user_id, decision, current_time)
 
-        request_limit = self.get_request_limit()
+        if not decision.allowed:
+            response = self.limit_exceeded()
+        else:
+            response = self.get_response(request)
+        return set_ratelimit_headers(response, request_limit, decision)
 
-        if current_time - user_data["timestamp"] > 60:
-            user_data["count"] = 0
-            user_data["timestamp"] = current_time
+    async def __acall__(self, request):
+        if getattr(request, "ratelimit_exempt", False):
+            return await self.get_response(request)
 
-        user_data["count"] += 1
+        await aload_user(request)
+        user_id = self.get_user_id(request)
+        current_time = time.time()
+        request_limit = self.get_request_limit()
 
-        if user_data["count"] > request_limit:
-            user_data["blocked"] = True
-            return JsonResponse(
-                {"error": "Request limit exceeded. You are blocked for 1 minute."},
-                status=429,
+        decision = self.check_penalty(user_id, current_time)
+        if decision is None:
+            decision = await self.store.ahit(
+                user_id,
+                self.algorithm,
+                request_limit,
+                self.window,
+                current_time,
+                self.get_cost(request, request_limit),
             )
+            decision = self.apply_penalty(user_id, decision, current_time)
+
+        if not decision.allowed:
+            response = self.limit_exceeded()
+        else:
+            response = await self.get_response(request)
+        return set_ratelimit_headers(response, request_limit, decision)
+
+    def check_penalty(self, user_id, now):
+        """A rejection if the client is serving a block, else None."""
+        blocked_for = self.penalties.blocked_for(user_id, now)
+        if blocked_for:
+            return Decision(False, 0, blocked_for, blocked_for)
+        return None
 
-        return self.get_response(request)
+    def apply_penalty(self, user_id, decision, now):
+        """Going over the limit earns a block, longer for repeat offenders."""
+        if decision.allowed:
+            return decision
+        duration = self.penalties.punish(user_id, now)
+        return Decision(False, 0, max(decision.reset, duration), duration)
+
+    def get_cost(self, request, limit):
+        return min(self.costs.resolve(request.path_info, request.method), limit)
+
+    def limit_exceeded(self):
+        return HttpResponse(
+            LIMIT_EXCEEDED_BODY, status=429, content_type="application/json"
+        )
 
     def get_user_id(self, request):
         if request.user.is_authenticated:
             return request.user.id
-        return self.get_client_ip(request)
-
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            return x_forwarded_for.split(",")[0]
-        return request.META.get("REMOTE_ADDR")
+        return get_client_bucket(request)
 
     def get_request_limit(self):
         return 5
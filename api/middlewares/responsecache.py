@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import threading
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, set_response_etag
+
+from .metrics import registry
+from .utils import aload_user
+
+# Only these headers are stored; the rest (rate limit quotas, cookies...)
+# belong to the request that generated the response.
+CACHED_HEADERS = (
+    "Cache-Control",
+    "Content-Disposition",
+    "Content-Language",
+    "Content-Type",
+    "ETag",
+    "Last-Modified",
+)
+
+
+def cache_response(timeout=None):
+    """
+    Cache GET responses of a view, for ``timeout`` seconds or the
+    ``RESPONSE_CACHE_OPTIONS`` default. Only for views whose response
+    depends on nothing but the URL and who is logged in. Works on view
+    functions and on class-based views (decorate the class).
+    """
+
+    def decorator(view):
+        view.response_cache_timeout = timeout
+        return view
+
+    return decorator
+
+
+def view_timeout(func):
+    if hasattr(func, "response_cache_timeout"):
+        return func.response_cache_timeout
+    view_class = getattr(func, "view_class", None)
+    if hasattr(view_class, "response_cache_timeout"):
+        return view_class.response_cache_timeout
+    return False
+
+
+class SingleFlight:
+    """
+    Lets one caller at a time regenerate a key. Others for the same key
+    wait up to ``timeout`` seconds for it to finish, then look again.
+    """
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key, event_class):
+        """Lead the flight for ``key`` (None) or get the leader's event."""
+        with self._lock:
+            event = self._flights.get(key)
+            if event is None:
+                self._flights[key] = event_class()
+            return event
+
+    def land(self, key):
+        with self._lock:
+            self._flights.pop(key).set()
+
+    def wait(self, event):
+        event.wait(self.timeout)
+
+    async def await_(self, event):
+        try:
+            await asyncio.wait_for(event.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ResponseCacheMiddleware:
+    """
+    Serves GET and HEAD requests for opted-in views from a cache, ahead of
+    the rate limiter and logging, so a hit costs one cache lookup.
+
+    - Views opt in with ``@cache_response()`` or by URL name in
+      ``RESPONSE_CACHE_VIEWS``.
+    - Anonymous clients share one cached copy. Logged-in users each get
+      their own.
+    - Responses carry an ETag, and ``If-None-Match`` gets a 304.
+    - When an entry is missing, one request regenerates it while
+      concurrent requests for it wait, instead of all running the view.
+    - Responses that set cookies, used the CSRF token or read messages are
+      never stored, since they are specific to one client.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        options = getattr(settings, "RESPONSE_CACHE_OPTIONS", {})
+        self.cache_alias = options.get("cache_alias", "default")
+        self.key_prefix = options.get("key_prefix", "response")
+        self.timeout = options.get("timeout", 60)
+        self.views = getattr(settings, "RESPONSE_CACHE_VIEWS", {})
+        self.flights = SingleFlight(options.get("lock_timeout", 5))
+        self.timeout_for = lru_cache(maxsize=options.get("cache_size", 10_000))(
+            self._timeout_for
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        match = self.match(request)
+        if match is None:
+            return self.get_response(request)
+        match, timeout = match
+        key = self.cache_key(request, request.user)
+
+        cached = self.cache.get(key)
+        if cached is None:
+            event = self.flights.join(key, threading.Event)
+            if event is not None:
+                self.flights.wait(event)
+                cached = self.cache.get(key)
+            if cached is None:
+                try:
+                    response = self.get_response(request)
+                    return self.miss(request, match, key, timeout, response)
+                finally:
+                    if event is None:
+                        self.flights.land(key)
+        return self.hit(request, match, cached)
+
+    async def __acall__(self, request):
+        match = self.match(request)
+        if match is None:
+            return await self.get_response(request)
+        match, timeout = match
+        key = self.cache_key(request, await aload_user(request))
+
+        cached = await self.cache.aget(key)
+        if cached is None:
+            event = self.flights.join(key, asyncio.Event)
+            if event is not None:
+                await self.flights.await_(event)
+                cached = await self.cache.aget(key)
+            if cached is None:
+                try:
+                    response = await self.get_response(request)
+                    return await self.amiss(request, match, key, timeout, response)
+                finally:
+                    if event is None:
+                        self.flights.land(key)
+        return self.hit(request, match, cached)
+
+    def match(self, request):
+        """``(resolver match, timeout)`` if the request can be cached."""
+        if request.method not in ("GET", "HEAD"):
+            return None
+        return self.timeout_for(request.path_info)
+
+    def _timeout_for(self, path):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return None
+        timeout = self.views.get(match.view_name, view_timeout(match.func))
+        if timeout is False:
+            return None
+        return match, self.timeout if timeout is None else timeout
+
+    def cache_key(self, request, user):
+        variant = f"user-{user.pk}" if user.is_authenticated else "anonymous"
+        # CommonMiddleware has already checked the host against ALLOWED_HOSTS.
+        url = "{}{}?{}".format(
+            request.META.get("HTTP_HOST", ""),
+            request.path,
+            request.META.get("QUERY_STRING", ""),
+        )
+        digest = hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+        return f"{self.key_prefix}:{variant}:{digest}"
+
+    def hit(self, request, match, cached):
+        # The URL is never resolved for a hit; let TimingMiddleware see it.
+        request.resolver_match = match
+        registry.inc("response_cache_hits_total", view=match.view_name)
+        content, headers = cached
+        response = HttpResponse(content, headers=headers)
+        response["X-Cache"] = "HIT"
+        return self.conditional(request, response)
+
+    def miss(self, request, match, key, timeout, response):
+        entry = self.prepare(request, match, response)
+        if entry is not None:
+            self.cache.set(key, entry, timeout)
+        return self.conditional(request, response)
+
+    async def amiss(self, request, match, key, timeout, response):
+        entry = self.prepare(request, match, response)
+        if entry is not None:
+            await self.cache.aset(key, entry, timeout)
+        return self.conditional(request, response)
+
+    def prepare(self, request, match, response):
+        """The cache entry for ``response``, or None if it can't be shared."""
+        registry.inc("response_cache_misses_total", view=match.view_name)
+        response["X-Cache"] = "MISS"
+        if (
+            request.method != "GET"
+            or response.status_code != 200
+            or response.streaming
+            or response.cookies
+            or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            or getattr(get_messages(request), "used", False)
+        ):
+            return None
+        if not response.has_header("ETag"):
+            set_response_etag(response)
+        headers = {name: response[name] for name in CACHED_HEADERS if name in response}
+        return response.content, headers
+
+    def conditional(self, request, response):
+        if (
+            "HTTP_IF_NONE_MATCH" not in request.META
+            or response.status_code != 200
+            or not response.has_header("ETag")
+        ):
+            return response
+        return get_conditional_response(
+            request, etag=response["ETag"], response=response
+        )
@@ -1,37 +1,191 @@
+import json
+import math
 import time
-from collections import defaultdict
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from .algorithms import Decision, get_algorithm
+from .clientip import get_client_bucket
+from .costs import get_cost_table
+from .metrics import registry
+from .policies import get_policy_loader
+from .stores import get_counter_store
+from .utils import TTLCache, aload_user, is_user_loaded, set_ratelimit_headers
+
+ANONYMOUS = object()
+
+LIMIT_EXCEEDED_BODY = json.dumps(
+    {"error": "Request limit exceeded. Try again later."}
+).encode()
+
 
 class RateLimitMiddleware(MiddlewareMixin):
     def __init__(self, get_response=None):
         self.get_response = get_response
-        self.user_request_counts = defaultdict(
-            lambda: {"count": 0, "timestamp": time.time()}
-        )
+        self.store = get_counter_store()
+        self.algorithm = get_algorithm()
+        self.policies = get_policy_loader()
+        self.costs = get_cost_table()
+        self.fast_reject = getattr(settings, "RATELIMIT_FAST_REJECT", True)
+        self.exempt_paths = frozenset(getattr(settings, "RATELIMIT_EXEMPT_PATHS", ()))
+        options = getattr(settings, "RATELIMIT_IDENTITY_CACHE_OPTIONS", {})
+        self.identities = TTLCache(**options)
+        # When each IP over the unauthenticated limit may send again.
+        self.rejected = TTLCache(**options)
         super().__init__(get_response)
 
     def __call__(self, request):
-        user_role = self.get_user_role(request)
-        request_limit = self.get_request_limit(user_role)
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if self.is_exempt(request):
+            return self.get_response(request)
+
+        identity = self.fast_identify(request)
+        if identity is None:
+            rejection = self.reject_unknown_session(request)
+            if rejection is not None:
+                return rejection
+            identity = self.load_identity(request)
+        user_id, user_role = identity
+        policy = self.policies.resolve(request.path_info, request.method, user_role)
 
         current_time = time.time()
+        counter_key = self.counter_key(user_id, policy)
+
+        decision = self.store.hit(
+            counter_key,
+            self.algorithm,
+            policy.limit,
+            policy.window,
+            current_time,
+            self.get_cost(request, policy.limit),
+        )
+
+        if not decision.allowed:
+            self.remember_rejection(counter_key, user_role, current_time, decision)
+            response = self.limit_exceeded(user_role)
+        else:
+            response = self.get_response(request)
+        return set_ratelimit_headers(response, policy.limit, decision)
+
+    async def __acall__(self, request):
+        if self.is_exempt(request):
+            return await self.get_response(request)
+
+        identity = self.fast_identify(request)
+        if identity is None:
+            rejection = self.reject_unknown_session(request)
+            if rejection is not None:
+                return rejection
+            await aload_user(request)
+            identity = self.load_identity(request)
+        user_id, user_role = identity
+        policy = self.policies.resolve(request.path_info, request.method, user_role)
+
+        current_time = time.time()
+        counter_key = self.counter_key(user_id, policy)
+
+        decision = await self.store.ahit(
+            counter_key,
+            self.algorithm,
+            policy.limit,
+            policy.window,
+            current_time,
+            self.get_cost(request, policy.limit),
+        )
 
+        if not decision.allowed:
+            self.remember_rejection(counter_key, user_role, current_time, decision)
+            response = self.limit_exceeded(user_role)
+        else:
+            response = await self.get_response(request)
+        return set_ratelimit_headers(response, policy.limit, decision)
+
+    def is_exempt(self, request):
+        return request.path_info in self.exempt_paths or getattr(
+            request, "ratelimit_exempt", False
+        )
+
+    def get_cost(self, request, limit):
+        # A request never costs more than the whole budget, so an expensive
+        # view stays reachable for roles with a small limit.
+        return min(self.costs.resolve(request.path_info, request.method), limit)
+
+    def limit_exceeded(self, role):
+        registry.inc("ratelimit_rejections_total", role=role)
+        return HttpResponse(
+            LIMIT_EXCEEDED_BODY, status=429, content_type="application/json"
+        )
+
+    def fast_identify(self, request):
+        """
+        Identify the client from the session cookie alone, so over-limit
+        traffic can be rejected before the session or user is loaded. Returns
+        None when the user has to be loaded.
+        """
+        if not self.fast_reject or is_user_loaded(request):
+            return None
+
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session_key is None:
+            return get_client_bucket(request), "unauthenticated"
+
+        identity = self.identities.get(session_key)
+        if identity is ANONYMOUS:
+            return get_client_bucket(request), "unauthenticated"
+        return identity
+
+    def reject_unknown_session(self, request):
+        """
+        A 429 for a request whose session key isn't in the identity cache,
+        when its IP is over the unauthenticated limit. Made-up session keys
+        are then turned away without a session lookup. A real session from
+        that IP waits for the IP's window too, until its identity is cached.
+        """
+        if not self.fast_reject or is_user_loaded(request):
+            return None
+        policy = self.policies.resolve(
+            request.path_info, request.method, "unauthenticated"
+        )
+        key = self.counter_key(get_client_bucket(request), policy)
+        until = self.rejected.get(key)
+        if until is None:
+            return None
+        wait = until - time.time()
+        if wait <= 0:
+            return None
+        return set_ratelimit_headers(
+            self.limit_exceeded("unauthenticated"),
+            policy.limit,
+            Decision(False, 0, wait, wait),
+        )
+
+    def remember_rejection(self, counter_key, role, now, decision):
+        if self.fast_reject and role == "unauthenticated":
+            if math.isfinite(decision.retry_after):
+                self.rejected.set(counter_key, now + decision.retry_after)
+
+    def load_identity(self, request):
         user_id = self.get_user_id(request)
-        if current_time - self.user_request_counts[user_id]["timestamp"] > 60:
-            self.user_request_counts[user_id]["count"] = 0
-            self.user_request_counts[user_id]["timestamp"] = current_time
+        user_role = self.get_user_role(request)
 
-        self.user_request_counts[user_id]["count"] += 1
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if self.fast_reject and session_key is not None:
+            if request.user.is_authenticated:
+                self.identities.set(session_key, (user_id, user_role))
+            elif self.session_exists(request, session_key):
+                self.identities.set(session_key, ANONYMOUS)
 
-        if self.user_request_counts[user_id]["count"] > request_limit:
-            return JsonResponse(
-                {"error": "Request limit exceeded. Try again later."}, status=429
-            )
+        return user_id, user_role
 
-        response = self.get_response(request)
-        return response
+    def session_exists(self, request, session_key):
+        # Made-up session keys are not cached, so a client sending random
+        # ones can't push real sessions out. The store drops the key of a
+        # session it doesn't have once it has been loaded.
+        session = getattr(request, "session", None)
+        return session is not None and session.session_key == session_key
 
     def get_user_role(self, request):
         if request.user.is_authenticated:
@@ -41,21 +195,9 @@ class RateLimitMiddleware(MiddlewareMixin):
     def get_user_id(self, request):
         if request.user.is_authenticated:
             return request.user.id
-        return self.get_client_ip(request)
+        return get_client_bucket(request)
 
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(",")[0]
-        else:
-            ip = request.META.get("REMOTE_ADDR")
-        return ip
-
-    def get_request_limit(self, role):
-        limits = {
-            "gold": 10,
-            "silver": 5,
-            "bronze": 2,
-            "unauthenticated": 1,
-        }
-        return limits.get(role.lower(), 1)
+    def counter_key(self, user_id, policy):
+        if policy.scope:
+            return f"{user_id}|{policy.scope}"
+        return user_id
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+
+
+class RequestSampler:
+    """
+    Decides which requests get logged, from the path and client IP alone.
+
+    ``rate`` is the fraction of requests kept. ``path_rates`` overrides it
+    for exact paths, and for everything below keys that end in ``/`` (the
+    longest match wins). Responses with a status in ``always_log_statuses``,
+    or 500 and above, are logged regardless.
+
+    With ``per_ip_limit`` set, each IP gets at most that many sampled
+    records per ``interval`` seconds, so a few busy clients cannot crowd
+    everyone else out of the log. At most ``max_ips`` IPs are tracked per
+    interval; requests from IPs seen after that are not sampled until the
+    next interval, so at most ``max_ips * per_ip_limit`` records are kept
+    per interval however many IPs there are.
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        path_rates=None,
+        always_log_statuses=(429,),
+        per_ip_limit=0,
+        interval=60,
+        max_ips=10_000,
+    ):
+        self.rate = rate
+        self.path_rates = dict(path_rates or {})
+        self.always_log_statuses = frozenset(always_log_statuses)
+        self.per_ip_limit = per_ip_limit
+        self.interval = interval
+        self.max_ips = max_ips
+        self._ip_counts = {}
+        self._interval_ends = 0
+        self._lock = threading.Lock()
+
+    def rate_for(self, path):
+        path_rates = self.path_rates
+        if not path_rates:
+            return self.rate
+
+        prefix = path
+        while prefix:
+            rate = path_rates.get(prefix)
+            if rate is not None:
+                return rate
+            prefix = prefix[: prefix.rstrip("/").rfind("/") + 1]
+            if prefix == "/":
+                return path_rates.get("/", self.rate)
+        return self.rate
+
+    def sample(self, path, ip=None, now=None):
+        rate = self.rate_for(path)
+        if rate < 1 and (rate <= 0 or random.random() >= rate):
+            return False
+        if not self.per_ip_limit:
+            return True
+        return self._take_ip_quota(ip, now)
+
+    def always_log(self, status):
+        return status >= 500 or status in self.always_log_statuses
+
+    def _take_ip_quota(self, ip, now):
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            if now >= self._interval_ends:
+                self._ip_counts.clear()
+                self._interval_ends = now + self.interval
+
+            count = self._ip_counts.get(ip)
+            if count is None:
+                # Past max_ips, new IPs count as over quota, so a flood from
+                # many addresses can't fill the log either.
+                if len(self._ip_counts) >= self.max_ips:
+                    return False
+                count = 0
+            if count >= self.per_ip_limit:
+                return False
+            self._ip_counts[ip] = count + 1
+            return True
+
+
+def get_request_sampler():
+    return RequestSampler(**getattr(settings, "REQUEST_LOG_SAMPLING", {}))
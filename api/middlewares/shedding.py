@@ -0,0 +1,163 @@
+import json
+import math
+import threading
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from .metrics import registry
+from .utils import aload_user, hold_until_closed
+
+OVERLOADED_BODY = json.dumps({"error": "Server overloaded. Try again later."}).encode()
+
+# The share of the limit each role may use. Lower tiers run out first.
+DEFAULT_SHARES = {
+    "gold": 1.0,
+    "silver": 0.9,
+    "bronze": 0.7,
+    "unauthenticated": 0.5,
+    "*": 0.5,
+}
+
+
+class AdaptiveLimit:
+    """
+    Estimate of how many requests the server can have in progress before
+    latency suffers, adjusted from the latency of every request (AIMD, as in
+    TCP congestion control and Netflix's concurrency-limits).
+
+    A request that completes within ``latency_target`` seconds, while at
+    least half the limit is in use, raises the limit by ``1 / limit``:
+    about one per limit's worth of requests. A slower one multiplies it by
+    ``backoff``. Only requests that started after the last cut can cut it
+    again, so a batch of slow requests counts once.
+
+    Each role is admitted while the requests in progress are under its
+    share of the limit, so as the limit shrinks unauthenticated and bronze
+    traffic is turned away first, and gold last.
+    """
+
+    def __init__(
+        self,
+        initial_limit=100,
+        min_limit=8,
+        max_limit=1000,
+        latency_target=0.25,
+        backoff=0.9,
+        shares=None,
+    ):
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.shares = DEFAULT_SHARES if shares is None else shares
+        self.in_flight = 0
+        self.last_decrease = -math.inf
+        self._lock = threading.Lock()
+
+    def acquire(self, role):
+        share = self.shares.get(role)
+        if share is None:
+            share = self.shares.get("*", 1)
+        with self._lock:
+            if self.in_flight >= max(self.limit * share, 1):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, started, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            self.in_flight -= 1
+            if now - started > self.latency_target:
+                if started >= self.last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.last_decrease = now
+            elif self.in_flight * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+def get_adaptive_limit():
+    return AdaptiveLimit(**getattr(settings, "LOAD_SHEDDING_OPTIONS", {}))
+
+
+class LoadSheddingMiddleware:
+    """
+    Admits requests through an AdaptiveLimit shared by every client, so
+    when the database or a dependency slows down the server sheds load,
+    lowest tiers first, instead of queueing requests until they time out.
+    Shed requests get a 503 with ``Retry-After: 1``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.limit = get_adaptive_limit()
+        self.exempt_paths = frozenset(getattr(settings, "RATELIMIT_EXEMPT_PATHS", ()))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path_info in self.exempt_paths:
+            return self.get_response(request)
+
+        role = self.get_role(request)
+        if not self.limit.acquire(role):
+            return self.overloaded(role)
+
+        started = time.monotonic()
+        held = False
+        try:
+            response = self.get_response(request)
+            held = hold_until_closed(response, self.release_at_return(started))
+            return response
+        finally:
+            if not held:
+                self.limit.release(started)
+
+    async def __acall__(self, request):
+        if request.path_info in self.exempt_paths:
+            return await self.get_response(request)
+
+        await aload_user(request)
+        role = self.get_role(request)
+        if not self.limit.acquire(role):
+            return self.overloaded(role)
+
+        started = time.monotonic()
+        held = False
+        try:
+            response = await self.get_response(request)
+            held = hold_until_closed(response, self.release_at_return(started))
+            return response
+        finally:
+            if not held:
+                self.limit.release(started)
+
+    def release_at_return(self, started):
+        # The time a stream takes to send says nothing about server load.
+        return partial(self.limit.release, started, time.monotonic())
+
+    def get_role(self, request):
+        if request.user.is_authenticated:
+            return request.user.role
+        return "unauthenticated"
+
+    def overloaded(self, role):
+        registry.inc("load_shed_total", role=role)
+        response = HttpResponse(
+            OVERLOADED_BODY, status=503, content_type="application/json"
+        )
+        response["Retry-After"] = "1"
+        return response
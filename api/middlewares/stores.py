@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+DEFAULT_STORE = "api.middlewares.stores.ShardedLocMemCounterStore"
+
+
+class LocMemCounterStore:
+    """
+    In-process store of rate limit state with a hard cap on tracked keys.
+
+    Keys are kept in least-recently-used order. State that has expired, and
+    so is equivalent to a fresh one, is dropped from the cold end as new keys
+    arrive, and once ``max_entries`` is reached the least recently used key
+    is evicted.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def hit(self, key, algorithm, limit, window, now=None, cost=1):
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                self._evict(now)
+                state = self._states[key] = algorithm.new_state(limit)
+            else:
+                self._states.move_to_end(key)
+
+            return algorithm.consume(state, limit, window, now, cost)
+
+    async def ahit(self, key, algorithm, limit, window, now=None, cost=1):
+        # Holds the lock for a few dict operations only, so it is safe to run
+        # on the event loop.
+        return self.hit(key, algorithm, limit, window, now, cost)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def _evict(self, now):
+        states = self._states
+        while states:
+            oldest_key = next(iter(states))
+            if states[oldest_key].expires > now:
+                break
+            del states[oldest_key]
+
+        while states and len(states) >= self.max_entries:
+            states.popitem(last=False)
+
+
+class ShardedLocMemCounterStore:
+    """
+    LocMemCounterStore split into ``shards`` independent stores, each with
+    its own lock and an equal part of ``max_entries``, picked by the key's
+    hash. Every hit is still atomic for its key, but threads working on
+    different keys rarely wait on the same lock, so a threaded server does
+    not serialise all its requests on one. Recency and eviction are tracked
+    per shard.
+    """
+
+    def __init__(self, max_entries=100_000, shards=16):
+        per_shard = -(-max_entries // shards)
+        self.max_entries = max_entries
+        self._shards = tuple(LocMemCounterStore(per_shard) for _ in range(shards))
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, key, algorithm, limit, window, now=None, cost=1):
+        return self.shard(key).hit(key, algorithm, limit, window, now, cost)
+
+    async def ahit(self, key, algorithm, limit, window, now=None, cost=1):
+        return self.hit(key, algorithm, limit, window, now, cost)
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+
+class CacheCounterStore:
+    """
+    Counter store backed by a Django cache, shared by every worker and node
+    that points at the same cache.
+
+    Windows are aligned to the clock so each one maps to its own cache key.
+    A hit costs a single atomic ``incr``, plus a ``get`` of the previous
+    window for the sliding window counter; the key is created with ``add``
+    only when it does not exist yet. Limits are exact across processes as
+    long as the backend's ``incr`` is atomic (Redis, Memcached, and LocMem
+    within one process). Only counter based algorithms are supported.
+
+    ``ahit`` goes through the cache's async API. Django's bundled backends
+    still run that in a thread, so the hop only disappears with a backend
+    that implements the async methods natively.
+    """
+
+    def __init__(self, cache_alias="default", key_prefix="ratelimit"):
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def hit(self, key, algorithm, limit, window, now=None, cost=1):
+        now, timeout, current_key, previous_key = self._prepare(
+            key, algorithm, window, now
+        )
+        cache = self.cache
+
+        try:
+            current = cache.incr(current_key, cost)
+        except ValueError:
+            if cache.add(current_key, cost, timeout=timeout):
+                current = cost
+            else:
+                current = cache.incr(current_key, cost)
+
+        previous = cache.get(previous_key, 0) if previous_key else 0
+        return algorithm.decide(
+            previous, current, self._start(now, window), limit, window, now
+        )
+
+    async def ahit(self, key, algorithm, limit, window, now=None, cost=1):
+        now, timeout, current_key, previous_key = self._prepare(
+            key, algorithm, window, now
+        )
+        cache = self.cache
+
+        try:
+            current = await cache.aincr(current_key, cost)
+        except ValueError:
+            if await cache.aadd(current_key, cost, timeout=timeout):
+                current = cost
+            else:
+                current = await cache.aincr(current_key, cost)
+
+        previous = await cache.aget(previous_key, 0) if previous_key else 0
+        return algorithm.decide(
+            previous, current, self._start(now, window), limit, window, now
+        )
+
+    def _prepare(self, key, algorithm, window, now):
+        if not algorithm.counter_based:
+            raise ImproperlyConfigured(
+                f"{type(algorithm).__name__} cannot be used with {type(self).__name__}."
+            )
+        if now is None:
+            now = time.time()
+
+        index = int(now // window)
+        current_key = f"{self.key_prefix}:{key}:{index}"
+        if algorithm.uses_previous_window:
+            return now, window * 2, current_key, f"{self.key_prefix}:{key}:{index - 1}"
+        return now, window, current_key, None
+
+    def _start(self, now, window):
+        return int(now // window) * window
+
+
+def get_counter_store():
+    store_class = import_string(getattr(settings, "RATELIMIT_STORE", DEFAULT_STORE))
+    return store_class(**getattr(settings, "RATELIMIT_STORE_OPTIONS", {}))
@@ -0,0 +1,18 @@
+class SyncChainMiddleware:
+    """
+    Sync-only no-op, listed last in MIDDLEWARE. Django runs a middleware
+    that supports both modes in the mode of the handler below it, so under
+    ASGI this makes the whole chain run synchronously in one thread: one
+    hop in and one out, instead of a ``sync_to_async`` hop for every
+    ``process_request``/``process_response`` of Django's ``MiddlewareMixin``
+    built-ins. Remove it once every middleware in the chain is async-native.
+    """
+
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
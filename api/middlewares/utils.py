@@ -0,0 +1,97 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils.functional import LazyObject, empty
+
+
+async def aload_user(request):
+    """
+    Resolve ``request.user`` through ``request.auser()`` so the session and
+    user lookups don't run synchronously on the event loop, and keep the
+    result on the request for the rest of the stack.
+    """
+    if hasattr(request, "auser") and not is_user_loaded(request):
+        request.user = await request.auser()
+    return request.user
+
+
+def is_user_loaded(request):
+    """True if ``request.user`` can be read without a session or DB lookup."""
+    user = getattr(request, "user", None)
+    if user is None:
+        return False
+    return not isinstance(user, LazyObject) or user._wrapped is not empty
+
+
+def set_ratelimit_headers(response, limit, decision):
+    """
+    Tell the client its quota through the RateLimit header fields (IETF
+    draft), and when to come back after a rejection, from the Decision the
+    counter store already returned.
+    """
+    response["RateLimit-Limit"] = str(limit)
+    response["RateLimit-Remaining"] = str(decision.remaining)
+    response["RateLimit-Reset"] = str(max(math.ceil(decision.reset), 0))
+    if not decision.allowed and math.isfinite(decision.retry_after):
+        response["Retry-After"] = str(max(math.ceil(decision.retry_after), 1))
+    return response
+
+
+def hold_until_closed(response, release):
+    """
+    Have a streaming response call ``release`` when the server closes it,
+    which it does once the body is sent or the client went away. Returns
+    False, leaving ``release`` to the caller, for other responses.
+    """
+    if not response.streaming:
+        return False
+    response._resource_closers.append(release)
+    return True
+
+
+class TTLCache:
+    """Small thread-safe LRU mapping whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries=10_000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:07
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.db.models.functions import Lower
+
+ROLES = ["bronze", "default", "gold", "silver"]
+BATCH_SIZE = 10000
+
+
+def normalize_roles(apps, schema_editor):
+    # The old default was "Default", outside the lowercase choices. Updated
+    # by pk range, each batch in its own transaction (the migration is not
+    # atomic), so no row stays locked for longer than one batch.
+    CustomUser = apps.get_model("api", "CustomUser")
+    users = CustomUser.objects.using(schema_editor.connection.alias)
+    bounds = users.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return
+    for start in range(bounds["first"], bounds["last"] + 1, BATCH_SIZE):
+        batch = users.filter(pk__gte=start, pk__lt=start + BATCH_SIZE)
+        batch.exclude(role__in=ROLES).update(role=Lower("role"))
+        batch.exclude(role__in=ROLES).update(role="default")
+
+
+class Migration(migrations.Migration):
+    """
+    Lock taken on PostgreSQL: AddConstraint holds an ACCESS EXCLUSIVE lock on
+    api_customuser while it checks every row, a single sequential scan that
+    blocks reads and writes of users for its duration. The (role, email)
+    index is built without blocking writes in 0004.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0002_alter_customuser_role"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_roles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="customuser",
+            name="role",
+            field=models.CharField(
+                choices=[
+                    ("gold", "Gold"),
+                    ("silver", "Silver"),
+                    ("bronze", "Bronze"),
+                    ("default", "Default"),
+                ],
+                default="default",
+                max_length=10,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="customuser",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("role__in", ["bronze", "default", "gold", "silver"])
+                ),
+                name="api_user_role_valid",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    ``CREATE INDEX CONCURRENTLY`` on PostgreSQL, which builds the index
+    without blocking writes to the table, and a plain ``AddIndex`` elsewhere.
+    ``django.contrib.postgres.operations.AddIndexConcurrently`` would fail on
+    SQLite, which runs the tests and local development.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("api", "0003_normalize_role"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="customuser",
+            index=models.Index(
+                fields=["role", "email"], name="api_user_role_email_idx"
+            ),
+        ),
+    ]
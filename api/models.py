@@ -1,9 +1,23 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
-from django.db import models
+from django.db import models, transaction
+
+ROLE_CHOICES = [
+    ("gold", "Gold"),
+    ("silver", "Silver"),
+    ("bronze", "Bronze"),
+    ("default", "Default"),
+]
+ROLES = frozenset(value for value, _ in ROLE_CHOICES)
 
 
 class CustomUserManager(BaseUserManager):
@@ -16,6 +30,80 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def insert_user(self, user):
+        """
+        Save a new user with a single INSERT; a taken email raises
+        IntegrityError. Inside a transaction it runs in a savepoint, so the
+        error leaves the caller's transaction usable.
+        """
+        if transaction.get_connection(self.db).in_atomic_block:
+            with transaction.atomic(using=self.db):
+                user.save(force_insert=True, using=self.db)
+        else:
+            user.save(force_insert=True, using=self.db)
+        return user
+
+    def bulk_create_users(
+        self, users, batch_size=1000, workers=None, ignore_conflicts=False
+    ):
+        """
+        Create users from an iterable of field dicts (``email``, ``password``
+        and any other fields), ``batch_size`` rows at a time, so any number
+        of rows can be streamed in. Passwords are hashed by ``workers``
+        processes (``0`` hashes in this process) while the previous batch is
+        inserted. Returns the number of rows sent to the database.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        executor = None
+        if workers:
+            executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        def hash_passwords(passwords):
+            if executor is None:
+                return map(make_password, passwords)
+            chunksize = max(len(passwords) // (workers * 4), 1)
+            return executor.map(make_password, passwords, chunksize=chunksize)
+
+        def insert(batch, hashes):
+            self.bulk_create(
+                [
+                    self.model(password=hashed, **fields)
+                    for fields, hashed in zip(batch, hashes)
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=ignore_conflicts,
+            )
+
+        users = iter(users)
+        total = 0
+        pending = None
+        try:
+            while batch := [dict(fields) for fields in islice(users, batch_size)]:
+                for row, fields in enumerate(batch, total + 1):
+                    if not fields.get("email"):
+                        raise ValueError(f"User {row} has no email.")
+                    fields["email"] = self.normalize_email(fields["email"])
+                    if "role" in fields:
+                        fields["role"] = fields["role"].lower()
+                        if fields["role"] not in self.model.ROLES:
+                            raise ValueError(f"User {row} has an unknown role.")
+                hashes = hash_passwords(
+                    [fields.pop("password", None) for fields in batch]
+                )
+                if pending:
+                    insert(*pending)
+                pending = batch, hashes
+                total += len(batch)
+            if pending:
+                insert(*pending)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return total
+
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
@@ -34,18 +122,27 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
 
-    ROLE_CHOICES = [
-        ("gold", "Gold"),
-        ("silver", "Silver"),
-        ("bronze", "Bronze"),
-        ("default", "Default"),
-    ]
-    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="Default")
+    ROLE_CHOICES = ROLE_CHOICES
+    ROLES = ROLES
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="default")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            # Serves filtering by role, in email order (the admin list), and
+            # counting users per role from the index alone.
+            models.Index(fields=["role", "email"], name="api_user_role_email_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(role__in=sorted(ROLES)),
+                name="api_user_role_valid",
+            ),
+        ]
+
     def __str__(self):
         return self.email
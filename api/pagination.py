@@ -0,0 +1,132 @@
+import json
+
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+AFTER_VAR = "after"
+
+
+def estimate_count(queryset):
+    """
+    The planner's row estimate for ``queryset`` on PostgreSQL, from
+    ``pg_class`` for a whole table or ``EXPLAIN`` otherwise. None on other
+    databases or when the table has never been analysed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            estimate = cursor.fetchone()[0]
+        else:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+    return int(estimate) if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the row count from the query planner instead of
+    ``COUNT(*)``, which has to visit every matching row. Estimates under
+    ``exact_below`` rows are replaced by an exact count, which is cheap
+    there.
+    """
+
+    exact_below = 10_000
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.exact_below:
+            self.estimated = True
+            return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list that pages through ``model_admin.keyset_field`` order with
+    ``WHERE key > last key LIMIT n`` (``?after=``) instead of ``OFFSET``,
+    so page 1,000 costs the same as page 1. Other orderings fall back to
+    numbered pages. Only the listed columns are loaded.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.after = request.GET.get(AFTER_VAR)
+        super().__init__(request, *args, **kwargs)
+        # Filter, search and sort links start again from the first page.
+        self.params.pop(AFTER_VAR, None)
+        self.filter_params.pop(AFTER_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        fields = {field.name for field in self.opts.concrete_fields}
+        columns = [name for name in self.list_display if name in fields]
+        return queryset.only(*columns)
+
+    def get_results(self, request):
+        key = self.model_admin.keyset_field
+        # The key is unique, so anything ordered after it doesn't matter.
+        ordering = self.queryset.query.order_by
+        if self.show_all or not ordering or ordering[0] not in (key, f"-{key}"):
+            self.keyset = False
+            return super().get_results(request)
+
+        self.keyset = True
+        queryset = self.queryset
+        if self.after is not None:
+            lookup = "lt" if ordering[0].startswith("-") else "gt"
+            queryset = queryset.filter(**{f"{key}__{lookup}": self.after})
+        rows = list(queryset[: self.list_per_page + 1])
+        next_after = None
+        if len(rows) > self.list_per_page:
+            rows = rows[: self.list_per_page]
+            next_after = getattr(rows[-1], key)
+
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        self.result_count = self.paginator.count
+        self.result_list = rows
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = self.result_count <= self.list_max_show_all
+        self.multi_page = self.after is not None or next_after is not None
+        self.first_page_url = (
+            self.get_query_string(remove=[PAGE_VAR]) if self.after is not None else None
+        )
+        self.next_page_url = next_after and self.get_query_string(
+            {AFTER_VAR: next_after}, [PAGE_VAR]
+        )
+
+
+class LargeTableAdminMixin:
+    """
+    ModelAdmin settings for tables too big to count or OFFSET through:
+    estimated counts, keyset pages ordered by ``keyset_field`` (which must
+    be unique), and only the listed columns loaded.
+    """
+
+    keyset_field = "pk"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
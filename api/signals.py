@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_user_snapshot
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def drop_user_snapshot(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
@@ -1,8 +1,91 @@
+import asyncio
+import io
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from fractions import Fraction
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from hypothesis import given, settings as hypothesis_settings, strategies as st
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.urls import reverse
-from django.test import TestCase, RequestFactory
+from django.utils.functional import SimpleLazyObject
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.asgi import ASGIHandler
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
 from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from api.admin import CustomUserAdmin
+from api.backends import CachedModelBackend, aauthenticate
+from api.hashing import HashingPool
+from api.pagination import EstimatedCountPaginator
+from api.throttles import get_login_throttle
+from api.middlewares.formats import JSONLinesFormatter, read_records
+from custom.database import database_config
+from api.middlewares.handlers import BatchingFileHandler, QueueingFileHandler
+from api.middlewares.concurrency import (
+    ConcurrencyLimiter,
+    ConcurrencyLimitMiddleware,
+)
+from api.middlewares.costs import CostTable, ratelimit_cost
+from api.middlewares.clientip import (
+    ClientIPResolver,
+    IPNetworkSet,
+    get_client_bucket,
+    get_client_ip,
+)
+from api.middlewares.ipfilter import IPFilterMiddleware
 from api.middlewares.logging import LoggingMiddleware
+from api.middlewares.metrics import (
+    Histogram,
+    TimingMiddleware,
+    bucket_index,
+    bucket_upper_bound,
+    registry,
+)
+from api.middlewares.penalties import PenaltyBox
+from api.middlewares.policies import PolicyLoader, PolicyTable
+from api.middlewares.responsecache import ResponseCacheMiddleware
+from api.middlewares.sampling import RequestSampler
+from api.middlewares.shedding import AdaptiveLimit, LoadSheddingMiddleware
 from api.middlewares.role_based_ratelimit import RateLimitMiddleware
+from api.middlewares.ratelimit import RateLimitMiddleware as BlockingRateLimitMiddleware
+from api.middlewares.algorithms import (
+    GCRA,
+    FixedWindow,
+    SlidingLog,
+    SlidingWindowCounter,
+    TokenBucket,
+)
+from api.middlewares.stores import (
+    CacheCounterStore,
+    LocMemCounterStore,
+    ShardedLocMemCounterStore,
+)
 from django.contrib.auth.models import AnonymousUser
 
 User = get_user_model()
@@ -58,6 +141,325 @@ class UserAuthTests(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class LoginHashingTest(TestCase):
+    def login(self, email, password, ip="10.9.0.1"):
+        # A fresh IP per attempt stays clear of the per-client rate limit.
+        return self.client.post(
+            reverse("login"), {"email": email, "password": password}, REMOTE_ADDR=ip
+        )
+
+    def test_login_throttle_rejects_before_hashing(self):
+        User.objects.create_user(email="victim@django.com", password="password")
+        for attempt in range(5):
+            response = self.login("victim@django.com", "guess", f"10.9.1.{attempt}")
+            self.assertEqual(response.status_code, 400)
+
+        with mock.patch.object(HashingPool, "run") as run:
+            response = self.login("VICTIM@django.com", "password", "10.9.1.9")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        run.assert_not_called()
+
+    def test_login_throttle_key_is_a_fixed_length_digest(self):
+        throttle = get_login_throttle()
+        long_email = "a b" * 200 + "@django.com"
+        key = throttle.key(long_email)
+        self.assertEqual(key, throttle.key(f"  {long_email.upper()} "))
+        self.assertEqual(len(key), len(throttle.key("x@django.com")))
+        self.assertNotIn(" ", key)
+
+        for attempt in range(5):
+            response = self.login(long_email, "guess", f"10.9.3.{attempt}")
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.login(long_email, "guess", "10.9.3.9").status_code, 429)
+
+    def test_legacy_hash_is_upgraded_in_the_pool(self):
+        user = User.objects.create_user(email="legacy@django.com")
+        user.password = PBKDF2PasswordHasher().encode("password", "salt", iterations=1)
+        user.save()
+        self.assertEqual(self.login("legacy@django.com", "password").status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+        self.assertTrue(user.check_password("password"))
+
+    @override_settings(PASSWORD_HASHING_OPTIONS={"workers": 0, "max_pending": 0})
+    def test_full_pool_answers_503(self):
+        User.objects.create_user(email="busy@django.com", password="password")
+        response = self.login("busy@django.com", "password")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        response = self.client.post(
+            reverse("register"),
+            {"email": "new@django.com", "password": "password"},
+            REMOTE_ADDR="10.9.2.1",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(email="new@django.com").exists())
+
+
+class DenyingBackend:
+    def authenticate(self, request, email=None, password=None):
+        raise PermissionDenied
+
+
+class AsyncAuthenticateTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="auth@django.com", password="pw")
+        self.failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            self.failures.append(credentials)
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+    async def test_valid_credentials(self):
+        user = await aauthenticate(None, email="auth@django.com", password="pw")
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.backend, "api.backends.CachedModelBackend")
+        self.assertEqual(self.failures, [])
+
+    def test_failure_sends_user_login_failed(self):
+        response = self.client.post(
+            reverse("login"), {"email": "auth@django.com", "password": "wrong"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.failures,
+            [{"email": "auth@django.com", "password": "********************"}],
+        )
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            "api.tests.DenyingBackend",
+            "api.backends.CachedModelBackend",
+        ]
+    )
+    async def test_permission_denied_stops_the_search(self):
+        user = await aauthenticate(None, email="auth@django.com", password="pw")
+        self.assertIsNone(user)
+        self.assertEqual(len(self.failures), 1)
+
+        # DenyingBackend doesn't take a username, so it is skipped.
+        user = await aauthenticate(None, username="auth@django.com", password="pw")
+        self.assertEqual(user, self.user)
+
+
+class BulkUserTest(TestCase):
+    def test_registration_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("register"),
+                {"email": "one@django.com", "password": "password"},
+                REMOTE_ADDR="10.8.0.1",
+            )
+        # The savepoint only exists because TestCase wraps tests in a
+        # transaction; in autocommit the INSERT runs alone.
+        statements = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("INSERT"))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse("login"))
+
+        response = self.client.post(
+            reverse("register"),
+            {"email": "one@django.com", "password": "password"},
+            REMOTE_ADDR="10.8.0.2",
+        )
+        self.assertEqual(response.url, reverse("register"))
+        self.assertEqual(User.objects.filter(email="one@django.com").count(), 1)
+
+    def test_bulk_create_users(self):
+        users = (
+            {"email": f"bulk{i}@DJANGO.com", "password": f"pw{i}", "role": "silver"}
+            for i in range(25)
+        )
+        with mock.patch("api.models.make_password", side_effect=lambda p: f"!{p}"):
+            count = User.objects.bulk_create_users(users, batch_size=10, workers=0)
+        self.assertEqual(count, 25)
+        user = User.objects.get(email="bulk24@django.com")
+        self.assertEqual((user.password, user.role), ("!pw24", "silver"))
+
+        with self.assertRaises(ValueError):
+            User.objects.bulk_create_users([{"password": "x"}], workers=0)
+
+    def test_import_users_command(self):
+        User.objects.create_user(email="taken@django.com", role="gold")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("email,password,role\n")
+            f.write("a@django.com,secret,bronze\n")
+            f.write("taken@django.com,secret,bronze\n")
+            f.write("b@django.com,,\n")
+        self.addCleanup(os.remove, f.name)
+
+        out = io.StringIO()
+        call_command(
+            "import_users", f.name, "--workers=1", "--ignore-conflicts", stdout=out
+        )
+        self.assertIn("Imported 2 users", out.getvalue())
+        self.assertIn("Skipped 1 existing emails.", out.getvalue())
+        self.assertTrue(User.objects.get(email="a@django.com").check_password("secret"))
+        self.assertEqual(User.objects.get(email="taken@django.com").role, "gold")
+        self.assertFalse(User.objects.get(email="b@django.com").has_usable_password())
+
+
+class UserRoleTest(TestCase):
+    def test_role_is_constrained(self):
+        self.assertEqual(
+            User.objects.create_user(email="new@django.com").role, "default"
+        )
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(email="bad@django.com", role="Default")
+
+    def test_register_rejects_unknown_role(self):
+        response = self.client.post(
+            reverse("register"),
+            {"email": "role@django.com", "password": "password", "role": "platinum"},
+        )
+        self.assertEqual(response.url, reverse("register"))
+        self.assertFalse(User.objects.filter(email="role@django.com").exists())
+
+    def test_admin_filters_by_role(self):
+        admin = User.objects.create_superuser(email="admin@django.com", password="pw")
+        User.objects.create_user(email="silver@django.com", role="silver")
+        User.objects.create_user(email="bronze@django.com", role="bronze")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("admin:api_customuser_changelist"), {"role__exact": "silver"}
+        )
+        self.assertContains(response, "silver@django.com")
+        self.assertNotContains(response, "bronze@django.com")
+
+
+@mock.patch.object(CustomUserAdmin, "list_per_page", 2)
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser(email="admin@django.com", password="pw")
+        for name in ("carol", "alice", "dave", "bob"):
+            User.objects.create_user(email=f"{name}@django.com", role="silver")
+        self.client.force_login(admin)
+        self.url = reverse("admin:api_customuser_changelist")
+
+    def emails(self, response):
+        return [user.email for user in response.context["cl"].result_list]
+
+    def test_keyset_pages(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            self.emails(response), ["admin@django.com", "alice@django.com"]
+        )
+        cl = response.context["cl"]
+        self.assertIsNone(cl.first_page_url)
+        self.assertEqual(cl.next_page_url, "?after=alice%40django.com")
+        self.assertContains(response, "5 custom users")
+
+        response = self.client.get(self.url + cl.next_page_url)
+        self.assertEqual(self.emails(response), ["bob@django.com", "carol@django.com"])
+        response = self.client.get(self.url + response.context["cl"].next_page_url)
+        self.assertEqual(self.emails(response), ["dave@django.com"])
+        self.assertIsNone(response.context["cl"].next_page_url)
+
+    def test_keyset_with_filter_and_descending_order(self):
+        response = self.client.get(
+            self.url, {"role__exact": "silver", "o": "-1", "after": "carol@django.com"}
+        )
+        self.assertEqual(self.emails(response), ["bob@django.com", "alice@django.com"])
+        self.assertNotIn("after", response.context["cl"].get_query_string())
+
+    def test_other_orderings_use_numbered_pages(self):
+        response = self.client.get(self.url, {"o": "5", "p": "2"})
+        self.assertFalse(response.context["cl"].keyset)
+        self.assertEqual(len(self.emails(response)), 2)
+
+    def test_prefix_search_and_trimmed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"q": "BO"})
+        self.assertEqual(self.emails(response), ["bob@django.com"])
+        listing = next(q["sql"] for q in queries if "LIMIT 3" in q["sql"])
+        self.assertIn("LIKE", listing)
+        self.assertNotIn('"password"', listing)
+
+    def test_estimated_count(self):
+        paginator = EstimatedCountPaginator(User.objects.order_by("email"), 2)
+        with mock.patch("api.pagination.estimate_count", return_value=2_000_000):
+            self.assertEqual(paginator.count, 2_000_000)
+        self.assertTrue(paginator.estimated)
+
+        paginator = EstimatedCountPaginator(User.objects.order_by("email"), 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.estimated)
+
+
+class UserSnapshotTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="snapshot@django.com", password="password", role="gold"
+        )
+        self.client.force_login(self.user)
+        self.client.get(reverse("protected"))
+
+    def test_protected_view_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("protected"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Your role is gold", response.json()["message"])
+
+    def test_cached_user_is_a_real_user(self):
+        user = CachedModelBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertIsInstance(user, User)
+            self.assertEqual(user, self.user)
+            self.assertFalse(user._state.adding)
+            self.assertFalse(user.is_staff)
+            self.assertEqual(user.first_name, "")
+            self.assertEqual(
+                user.get_session_auth_hash(), self.user.get_session_auth_hash()
+            )
+
+        user.first_name = "Ada"
+        user.save(update_fields=["first_name"])
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(User.objects.get().first_name, "Ada")
+
+    def test_saving_the_user_refreshes_the_snapshot(self):
+        self.user.role = "silver"
+        self.user.save()
+        response = self.client.get(reverse("protected"))
+        self.assertIn("Your role is silver", response.json()["message"])
+
+    def test_password_change_ends_the_session(self):
+        self.user.set_password("new password")
+        self.user.save()
+        response = self.client.get(reverse("protected"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_deleted_user_is_logged_out(self):
+        self.user.delete()
+        response = self.client.get(reverse("protected"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_changes_are_visible(self):
+        admin = User.objects.create_superuser(
+            email="admin@django.com", password="password"
+        )
+        admin_client = self.client_class()
+        admin_client.force_login(admin)
+        response = admin_client.post(
+            reverse("admin:api_customuser_change", args=[self.user.pk]),
+            {"email": self.user.email, "role": "bronze", "is_active": "on"},
+        )
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(reverse("protected"))
+        self.assertIn("Your role is bronze", response.json()["message"])
+
+        admin_client.post(
+            reverse("admin:api_customuser_change", args=[self.user.pk]),
+            {"email": self.user.email, "role": "bronze"},
+        )
+        self.assertEqual(self.client.get(reverse("protected")).status_code, 302)
+
+
 class LoggingMiddlewareTest(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -83,11 +485,26 @@ class LoggingMiddlewareTest(TestCase):
         self.assertIsNotNone(response)
         self.assertEqual(response.status_code, 200)
 
+    def test_rejections_by_the_whole_stack_are_logged(self):
+        with self.assertLogs("request_logger") as logs:
+            statuses = [
+                self.client.get(
+                    reverse("protected"), REMOTE_ADDR="10.4.0.1"
+                ).status_code
+                for _ in range(3)
+            ]
+        self.assertEqual(statuses, [302, 429, 429])
+        self.assertEqual([record.args["status"] for record in logs.records], statuses)
+        self.assertEqual(
+            [record.levelname for record in logs.records],
+            ["INFO", "WARNING", "WARNING"],
+        )
+
 
 class RateLimitMiddlewareTest(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
-        self.middleware = RateLimitMiddleware(get_response=lambda r: None)
+        self.middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
 
     def test_rate_limit_unauthenticated(self):
         request = self.factory.get("/")
@@ -115,3 +532,1532 @@ class RateLimitMiddlewareTest(TestCase):
         for _ in range(6):
             response = self.middleware(request)
         self.assertEqual(response.status_code, 429)
+
+
+class LocMemCounterStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.algorithm = FixedWindow()
+
+    def hit(self, store, key, now):
+        return store.hit(key, self.algorithm, 10, 60, now=now)
+
+    def test_counts_within_window(self):
+        store = LocMemCounterStore(max_entries=10)
+        self.hit(store, "a", 0)
+        self.assertEqual(self.hit(store, "a", 30).remaining, 8)
+        self.assertEqual(self.hit(store, "a", 61).remaining, 9)
+
+    def test_entry_cap_evicts_least_recently_used(self):
+        store = LocMemCounterStore(max_entries=3)
+        for key in ("a", "b", "c"):
+            self.hit(store, key, 0)
+        self.hit(store, "a", 1)
+        self.hit(store, "d", 2)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(self.hit(store, "a", 3).remaining, 7)
+        self.assertEqual(self.hit(store, "b", 3).remaining, 9)
+
+    def test_expired_windows_are_dropped(self):
+        store = LocMemCounterStore(max_entries=100)
+        for i in range(50):
+            self.hit(store, f"10.0.0.{i}", 0)
+        self.hit(store, "10.0.1.1", 120)
+        self.assertEqual(len(store), 1)
+
+
+class ShardedLocMemCounterStoreTest(SimpleTestCase):
+    threads = 16
+    hits = 500
+
+    def hammer(self, store, algorithm, keys, limit):
+        """Hit ``keys`` from many threads at once, counting allowed hits per key."""
+        allowed = defaultdict(int)
+        lock = threading.Lock()
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            start.wait()
+            counts = defaultdict(int)
+            for i in range(self.hits):
+                key = keys[i % len(keys)]
+                counts[key] += store.hit(key, algorithm, limit, 3600, now=0).allowed
+            with lock:
+                for key, count in counts.items():
+                    allowed[key] += count
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        return allowed
+
+    def test_one_key_counts_exactly_under_threads(self):
+        total = self.threads * self.hits
+        for algorithm in (FixedWindow(), SlidingWindowCounter(), TokenBucket(), GCRA()):
+            store = ShardedLocMemCounterStore()
+            allowed = self.hammer(store, algorithm, ["hot"], total // 2)
+            self.assertEqual(allowed["hot"], total // 2, type(algorithm).__name__)
+            decision = store.hit("hot", algorithm, total // 2, 3600, now=0)
+            self.assertFalse(decision.allowed)
+
+    def test_spread_keys_count_exactly_under_threads(self):
+        keys = [f"10.0.0.{i}" for i in range(50)]
+        store = ShardedLocMemCounterStore(shards=8)
+        limit = self.threads * self.hits // len(keys)
+        allowed = self.hammer(store, FixedWindow(), keys, limit * 2)
+        self.assertEqual(dict(allowed), dict.fromkeys(keys, limit))
+        self.assertEqual(len(store), len(keys))
+        for key in keys:
+            decision = store.hit(key, FixedWindow(), limit * 2, 3600, now=0)
+            self.assertEqual(decision.remaining, limit - 1)
+
+    def test_entry_cap_is_split_between_shards(self):
+        store = ShardedLocMemCounterStore(max_entries=40, shards=4)
+        for i in range(1000):
+            store.hit(f"key-{i}", FixedWindow(), 10, 60, now=0)
+        self.assertLessEqual(len(store), 40)
+        store.clear()
+        self.assertEqual(len(store), 0)
+
+
+class SharedDictCache(BaseCache):
+    """Cache whose entries live in a multiprocessing manager, like a local Redis."""
+
+    shared = None
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data, lock = self.shared
+        with lock:
+            if key in data:
+                return False
+            data[key] = value
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.shared[0].get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.shared[0][key] = value
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data, lock = self.shared
+        with lock:
+            if key not in data:
+                raise ValueError("Key '%s' not found" % key)
+            data[key] += delta
+            return data[key]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.shared[0].pop(key, None) is not None
+
+    def clear(self):
+        self.shared[0].clear()
+
+
+def send_gold_requests(count, start, results):
+    middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse("OK"))
+    middleware.store = CacheCounterStore(cache_alias="shared")
+    request = RequestFactory().get("/")
+    request.user = SimpleNamespace(is_authenticated=True, id=1, role="gold")
+
+    start.wait()
+    with mock.patch("api.middlewares.role_based_ratelimit.time.time", return_value=30):
+        results.put([middleware(request).status_code for _ in range(count)])
+
+
+SHARED_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {"BACKEND": "api.tests.SharedDictCache"},
+}
+
+
+@override_settings(
+    CACHES=SHARED_CACHES,
+    RATELIMIT_STORE="api.middlewares.stores.CacheCounterStore",
+    RATELIMIT_STORE_OPTIONS={"cache_alias": "default"},
+)
+class CacheCounterStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        caches["default"].clear()
+
+    def test_counts_per_clock_aligned_window(self):
+        store = CacheCounterStore()
+        store.hit("a", FixedWindow(), 10, 60, now=60)
+        decision = store.hit("a", FixedWindow(), 10, 60, now=119)
+        self.assertEqual((decision.remaining, decision.reset), (8, 1))
+        self.assertEqual(store.hit("a", FixedWindow(), 10, 60, now=120).remaining, 9)
+
+    def test_rejects_state_based_algorithms(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheCounterStore().hit("a", TokenBucket(), 10, 60)
+
+    def test_middlewares_share_counters_through_cache(self):
+        request = self.factory.get("/")
+        request.user = AnonymousUser()
+        first = RateLimitMiddleware(get_response=lambda r: HttpResponse("OK"))
+        second = RateLimitMiddleware(get_response=lambda r: HttpResponse("OK"))
+        self.assertEqual(first(request).status_code, 200)
+        self.assertEqual(second(request).status_code, 429)
+
+    def test_blocking_middleware_rejects_after_limit(self):
+        request = self.factory.get("/")
+        request.user = AnonymousUser()
+        middleware = BlockingRateLimitMiddleware(
+            get_response=lambda r: HttpResponse("OK")
+        )
+        responses = [middleware(request) for _ in range(7)]
+        self.assertEqual([r.status_code for r in responses[:5]], [200] * 5)
+        self.assertEqual([r.status_code for r in responses[5:]], [429] * 2)
+        self.assertIn(b"temporarily blocked", responses[6].content)
+
+    @skipUnless(
+        "fork" in multiprocessing.get_all_start_methods(), "requires fork start method"
+    )
+    def test_limit_is_exact_across_processes(self):
+        context = multiprocessing.get_context("fork")
+        with context.Manager() as manager:
+            SharedDictCache.shared = (manager.dict(), manager.Lock())
+            start = context.Event()
+            results = context.Queue()
+            workers = [
+                context.Process(target=send_gold_requests, args=(10, start, results))
+                for _ in range(4)
+            ]
+            for worker in workers:
+                worker.start()
+            start.set()
+            statuses = [status for _ in workers for status in results.get(timeout=30)]
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(statuses.count(200), 10)
+        self.assertEqual(statuses.count(429), 30)
+
+
+# Reference rate limiters: exact arithmetic, full history, no shortcuts.
+def reference_fixed_window(events, limit, window, aligned=False):
+    start, count, allowed = None, 0, []
+    for now, cost in events:
+        if aligned and (start is None or now // window != start // window):
+            start, count = now, 0
+        elif not aligned and (start is None or now - start >= window):
+            start, count = now, 0
+        count += cost
+        allowed.append(count <= limit)
+    return allowed
+
+
+def reference_sliding_window_counter(events, limit, window):
+    buckets, allowed = defaultdict(int), []
+    for now, cost in events:
+        index = now // window
+        buckets[index] += cost
+        weight = 1 - (now - index * window) / window
+        allowed.append(buckets[index - 1] * weight + buckets[index] <= limit)
+    return allowed
+
+
+def reference_sliding_log(events, limit, window):
+    accepted, allowed = [], []
+    for now, cost in events:
+        in_window = sum(1 for timestamp in accepted if timestamp > now - window)
+        allowed.append(in_window + cost <= limit)
+        if allowed[-1]:
+            accepted.extend([now] * cost)
+    return allowed
+
+
+def reference_token_bucket(events, limit, window):
+    tokens, updated, allowed = Fraction(limit), None, []
+    for now, cost in events:
+        if updated is not None:
+            tokens = min(limit, tokens + (now - updated) * Fraction(limit, window))
+        updated = now
+        allowed.append(tokens >= cost)
+        if allowed[-1]:
+            tokens -= cost
+    return allowed
+
+
+# Quarter seconds are exact in binary floating point, so the only rounding
+# left is the one the implementations have to absorb themselves.
+traffic = st.lists(
+    st.tuples(st.integers(0, 400), st.integers(1, 3)), min_size=1, max_size=80
+)
+limits = st.integers(1, 20)
+
+
+def run_events(store, algorithm, steps, limit, window=60):
+    events, quarters = [], 0
+    for gap, cost in steps:
+        quarters += gap
+        events.append((Fraction(quarters, 4), cost))
+    decisions = [
+        store.hit("key", algorithm, limit, window, now=float(now), cost=cost).allowed
+        for now, cost in events
+    ]
+    return decisions, events
+
+
+class RateLimitAlgorithmPropertyTest(SimpleTestCase):
+    def check(self, algorithm, reference, steps, limit, store=None):
+        store = store or LocMemCounterStore()
+        decisions, events = run_events(store, algorithm, steps, limit)
+        self.assertEqual(decisions, reference(events, limit, 60))
+
+    @given(traffic, limits)
+    def test_fixed_window(self, steps, limit):
+        self.check(FixedWindow(), reference_fixed_window, steps, limit)
+
+    @given(traffic, limits)
+    def test_sliding_window_counter(self, steps, limit):
+        self.check(
+            SlidingWindowCounter(), reference_sliding_window_counter, steps, limit
+        )
+
+    @given(traffic, limits)
+    def test_sliding_log(self, steps, limit):
+        self.check(SlidingLog(), reference_sliding_log, steps, limit)
+
+    @given(traffic, limits)
+    def test_token_bucket(self, steps, limit):
+        self.check(TokenBucket(), reference_token_bucket, steps, limit)
+
+    @given(traffic, limits)
+    def test_gcra_matches_token_bucket(self, steps, limit):
+        self.check(GCRA(), reference_token_bucket, steps, limit)
+
+    @hypothesis_settings(max_examples=50)
+    @given(traffic, limits)
+    def test_cache_store_counters(self, steps, limit):
+        caches["default"].clear()
+        self.check(
+            SlidingWindowCounter(),
+            reference_sliding_window_counter,
+            steps,
+            limit,
+            store=CacheCounterStore(key_prefix="sliding"),
+        )
+        self.check(
+            FixedWindow(),
+            lambda events, limit, window: reference_fixed_window(
+                events, limit, window, aligned=True
+            ),
+            steps,
+            limit,
+            store=CacheCounterStore(key_prefix="fixed"),
+        )
+
+    @given(traffic, limits)
+    def test_state_size_does_not_grow_with_traffic(self, steps, limit):
+        for algorithm in (SlidingWindowCounter(), SlidingLog(), TokenBucket(), GCRA()):
+            store = LocMemCounterStore()
+            run_events(store, algorithm, steps, limit)
+            state = store._states["key"]
+            self.assertFalse(hasattr(state, "__dict__"))
+            if isinstance(algorithm, SlidingLog):
+                self.assertEqual(len(state.log), limit)
+
+
+class QueueingFileHandlerTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_file = os.path.join(directory.name, "requests.log")
+
+    def make_handler(self, **kwargs):
+        handler = QueueingFileHandler(self.log_file, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def emit(self, handler, count):
+        for i in range(count):
+            handler.handle(
+                logging.LogRecord(
+                    "request_logger", logging.INFO, __file__, 0, "n=%s", (i,), None
+                )
+            )
+
+    def test_records_are_written_in_batches(self):
+        handler = self.make_handler(batch_size=8)
+        self.emit(handler, 20)
+        handler.flush()
+        with open(self.log_file) as log:
+            self.assertEqual(log.read().splitlines(), [f"n={i}" for i in range(20)])
+
+    def test_drop_policy_counts_dropped_records(self):
+        handler = self.make_handler(max_queue_size=2)
+        handler.listener.stop()
+        self.emit(handler, 5)
+        self.assertEqual(handler.stats(), {"queued": 2, "dropped": 3, "sampled_out": 0})
+
+    def test_block_policy_gives_up_after_timeout(self):
+        handler = self.make_handler(
+            max_queue_size=1, overflow="block", block_timeout=0.01
+        )
+        handler.listener.stop()
+        self.emit(handler, 2)
+        self.assertEqual(handler.dropped, 1)
+
+    def test_sample_policy_keeps_a_fraction_once_busy(self):
+        handler = self.make_handler(max_queue_size=20, overflow="sample", sample_rate=5)
+        handler.listener.stop()
+        self.emit(handler, 60)
+        stats = handler.stats()
+        self.assertEqual(stats["queued"], 20)
+        self.assertEqual(stats["sampled_out"], 40)
+        self.assertEqual(stats["dropped"], 0)
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            QueueingFileHandler(self.log_file, overflow="ignore")
+
+    def test_middleware_defers_formatting(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger("request_logger")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.1")
+        request.user = AnonymousUser()
+        LoggingMiddleware(get_response=lambda r: HttpResponse("OK"))(request)
+        self.assertEqual(records[0].args["ip"], "10.0.0.1")
+        self.assertEqual(records[0].args["user"], "Anonymous")
+
+
+async def async_ok_view(request):
+    return HttpResponse("OK")
+
+
+class AsyncMiddlewareTest(SimpleTestCase):
+    middleware_classes = (
+        IPFilterMiddleware,
+        TimingMiddleware,
+        LoggingMiddleware,
+        RateLimitMiddleware,
+        BlockingRateLimitMiddleware,
+        ConcurrencyLimitMiddleware,
+        LoadSheddingMiddleware,
+        ResponseCacheMiddleware,
+    )
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    def test_middlewares_switch_to_async_mode(self):
+        for middleware_class in self.middleware_classes:
+            with self.subTest(middleware=middleware_class.__name__):
+                self.assertTrue(middleware_class.sync_capable)
+                self.assertTrue(middleware_class.async_capable)
+                self.assertTrue(iscoroutinefunction(middleware_class(async_ok_view)))
+                self.assertFalse(
+                    iscoroutinefunction(middleware_class(lambda r: HttpResponse()))
+                )
+
+    @override_settings(DEBUG=True)
+    def test_asgi_chain_is_adapted_once(self):
+        with self.assertLogs("django.request", "DEBUG") as logs:
+            ASGIHandler()
+        self.assertEqual(
+            logs.output,
+            [
+                "DEBUG:django.request:Asynchronous handler adapted for middleware "
+                "api.middlewares.syncchain.SyncChainMiddleware."
+            ],
+        )
+
+        without_sync_chain = [
+            path
+            for path in settings.MIDDLEWARE
+            if not path.endswith("SyncChainMiddleware")
+        ]
+        with self.settings(MIDDLEWARE=without_sync_chain):
+            with self.assertNoLogs("django.request", "DEBUG"):
+                ASGIHandler()
+
+    async def test_rate_limit_async(self):
+        middleware = RateLimitMiddleware(async_ok_view)
+        request = self.factory.get("/")
+        request.user = SimpleNamespace(is_authenticated=True, id=7, role="silver")
+        statuses = [(await middleware(request)).status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+
+    async def test_user_is_resolved_through_auser(self):
+        user = SimpleNamespace(is_authenticated=True, id=8, email="a@b.c", role="gold")
+        request = self.factory.get("/")
+        request.user = SimpleLazyObject(self.fail)
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        response = await LoggingMiddleware(async_ok_view)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(request.user, user)
+
+    async def test_cache_store_async_hit(self):
+        store = CacheCounterStore(key_prefix="async")
+        await caches["default"].aclear()
+        for _ in range(2):
+            decision = await store.ahit("a", FixedWindow(), 2, 60, now=30)
+        self.assertTrue(decision.allowed)
+        decision = await store.ahit("a", FixedWindow(), 2, 60, now=30)
+        self.assertFalse(decision.allowed)
+
+
+class ConcurrencyLimitTest(SimpleTestCase):
+    def test_client_and_role_limits(self):
+        limiter = ConcurrencyLimiter({"gold": 2, "*": 1}, {"gold": 3})
+        self.assertTrue(limiter.acquire(1, "gold"))
+        self.assertTrue(limiter.acquire(1, "gold"))
+        self.assertFalse(limiter.acquire(1, "gold"))
+        self.assertTrue(limiter.acquire(2, "gold"))
+        self.assertFalse(limiter.acquire(3, "gold"))
+        self.assertTrue(limiter.acquire("10.0.0.1", "unauthenticated"))
+        self.assertFalse(limiter.acquire("10.0.0.1", "unauthenticated"))
+
+        limiter.release(1, "gold")
+        self.assertTrue(limiter.acquire(3, "gold"))
+        for client in (1, 2, 3):
+            limiter.release(client, "gold")
+        limiter.release("10.0.0.1", "unauthenticated")
+        self.assertEqual((limiter._clients, limiter._roles), ({}, {}))
+
+    def test_waiters_get_released_slots(self):
+        limiter = ConcurrencyLimiter({"*": 1}, queue_size=1, timeout=5)
+        limiter.acquire(1, "gold")
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(limiter.acquire(1, "gold"))
+        )
+        waiter.start()
+        while not limiter._waiters:
+            time.sleep(0.001)
+
+        # The queue is full, so the next request is turned away at once.
+        self.assertFalse(limiter.acquire(1, "gold"))
+        limiter.release(1, "gold")
+        waiter.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(limiter._clients, {1: 1})
+
+    def test_wait_times_out(self):
+        limiter = ConcurrencyLimiter({"*": 1}, queue_size=4, timeout=0.01)
+        limiter.acquire(1, "gold")
+        self.assertFalse(limiter.acquire(1, "gold"))
+        self.assertFalse(limiter._waiters)
+
+    async def test_async_waiters(self):
+        limiter = ConcurrencyLimiter({"*": 1}, queue_size=2, timeout=5)
+        await limiter.aacquire(1, "gold")
+        granted = asyncio.create_task(limiter.aacquire(1, "gold"))
+        cancelled = asyncio.create_task(limiter.aacquire(1, "gold"))
+        await asyncio.sleep(0)
+        self.assertEqual(len(limiter._waiters), 2)
+
+        cancelled.cancel()
+        await asyncio.to_thread(limiter.release, 1, "gold")
+        self.assertTrue(await granted)
+        with self.assertRaises(asyncio.CancelledError):
+            await cancelled
+        self.assertEqual(limiter._clients, {1: 1})
+        self.assertFalse(limiter._waiters)
+
+    def middleware(self, view):
+        middleware = ConcurrencyLimitMiddleware(view)
+        middleware.limiter = ConcurrencyLimiter({"*": 1})
+        return middleware
+
+    def request(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="10.8.0.1")
+        request.user = AnonymousUser()
+        return request
+
+    def test_slot_is_released_after_an_exception(self):
+        def view(request):
+            raise ValueError
+
+        middleware = self.middleware(view)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                middleware(self.request())
+        self.assertEqual(middleware.limiter._clients, {})
+
+    def test_streaming_response_holds_its_slot_until_closed(self):
+        middleware = self.middleware(lambda r: StreamingHttpResponse(iter([b"a"])))
+        streaming = middleware(self.request())
+        busy = middleware(self.request())
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy["Retry-After"], "1")
+
+        self.assertEqual(b"".join(streaming), b"a")
+        streaming.close()
+        self.assertEqual(middleware(self.request()).status_code, 200)
+
+    async def test_async_slot_is_released(self):
+        middleware = self.middleware(async_ok_view)
+        request = AsyncRequestFactory().get("/", REMOTE_ADDR="10.8.0.2")
+        request.user = SimpleNamespace(is_authenticated=True, id=9, role="gold")
+        for _ in range(2):
+            self.assertEqual((await middleware(request)).status_code, 200)
+        self.assertEqual(middleware.limiter._clients, {})
+
+
+class LoadSheddingTest(SimpleTestCase):
+    def test_lower_tiers_are_shed_first(self):
+        limit = AdaptiveLimit(initial_limit=10)
+        admitted = {}
+        for role in ("unauthenticated", "bronze", "silver", "gold"):
+            while limit.acquire(role):
+                admitted[role] = admitted.get(role, 0) + 1
+        self.assertEqual(
+            admitted, {"unauthenticated": 5, "bronze": 2, "silver": 2, "gold": 1}
+        )
+
+    def test_slow_requests_cut_the_limit_once_per_batch(self):
+        limit = AdaptiveLimit(initial_limit=100, latency_target=0.25, backoff=0.5)
+        for _ in range(10):
+            limit.acquire("gold")
+        for _ in range(10):
+            limit.release(started=0, now=1)
+        self.assertEqual(limit.limit, 50)
+
+        limit.acquire("gold")
+        limit.release(started=1.5, now=2)
+        self.assertEqual(limit.limit, 25)
+
+        for second in range(3, 10):
+            limit.acquire("gold")
+            limit.release(started=second, now=second + 1)
+        self.assertEqual(limit.limit, 8)
+        self.assertEqual(limit.in_flight, 0)
+
+    def test_fast_requests_grow_a_used_limit(self):
+        limit = AdaptiveLimit(initial_limit=10, max_limit=11)
+        limit.acquire("gold")
+        limit.release(started=0, now=0.01)
+        self.assertEqual(limit.limit, 10)
+
+        for _ in range(10):
+            limit.acquire("gold")
+        for _ in range(4):
+            limit.release(started=0, now=0.01)
+        self.assertGreater(limit.limit, 10.3)
+        for _ in range(20):
+            limit.acquire("gold")
+            limit.release(started=0, now=0.01)
+        self.assertEqual(limit.limit, 11)
+
+    def test_middleware_sheds_and_releases(self):
+        def view(request):
+            if request.GET.get("fail"):
+                raise ValueError
+            return HttpResponse()
+
+        middleware = LoadSheddingMiddleware(view)
+        middleware.limit = AdaptiveLimit(initial_limit=2)
+        factory = RequestFactory()
+
+        def call(path):
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            return middleware(request)
+
+        with self.assertRaises(ValueError):
+            call("/?fail=1")
+        streaming = LoadSheddingMiddleware(lambda r: StreamingHttpResponse([b""]))
+        streaming.limit = middleware.limit
+        request = factory.get("/")
+        request.user = AnonymousUser()
+        response = streaming(request)
+        self.assertEqual(middleware.limit.in_flight, 1)
+
+        shed = call("/")
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed["Retry-After"], "1")
+        response.close()
+        self.assertEqual(call("/").status_code, 200)
+        self.assertEqual(middleware.limit.in_flight, 0)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        registry.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def view(self, request):
+        self.calls += 1
+        response = HttpResponse(f"page {self.calls}")
+        response["RateLimit-Remaining"] = "0"
+        return response
+
+    def get(self, middleware, user=None, **extra):
+        request = self.factory.get("/", **extra)
+        request.user = user or AnonymousUser()
+        return middleware(request)
+
+    def test_anonymous_pages_skip_the_stack(self):
+        with self.assertLogs("request_logger") as logs:
+            responses = [
+                self.client.get(reverse("home"), REMOTE_ADDR="10.7.0.1")
+                for _ in range(3)
+            ]
+        # Only the miss went through the logging middleware.
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual([r.status_code for r in responses], [200] * 3)
+        self.assertEqual([r["X-Cache"] for r in responses], ["MISS", "HIT", "HIT"])
+        self.assertEqual(responses[2].content, b"Welcome to the Home Page")
+        text = registry.render()
+        self.assertIn('response_cache_misses_total{view="home"} 1', text)
+        self.assertIn('response_cache_hits_total{view="home"} 2', text)
+        self.assertIn('request_latency_seconds_count{view="home"} 3', text)
+
+    def test_etag_and_not_modified(self):
+        middleware = ResponseCacheMiddleware(self.view)
+        etag = self.get(middleware)["ETag"]
+        for _ in range(2):
+            response = self.get(middleware, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        response = self.get(middleware, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.content, b"page 1")
+        self.assertNotIn("RateLimit-Remaining", response)
+
+    def test_varies_on_user(self):
+        middleware = ResponseCacheMiddleware(self.view)
+        alice = SimpleNamespace(is_authenticated=True, pk=1)
+        bob = SimpleNamespace(is_authenticated=True, pk=2)
+        pages = [
+            self.get(middleware, user).content for user in (None, alice, bob, alice)
+        ]
+        self.assertEqual(pages, [b"page 1", b"page 2", b"page 3", b"page 2"])
+
+    def test_client_specific_responses_are_not_stored(self):
+        def view(request):
+            self.calls += 1
+            if request.GET.get("cookie"):
+                response = HttpResponse()
+                response.set_cookie("a", "b")
+                return response
+            get_token(request)
+            return HttpResponse()
+
+        middleware = ResponseCacheMiddleware(view)
+        for query in ({"cookie": "1"}, {}):
+            for _ in range(2):
+                request = self.factory.get("/", query)
+                request.user = AnonymousUser()
+                self.assertEqual(middleware(request)["X-Cache"], "MISS")
+        request = self.factory.post("/")
+        request.user = AnonymousUser()
+        middleware(request)
+        self.assertEqual(self.calls, 5)
+
+    def test_concurrent_misses_run_the_view_once(self):
+        def slow_view(request):
+            time.sleep(0.05)
+            return self.view(request)
+
+        middleware = ResponseCacheMiddleware(slow_view)
+        start = threading.Barrier(8)
+        pages = []
+
+        def client():
+            start.wait()
+            pages.append(self.get(middleware).content)
+
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(pages, [b"page 1"] * 8)
+
+    async def test_async_concurrent_misses_run_the_view_once(self):
+        async def slow_view(request):
+            await asyncio.sleep(0.05)
+            return self.view(request)
+
+        middleware = ResponseCacheMiddleware(slow_view)
+        factory = AsyncRequestFactory()
+
+        async def client():
+            request = factory.get("/")
+            request.user = AnonymousUser()
+            return (await middleware(request)).content
+
+        pages = await asyncio.gather(*(client() for _ in range(5)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(pages, [b"page 1"] * 5)
+
+
+class FastRejectTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        self.user_loads = 0
+
+    def lazy_request(self, user, session_exists=True, **cookies):
+        def load_user():
+            self.user_loads += 1
+            return user
+
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.9")
+        request.COOKIES.update(cookies)
+        request.user = SimpleLazyObject(load_user)
+        session_key = cookies.get("sessionid") if session_exists else None
+        request.session = SimpleNamespace(session_key=session_key)
+        return request
+
+    def test_cookieless_requests_never_load_the_user(self):
+        statuses = [
+            self.middleware(self.lazy_request(AnonymousUser())).status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [200, 429, 429])
+        self.assertEqual(self.user_loads, 0)
+
+    def test_session_identity_is_cached(self):
+        user = SimpleNamespace(is_authenticated=True, id=3, role="silver")
+        statuses = [
+            self.middleware(self.lazy_request(user, sessionid="abc")).status_code
+            for _ in range(7)
+        ]
+        self.assertEqual(statuses, [200] * 5 + [429] * 2)
+        self.assertEqual(self.user_loads, 1)
+
+    def test_anonymous_session_is_cached(self):
+        for _ in range(3):
+            self.middleware(self.lazy_request(AnonymousUser(), sessionid="anon"))
+        self.assertEqual(self.user_loads, 1)
+
+    @override_settings(RATELIMIT_IDENTITY_CACHE_OPTIONS={"max_entries": 1})
+    def test_made_up_session_keys_are_not_cached(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        user = SimpleNamespace(is_authenticated=True, id=3, role="silver")
+        middleware(self.lazy_request(user, sessionid="real"))
+        for i in range(3):
+            request = self.lazy_request(
+                AnonymousUser(), session_exists=False, sessionid=f"made-up-{i}"
+            )
+            request.META["REMOTE_ADDR"] = f"10.0.1.{i}"
+            middleware(request)
+        self.assertEqual(self.user_loads, 4)
+        # The real session's identity is still cached.
+        middleware(self.lazy_request(user, sessionid="real"))
+        self.assertEqual(self.user_loads, 4)
+
+    @override_settings(RESPONSE_CACHE_VIEWS={"home": False})
+    def test_new_made_up_session_keys_over_the_limit_cost_no_queries(self):
+        def get(sessionid):
+            self.client.cookies["sessionid"] = sessionid
+            return self.client.get(reverse("home"), REMOTE_ADDR="10.0.0.11")
+
+        self.assertEqual(get("a" * 32).status_code, 200)
+        self.assertEqual(get("b" * 32).status_code, 429)
+        with self.assertNumQueries(0):
+            responses = [get(f"{i:032d}") for i in range(3)]
+        self.assertEqual([r.status_code for r in responses], [429] * 3)
+        self.assertIn("Retry-After", responses[0])
+
+        # Other IPs, and sessions whose identity is cached, are unaffected.
+        self.client.cookies.clear()
+        response = self.client.get(reverse("home"), REMOTE_ADDR="10.0.0.12")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(RESPONSE_CACHE_VIEWS={"home": False})
+    def test_made_up_session_cookie_is_limited_by_ip(self):
+        self.client.cookies["sessionid"] = "x" * 32
+        statuses = [
+            self.client.get(reverse("home"), REMOTE_ADDR="10.0.0.10").status_code
+            for _ in range(2)
+        ]
+        self.assertEqual(statuses, [200, 429])
+
+    @override_settings(RATELIMIT_FAST_REJECT=False)
+    def test_fast_reject_can_be_disabled(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        middleware(self.lazy_request(AnonymousUser()))
+        self.assertEqual(self.user_loads, 1)
+
+    @override_settings(RESPONSE_CACHE_VIEWS={"home": False})
+    def test_over_limit_request_costs_no_queries(self):
+        user = User.objects.create_user(
+            email="bronze@django.com", password="password", role="bronze"
+        )
+        self.client.force_login(user)
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 429)
+
+
+class StructuredRequestLogTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.logger = logging.getLogger("request_logger")
+        self.original_handlers = self.logger.handlers
+        self.addCleanup(setattr, self.logger, "handlers", self.original_handlers)
+
+    def log_requests(self, filename, count, **options):
+        handler = QueueingFileHandler(os.path.join(self.directory, filename), **options)
+        self.logger.handlers = [handler]
+        middleware = LoggingMiddleware(get_response=lambda r: HttpResponse(status=201))
+        for i in range(count):
+            request = RequestFactory().post(f"/items/{i}/", REMOTE_ADDR="10.0.0.1")
+            request.user = AnonymousUser()
+            middleware(request)
+        handler.close()
+        return handler
+
+    def test_jsonl_and_binary_round_trip(self):
+        for record_format in ("jsonl", "binary"):
+            with self.subTest(record_format=record_format):
+                handler = self.log_requests(
+                    f"requests.{record_format}", 3, record_format=record_format
+                )
+                records = list(read_records(handler.target.baseFilename))
+                self.assertEqual(
+                    [r["path"] for r in records], [f"/items/{i}/" for i in range(3)]
+                )
+                self.assertEqual(records[0]["method"], "POST")
+                self.assertEqual(records[0]["status"], 201)
+                self.assertEqual(records[0]["ip"], "10.0.0.1")
+                self.assertIsInstance(records[0]["latency_ms"], float)
+
+    def truncate(self, path, size):
+        with open(path, "r+b") as log:
+            log.truncate(size)
+
+    def test_partial_binary_record_is_skipped(self):
+        for label in ("header", "payload"):
+            with self.subTest(truncated=label):
+                handler = self.log_requests(f"{label}.bin", 2, record_format="binary")
+                path = handler.target.baseFilename
+                # Both records are the same size.
+                size = os.path.getsize(path)
+                keep = size // 2 + 2 if label == "header" else size - 5
+                self.truncate(path, keep)
+                records = list(read_records(path))
+                self.assertEqual([r["path"] for r in records], ["/items/0/"])
+
+    def test_partial_last_line_is_skipped(self):
+        path = self.log_requests("requests.jsonl", 2, record_format="jsonl")
+        path = path.target.baseFilename
+        self.truncate(path, os.path.getsize(path) - 10)
+        records = list(read_records(path))
+        self.assertEqual([r["path"] for r in records], ["/items/0/"])
+
+    def test_last_line_without_newline_is_read(self):
+        path = self.log_requests("requests.jsonl", 2, record_format="jsonl")
+        path = path.target.baseFilename
+        self.truncate(path, os.path.getsize(path) - 1)
+        records = list(read_records(path))
+        self.assertEqual([r["path"] for r in records], ["/items/0/", "/items/1/"])
+
+    def test_size_rotation_compresses_and_prunes(self):
+        handler = self.log_requests(
+            "requests.jsonl",
+            40,
+            record_format="jsonl",
+            batch_size=1,
+            max_bytes=512,
+            backup_count=3,
+            compress=True,
+        )
+        rolled = handler.target.rolled_files()
+        self.assertEqual(len(rolled), 3)
+        self.assertTrue(all(path.endswith(".gz") for path in rolled))
+
+        current = handler.target.baseFilename
+        if os.path.exists(current):
+            rolled.append(current)
+        records = list(read_records(*rolled))
+        paths = [record["path"] for record in records]
+        self.assertEqual(paths, sorted(paths, key=lambda p: int(p.split("/")[2])))
+        self.assertEqual(paths[-1], "/items/39/")
+
+    @skipUnless(
+        "fork" in multiprocessing.get_all_start_methods(), "requires fork start method"
+    )
+    def test_processes_share_a_rotating_file(self):
+        path = os.path.join(self.directory, "shared.jsonl")
+
+        def write(worker):
+            handler = BatchingFileHandler(path, max_bytes=2048, compress=True)
+            handler.setFormatter(JSONLinesFormatter())
+            for batch in range(20):
+                for i in range(10):
+                    handler.handle(
+                        logging.makeLogRecord(
+                            {"msg": "", "args": {"id": f"{worker}-{batch}-{i}"}}
+                        )
+                    )
+                handler.flush()
+            handler.close()
+
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=write, args=(n,)) for n in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        target = BatchingFileHandler(path)
+        files = target.rolled_files() + [path] * os.path.exists(path)
+        self.assertGreater(len(files), 1)
+        ids = [record["id"] for record in read_records(*files)]
+        self.assertEqual(len(ids), 800)
+        self.assertEqual(len(set(ids)), 800)
+
+    def test_time_rotation(self):
+        handler = self.log_requests(
+            "requests.bin", 1, record_format="binary", rotate_interval=60
+        )
+        target = handler.target
+        target.stream = target._open()
+        target.rollover_at = 0
+        target.flush()
+        self.assertEqual(len(target.rolled_files()), 1)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_histogram_buckets_are_within_precision(self):
+        previous = -1
+        for value in list(range(1000)) + [10**k + 7 for k in range(3, 12)]:
+            index = bucket_index(value)
+            self.assertGreaterEqual(index, previous)
+            previous = index
+            upper = bucket_upper_bound(index)
+            self.assertGreaterEqual(upper, value)
+            self.assertLessEqual(upper - value, value / 8)
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 10_001):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 10_000)
+        for percent in (50, 90, 99):
+            expected = 100 * percent
+            self.assertAlmostEqual(
+                histogram.percentile(percent), expected, delta=expected / 8
+            )
+
+    @override_settings(RESPONSE_CACHE_VIEWS={"home": False})
+    def test_metrics_endpoint(self):
+        for _ in range(2):
+            self.client.get(reverse("home"))
+        for _ in range(3):
+            response = self.client.get(reverse("metrics"))
+            self.assertEqual(response.status_code, 200)
+
+        text = response.content.decode()
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        # The second request is rejected before URL resolution.
+        self.assertIn('request_latency_seconds_count{view="home"} 1', text)
+        self.assertIn('request_latency_seconds_bucket{view="home",le="+Inf"} 1', text)
+        self.assertIn('request_latency_seconds_count{view="unresolved"} 1', text)
+        self.assertIn('ratelimit_rejections_total{role="unauthenticated"} 1', text)
+        self.assertIn("# TYPE middleware_overhead_seconds histogram", text)
+
+    def test_metrics_endpoint_is_for_staff_and_internal_addresses(self):
+        url = reverse("metrics")
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR="203.0.113.5").status_code, 403
+        )
+        with self.settings(METRICS_ALLOWED_IPS=["203.0.113.0/24"]):
+            response = self.client.get(url, REMOTE_ADDR="203.0.113.5")
+            self.assertEqual(response.status_code, 200)
+
+        user = User.objects.create_user(email="user@django.com", password="password")
+        self.client.force_login(user)
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR="203.0.113.6").status_code, 403
+        )
+        user.is_staff = True
+        user.save()
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR="203.0.113.6").status_code, 200
+        )
+
+    def test_render_while_series_are_added(self):
+        class GrowingDict(dict):
+            def items(self):
+                for item in super().items():
+                    # Another request adds a series mid-iteration.
+                    self["late_total", ()] = 1
+                    yield item
+
+        registry.inc("early_total")
+        self.addCleanup(setattr, registry, "counters", registry.counters)
+        registry.counters = GrowingDict(registry.counters)
+        self.assertIn("early_total 1", registry.render())
+
+
+class RequestSamplingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def log(self, sampler, statuses, ip="10.0.0.1", path="/"):
+        middleware = LoggingMiddleware(get_response=lambda r: self.responses.pop(0))
+        middleware.sampler = sampler
+        self.responses = [HttpResponse(status=status) for status in statuses]
+        logger = logging.getLogger("request_logger")
+        with mock.patch.object(logger, "log") as log:
+            for _ in statuses:
+                request = self.factory.get(path, REMOTE_ADDR=ip)
+                request.user = AnonymousUser()
+                middleware(request)
+        return [call.args[2]["status"] for call in log.call_args_list]
+
+    def test_path_rates_use_longest_prefix(self):
+        sampler = RequestSampler(
+            rate=0.5, path_rates={"/api/": 0.1, "/api/items/": 1.0, "/health": 0}
+        )
+        self.assertEqual(sampler.rate_for("/api/items/3/"), 1.0)
+        self.assertEqual(sampler.rate_for("/api/users/"), 0.1)
+        self.assertEqual(sampler.rate_for("/health"), 0)
+        self.assertEqual(sampler.rate_for("/health/deep/"), 0.5)
+        self.assertEqual(sampler.rate_for("/"), 0.5)
+
+    def test_unsampled_requests_skip_user_and_errors_are_always_logged(self):
+        middleware = LoggingMiddleware(get_response=lambda r: HttpResponse())
+        middleware.sampler = RequestSampler(rate=0)
+        request = self.factory.get("/")
+        request.user = SimpleLazyObject(self.fail)
+        with mock.patch.object(logging.getLogger("request_logger"), "log") as log:
+            middleware(request)
+        log.assert_not_called()
+
+        logged = self.log(RequestSampler(rate=0), [200, 404, 429, 500, 503])
+        self.assertEqual(logged, [429, 500, 503])
+
+    def test_per_ip_limit(self):
+        sampler = RequestSampler(per_ip_limit=2)
+        self.assertEqual(self.log(sampler, [200] * 4), [200, 200])
+        self.assertEqual(self.log(sampler, [200] * 4, ip="10.0.0.2"), [200, 200])
+        self.assertEqual(self.log(sampler, [500], ip="10.0.0.2"), [500])
+
+        self.assertTrue(sampler.sample("/", "10.0.0.3", now=10**9))
+        self.assertTrue(sampler.sample("/", "10.0.0.1", now=10**9))
+
+    def test_untracked_ips_get_no_quota_in_a_flood(self):
+        sampler = RequestSampler(per_ip_limit=1, max_ips=3)
+        sampled = [sampler.sample("/", f"10.1.0.{i}", now=0) for i in range(100)]
+        self.assertEqual(sum(sampled), 3)
+        self.assertFalse(sampler.sample("/", "10.1.0.0", now=1))
+        self.assertTrue(sampler.sample("/", "10.1.0.50", now=100))
+
+    def test_levels_follow_status(self):
+        middleware = LoggingMiddleware(get_response=lambda r: HttpResponse(status=503))
+        request = self.factory.get("/")
+        request.user = AnonymousUser()
+        with self.assertLogs("request_logger", "WARNING") as logs:
+            middleware(request)
+        self.assertEqual(logs.records[0].levelname, "ERROR")
+
+
+class PolicyTableTest(SimpleTestCase):
+    limits = {"gold": 10, "bronze": 2, "*": 1}
+
+    def test_role_limits(self):
+        table = PolicyTable(self.limits, window=30)
+        self.assertEqual(table.resolve("/", "GET", "gold"), (10, 30, ""))
+        self.assertEqual(table.resolve("/", "GET", "Bronze").limit, 2)
+        self.assertEqual(table.resolve("/", "GET", "default").limit, 1)
+
+    def test_rules(self):
+        table = PolicyTable(
+            self.limits,
+            [
+                {"path": "/login/", "methods": ["post"], "limits": {"*": 5}},
+                {"path": "/login/", "limits": {"gold": 50}, "window": 10},
+                {"prefix": "/admin/", "limits": {"gold": 100}},
+                {"prefix": "/admin/users/", "limits": {"gold": 200}},
+                {"view": "protected", "limits": {"bronze": 7}},
+            ],
+        )
+        self.assertEqual(
+            table.resolve("/login/", "POST", "bronze"), (5, 60, "path:/login/")
+        )
+        self.assertEqual(
+            table.resolve("/login/", "POST", "gold"), (50, 10, "path:/login/")
+        )
+        self.assertEqual(table.resolve("/login/", "GET", "bronze"), (2, 60, ""))
+        self.assertEqual(table.resolve("/admin/users/1/", "GET", "gold").limit, 200)
+        self.assertEqual(table.resolve("/admin/groups/", "GET", "gold").limit, 100)
+        self.assertEqual(table.resolve("/admin/groups/", "GET", "bronze").limit, 2)
+        self.assertEqual(table.resolve("/protected/", "GET", "bronze").limit, 7)
+        self.assertEqual(table.resolve("/missing/", "GET", "bronze").limit, 2)
+
+    def test_rule_needs_one_target(self):
+        with self.assertRaises(ImproperlyConfigured):
+            PolicyTable(self.limits, [{"path": "/", "view": "home", "limits": {}}])
+
+    def test_hot_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "policies.json")
+            loader = PolicyLoader({"limits": self.limits}, path, reload_interval=0)
+            self.assertEqual(loader.resolve("/", "GET", "gold").limit, 10)
+
+            def write(content, mtime):
+                with open(path, "w") as policy_file:
+                    policy_file.write(content)
+                os.utime(path, ns=(mtime, mtime))
+
+            write('{"limits": {"gold": 20}}', 10**18)
+            self.assertEqual(loader.resolve("/", "GET", "gold").limit, 20)
+
+            write("{not json", 2 * 10**18)
+            with self.assertLogs("api.middlewares.policies", "ERROR"):
+                self.assertEqual(loader.resolve("/", "GET", "gold").limit, 20)
+
+    @override_settings(
+        RATELIMIT_POLICIES={
+            "limits": {"*": 1},
+            "rules": [{"view": "login", "methods": ["POST"], "limits": {"*": 2}}],
+        },
+        RATELIMIT_COSTS={"login": 1},
+    )
+    def test_rule_counts_separately(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        factory = RequestFactory()
+
+        def status(request):
+            request.user = AnonymousUser()
+            return middleware(request).status_code
+
+        self.assertEqual(status(factory.get("/")), 200)
+        self.assertEqual(status(factory.get("/")), 429)
+        login = [status(factory.post(reverse("login"))) for _ in range(3)]
+        self.assertEqual(login, [200, 200, 429])
+
+
+class RequestCostTest(SimpleTestCase):
+    def test_decorator_and_settings(self):
+        table = CostTable({"login": {"GET": 2}, "protected": 4})
+        self.assertEqual(table.resolve("/login/", "GET"), 2)
+        self.assertEqual(table.resolve("/login/", "POST"), 1)
+        self.assertEqual(table.resolve("/register/", "POST"), 5)
+        self.assertEqual(table.resolve("/register/", "GET"), 1)
+        self.assertEqual(table.resolve("/protected/", "DELETE"), 4)
+        self.assertEqual(table.resolve("/", "GET"), 1)
+        self.assertEqual(table.resolve("/missing/", "GET"), 1)
+
+        @ratelimit_cost(3, methods=["post"])
+        @ratelimit_cost(2)
+        def view(request):
+            return HttpResponse()
+
+        self.assertEqual(view.ratelimit_costs, {"*": 2, "POST": 3})
+
+    @override_settings(
+        RATELIMIT_POLICIES={"limits": {"*": 10}}, RATELIMIT_COSTS={"home": 4}
+    )
+    def test_costs_come_out_of_the_budget(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        factory = RequestFactory()
+
+        def remaining(path):
+            request = factory.get(path, REMOTE_ADDR="10.9.0.1")
+            request.user = AnonymousUser()
+            return middleware(request)["RateLimit-Remaining"]
+
+        self.assertEqual(remaining("/"), "6")
+        self.assertEqual(remaining("/protected/"), "5")
+        self.assertEqual(remaining("/"), "1")
+
+    @override_settings(
+        RATELIMIT_POLICIES={"limits": {"*": 2}}, RATELIMIT_COSTS={"home": 50}
+    )
+    def test_cost_is_capped_at_the_limit(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        request = RequestFactory().get("/", REMOTE_ADDR="10.9.0.2")
+        request.user = AnonymousUser()
+        response = middleware(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["RateLimit-Remaining"], "0")
+
+
+class RateLimitHeadersTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def request(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1")
+        request.user = SimpleNamespace(is_authenticated=True, id=9, role="bronze")
+        return request
+
+    def test_role_based_headers(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        with mock.patch("time.time", return_value=1000.0):
+            first = middleware(self.request())
+        with mock.patch("time.time", return_value=1015.5):
+            second = middleware(self.request())
+            rejected = middleware(self.request())
+
+        self.assertEqual(first["RateLimit-Limit"], "2")
+        self.assertEqual(first["RateLimit-Remaining"], "1")
+        self.assertEqual(first["RateLimit-Reset"], "60")
+        self.assertNotIn("Retry-After", first)
+        self.assertEqual(second["RateLimit-Remaining"], "0")
+        self.assertEqual(second["RateLimit-Reset"], "45")
+
+        self.assertEqual(rejected.status_code, 429)
+        self.assertEqual(rejected["RateLimit-Remaining"], "0")
+        self.assertEqual(rejected["Retry-After"], "45")
+        self.assertEqual(rejected["Content-Type"], "application/json")
+        self.assertEqual(
+            json.loads(rejected.content),
+            {"error": "Request limit exceeded. Try again later."},
+        )
+
+    def test_blocking_headers(self):
+        middleware = BlockingRateLimitMiddleware(get_response=lambda r: HttpResponse())
+        for _ in range(5):
+            response = middleware(self.request())
+        self.assertEqual(response["RateLimit-Limit"], "5")
+        self.assertEqual(response["RateLimit-Remaining"], "0")
+
+        rejected = middleware(self.request())
+        self.assertEqual(rejected.status_code, 429)
+        self.assertIn("Retry-After", rejected)
+        self.assertIn("temporarily blocked", json.loads(rejected.content)["error"])
+
+
+class IPNetworkSetTest(SimpleTestCase):
+    def test_lookup(self):
+        networks = IPNetworkSet(
+            ["10.0.0.0/8", "10.1.0.0/16", "192.168.1.7", "2001:db8::/32", "11.0.0.0/8"]
+        )
+        self.assertEqual(len(networks), 3)
+        for ip in ("10.2.3.4", "11.255.255.255", "192.168.1.7", "2001:db8::1"):
+            self.assertIn(ip, networks)
+        self.assertIn("::ffff:10.0.0.1", networks)
+        for ip in ("9.255.255.255", "12.0.0.0", "192.168.1.8", "2001:db9::", None, "x"):
+            self.assertNotIn(ip, networks)
+
+    def test_matches_ipaddress_for_many_networks(self):
+        rng = random.Random(0)
+        cidrs = [
+            ipaddress.ip_network(
+                (rng.getrandbits(32), rng.randint(8, 32)), strict=False
+            )
+            for _ in range(2000)
+        ]
+        networks = IPNetworkSet(str(cidr) for cidr in cidrs)
+        for _ in range(500):
+            address = ipaddress.ip_address(rng.getrandbits(32))
+            if rng.random() < 0.5:
+                address = rng.choice(cidrs)[0]
+            expected = any(address in cidr for cidr in cidrs)
+            self.assertEqual(str(address) in networks, expected, address)
+
+
+class PenaltyBoxTest(SimpleTestCase):
+    def test_blocks_escalate_and_decay(self):
+        box = PenaltyBox(base=10, factor=2, max_duration=60, decay=100)
+        self.assertEqual(box.blocked_for("a", 0), 0)
+        self.assertEqual(box.punish("a", 0), 10)
+        self.assertEqual(box.blocked_for("a", 4), 6)
+        self.assertEqual(box.blocked_for("a", 10), 0)
+        self.assertEqual(box.punish("a", 10), 20)
+        self.assertEqual(box.punish("a", 30), 40)
+        self.assertEqual(box.punish("a", 70), 60)
+        # Two strikes forgiven after 200 quiet seconds: back to the 3rd block.
+        self.assertEqual(box.punish("a", 330), 40)
+
+    def test_blocking_middleware_escalates(self):
+        middleware = BlockingRateLimitMiddleware(get_response=lambda r: HttpResponse())
+        request = RequestFactory().get("/")
+        request.user = SimpleNamespace(is_authenticated=True, id=3)
+
+        def send(now):
+            with mock.patch("time.time", return_value=now):
+                return middleware(request)
+
+        statuses = [send(0).status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+        self.assertEqual(send(59)["Retry-After"], "1")
+        self.assertEqual(send(60).status_code, 200)
+        for _ in range(5):
+            send(61)
+        self.assertEqual(send(61)["Retry-After"], "120")
+
+
+@override_settings(IP_ALLOWLIST=["10.0.0.0/24"], IP_DENYLIST=["10.0.1.0/24"])
+class IPFilterMiddlewareTest(TestCase):
+    def test_denylist_and_allowlist(self):
+        response = self.client.get(reverse("home"), REMOTE_ADDR="10.0.1.9")
+        self.assertEqual(response.status_code, 403)
+
+        statuses = [
+            self.client.get(reverse("home"), REMOTE_ADDR="10.0.0.9").status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [200] * 3)
+
+    def test_forwarded_for_is_not_trusted(self):
+        response = self.client.get(
+            reverse("home"), REMOTE_ADDR="10.0.1.9", HTTP_X_FORWARDED_FOR="10.0.0.9"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(TRUSTED_PROXIES=["192.168.0.0/16"])
+    def test_forwarded_for_from_trusted_proxy(self):
+        response = self.client.get(
+            reverse("home"),
+            REMOTE_ADDR="192.168.1.1",
+            HTTP_X_FORWARDED_FOR="10.0.0.9, 10.0.1.9",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class ClientIPResolverTest(SimpleTestCase):
+    resolver = ClientIPResolver(["10.0.0.0/8", "2001:db8:ffff::/48"])
+
+    def resolve(self, remote_addr, forwarded_for=None, **meta):
+        meta["REMOTE_ADDR"] = remote_addr
+        if forwarded_for is not None:
+            meta["HTTP_X_FORWARDED_FOR"] = forwarded_for
+        return self.resolver.resolve(meta)[0]
+
+    def test_untrusted_client_cannot_forge_its_address(self):
+        self.assertEqual(self.resolve("203.0.113.7", "198.51.100.1"), "203.0.113.7")
+
+    def test_walks_back_through_trusted_proxies(self):
+        self.assertEqual(self.resolve("10.0.0.1", "198.51.100.1"), "198.51.100.1")
+        # The first hop is whatever the client sent; only the hops appended by
+        # our proxies are believed.
+        self.assertEqual(
+            self.resolve("10.0.0.1", "1.1.1.1, 198.51.100.1, 10.0.0.2"),
+            "198.51.100.1",
+        )
+        self.assertEqual(self.resolve("10.0.0.1", "10.0.0.3, 10.0.0.2"), "10.0.0.3")
+        self.assertEqual(self.resolve("10.0.0.1", "garbage, 10.0.0.2"), "10.0.0.2")
+        self.assertEqual(self.resolve("10.0.0.1"), "10.0.0.1")
+
+    def test_forwarded_header(self):
+        resolver = ClientIPResolver(["10.0.0.0/8"], header="Forwarded")
+        meta = {
+            "REMOTE_ADDR": "10.0.0.1",
+            "HTTP_FORWARDED": 'for=1.1.1.1, for="[2001:db8::1]:4711";proto=https, '
+            "for=10.0.0.2:80",
+        }
+        self.assertEqual(resolver.resolve(meta)[0], "2001:db8::1")
+        meta["HTTP_FORWARDED"] = "for=unknown, for=10.0.0.2"
+        self.assertEqual(resolver.resolve(meta)[0], "10.0.0.2")
+
+    def test_ipv6_clients_share_a_bucket_per_prefix(self):
+        self.assertEqual(
+            self.resolver.bucket("2001:db8:1:2:aaaa::1"), "2001:db8:1:2::/64"
+        )
+        self.assertEqual(
+            self.resolver.bucket("2001:DB8:1:2:bbbb::2"), "2001:db8:1:2::/64"
+        )
+        self.assertEqual(self.resolver.bucket("::ffff:192.0.2.1"), "192.0.2.1")
+        self.assertEqual(self.resolver.bucket("192.0.2.1"), "192.0.2.1")
+        self.assertEqual(
+            ClientIPResolver(ipv6_prefix=48).bucket("2001:db8:1:2::1"),
+            "2001:db8:1::/48",
+        )
+
+    def test_unknown_header(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ClientIPResolver(header="X-Real-IP")
+
+    @override_settings(TRUSTED_PROXIES=["10.0.0.0/8"])
+    def test_resolved_once_per_request(self):
+        request = RequestFactory().get(
+            "/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="2001:db8::5"
+        )
+        with mock.patch.object(
+            ClientIPResolver,
+            "resolve",
+            autospec=True,
+            side_effect=ClientIPResolver.resolve,
+        ) as resolve:
+            self.assertEqual(get_client_ip(request), "2001:db8::5")
+            self.assertEqual(get_client_bucket(request), "2001:db8::/64")
+            get_client_ip(request)
+        self.assertEqual(resolve.call_count, 1)
+
+    @override_settings(TRUSTED_PROXIES=["10.0.0.0/8"])
+    def test_ratelimit_counts_ipv6_networks(self):
+        middleware = RateLimitMiddleware(get_response=lambda r: HttpResponse())
+        statuses = []
+        for host in range(3):
+            request = RequestFactory().get(
+                "/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"2001:db8::{host}"
+            )
+            request.user = AnonymousUser()
+            statuses.append(middleware(request).status_code)
+        self.assertEqual(statuses, [200, 429, 429])
+
+
+class DatabaseConfigTest(SimpleTestCase):
+    def test_sqlite_fallback(self):
+        config = database_config({"DB_ENGINE": "sqlite"}, "/srv/app")
+        self.assertEqual(config["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(config["NAME"], "/srv/app/db.sqlite3")
+
+    def test_persistent_connections_by_default(self):
+        config = database_config({"DB_HOST": "db", "DB_CONN_MAX_AGE": "300"})
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["HOST"], "db")
+        self.assertEqual(config["CONN_MAX_AGE"], 300)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertNotIn("pool", config["OPTIONS"])
+
+    def test_no_persistent_connections_under_asgi(self):
+        self.assertEqual(database_config({})["CONN_MAX_AGE"], 60)
+        self.assertEqual(database_config({"DJANGO_ASGI": "1"})["CONN_MAX_AGE"], 0)
+        config = database_config({"DJANGO_ASGI": "1", "DB_CONN_MAX_AGE": "30"})
+        self.assertEqual(config["CONN_MAX_AGE"], 30)
+
+    def test_pool(self):
+        pool_module = SimpleNamespace(
+            ConnectionPool=SimpleNamespace(check_connection=object())
+        )
+        with mock.patch.dict(sys.modules, {"psycopg_pool": pool_module}):
+            config = database_config({"DB_POOL": "true", "DB_POOL_MAX_SIZE": "20"})
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+        self.assertEqual(config["OPTIONS"]["pool"]["max_size"], 20)
+        self.assertIs(
+            config["OPTIONS"]["pool"]["check"],
+            pool_module.ConnectionPool.check_connection,
+        )
+
+        with mock.patch.dict(sys.modules, {"psycopg_pool": None}):
+            with self.assertRaises(ImproperlyConfigured):
+                database_config({"DB_POOL": "1"})
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_config({"DB_ENGINE": "mysql"})
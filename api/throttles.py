@@ -0,0 +1,54 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .middlewares.algorithms import get_algorithm
+from .middlewares.stores import get_counter_store
+
+
+class LoginThrottle:
+    """
+    At most ``limit`` login attempts per email address every ``window``
+    seconds, counted in the rate limiter's counter store before the password
+    is hashed, so guessing one account's password costs the server nothing
+    once the limit is hit, whichever IPs the attempts come from.
+    """
+
+    def __init__(self, limit=5, window=300):
+        self.limit = limit
+        self.window = window
+        self.store = get_counter_store()
+        self.algorithm = get_algorithm()
+
+    def key(self, email):
+        # A digest, since the email is whatever the client sent: it can hold
+        # spaces or control characters, or be longer than memcached allows.
+        email = email.strip().lower()
+        return f"login:{hashlib.sha256(email.encode()).hexdigest()}"
+
+    async def ahit(self, email, now=None):
+        if now is None:
+            now = time.time()
+        return await self.store.ahit(
+            self.key(email), self.algorithm, self.limit, self.window, now
+        )
+
+
+_throttle = None
+
+
+@receiver(setting_changed)
+def reset_throttle(*, setting, **kwargs):
+    global _throttle
+    if setting in ("LOGIN_THROTTLE_OPTIONS", "RATELIMIT_STORE", "RATELIMIT_ALGORITHM"):
+        _throttle = None
+
+
+def get_login_throttle():
+    global _throttle
+    if _throttle is None:
+        _throttle = LoginThrottle(**getattr(settings, "LOGIN_THROTTLE_OPTIONS", {}))
+    return _throttle
@@ -1,6 +1,13 @@
 # urls.py
 from django.urls import path
-from .views import LoginView, LogoutView, RegisterView, ProtectedView, HomeView
+from .views import (
+    LoginView,
+    LogoutView,
+    RegisterView,
+    ProtectedView,
+    HomeView,
+    MetricsView,
+)
 
 urlpatterns = [
     path("", HomeView.as_view(), name="home"),
@@ -8,4 +15,5 @@ urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("logout/", LogoutView.as_view(), name="logout"),
     path("protected/", ProtectedView.as_view(), name="protected"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
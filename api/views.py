@@ -1,6 +1,11 @@
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
 from django.views import View
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import alogin, logout
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
 from django.contrib import messages
@@ -8,44 +13,76 @@ from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 
+from .backends import aauthenticate
+from .hashing import HashingPoolFull, get_hashing_pool
+from .middlewares.clientip import get_client_ip
+from .middlewares.costs import ratelimit_cost
+from .middlewares.ipfilter import FORBIDDEN_BODY, load_networks
+from .middlewares.metrics import registry
+from .middlewares.responsecache import cache_response
+from .middlewares.utils import set_ratelimit_headers
+from .throttles import get_login_throttle
+
 User = get_user_model()
 
+LOGIN_THROTTLED_BODY = json.dumps(
+    {"error": "Too many login attempts for this account. Try again later."}
+).encode()
+BUSY_BODY = json.dumps({"error": "Server busy. Try again later."}).encode()
+
 
+def server_busy():
+    response = HttpResponse(BUSY_BODY, status=503, content_type="application/json")
+    response["Retry-After"] = "1"
+    return response
+
+
+# Both hash a password, so they cost more of the client's budget.
+@ratelimit_cost(5, methods=["POST"])
 class RegisterView(View):
-    def get(self, request):
+    async def get(self, request):
         return render(request, "register.html")
 
-    def post(self, request):
+    async def post(self, request):
         email = request.POST.get("email")
         password = request.POST.get("password")
-        role = request.POST.get("role", "default")
-
-        if role == "default":
-            role = "default"
+        role = request.POST.get("role", "default").lower()
 
         if not email or not password:
             messages.error(request, "Email and password are required.")
             return redirect("register")
 
-        if User.objects.filter(email=email).exists():
-            messages.error(request, "Email already exists.")
+        if role not in User.ROLES:
+            messages.error(request, "Unknown role.")
             return redirect("register")
 
-        user = User(email=email, role=role)
-        user.set_password(password)
-        user.save()
+        user = User(email=User.objects.normalize_email(email), role=role)
+        try:
+            user.password = await get_hashing_pool().make_password(password)
+        except HashingPoolFull:
+            return server_busy()
+
+        # One INSERT, with the unique index catching taken emails: no
+        # separate lookup, and no race between two signups for one email.
+        try:
+            await sync_to_async(User.objects.insert_user)(user)
+        except IntegrityError:
+            messages.error(request, "Email already exists.")
+            return redirect("register")
 
         messages.success(request, "Registration successful. You can now log in.")
         return redirect("login")
 
 
+@ratelimit_cost(5, methods=["POST"])
 class LoginView(View):
-    def get(self, request):
-        if request.user.is_authenticated:
+    async def get(self, request):
+        user = await request.auser()
+        if user.is_authenticated:
             return redirect("protected")
         return render(request, "login.html")
 
-    def post(self, request):
+    async def post(self, request):
         email = request.POST.get("email")
         password = request.POST.get("password")
 
@@ -54,10 +91,22 @@ class LoginView(View):
                 {"error": "Email and password are required."}, status=400
             )
 
-        user = authenticate(request, email=email, password=password)
+        # Before any hashing, so password guessing is cheap to turn away.
+        throttle = get_login_throttle()
+        decision = await throttle.ahit(email)
+        if not decision.allowed:
+            response = HttpResponse(
+                LOGIN_THROTTLED_BODY, status=429, content_type="application/json"
+            )
+            return set_ratelimit_headers(response, throttle.limit, decision)
+
+        try:
+            user = await aauthenticate(request, email=email, password=password)
+        except HashingPoolFull:
+            return server_busy()
 
         if user is not None:
-            login(request, user)
+            await alogin(request, user)
             return JsonResponse({"message": "Login successful"})
         else:
             return JsonResponse({"error": "Invalid email or password"}, status=400)
@@ -77,11 +126,49 @@ class ProtectedView(View):
     def get(self, request):
         return JsonResponse(
             {
-                "message": f"Hello, {request.user.email}. This is a protected view. Your role is {request.user.role}."
+                "message": f"Hello, {request.user.email}. This is a protected view. "
+                f"Your role is {request.user.role}."
             }
         )
 
 
+@cache_response()
 class HomeView(View):
     def get(self, request):
         return HttpResponse("Welcome to the Home Page")
+
+
+class MetricsView(View):
+    """
+    Prometheus metrics, for staff users and clients on ``METRICS_ALLOWED_IPS``
+    (e.g. the scraper's network). Everyone else gets a 403.
+    """
+
+    def get(self, request):
+        if not self.allowed(request):
+            return HttpResponse(
+                FORBIDDEN_BODY, status=403, content_type="application/json"
+            )
+
+        samples = []
+        for handler in logging.getLogger("request_logger").handlers:
+            if hasattr(handler, "stats"):
+                stats = handler.stats()
+                samples.append(("request_log_queued", "gauge", {}, stats["queued"]))
+                for reason in ("dropped", "sampled_out"):
+                    samples.append(
+                        (
+                            "request_log_discarded_total",
+                            "counter",
+                            {"reason": reason},
+                            stats[reason],
+                        )
+                    )
+        return HttpResponse(
+            registry.render(samples), content_type="text/plain; version=0.0.4"
+        )
+
+    def allowed(self, request):
+        if get_client_ip(request) in load_networks("METRICS_ALLOWED_IPS"):
+            return True
+        return request.user.is_staff
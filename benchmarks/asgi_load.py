@@ -0,0 +1,170 @@
+"""
+ASGI load test of the full MIDDLEWARE chain, run in-process against
+custom.asgi-style application instances.
+
+Compares the default chain, which SyncChainMiddleware makes run in one sync
+block, with the same chain without it, where the project middlewares run
+natively async and Django hops threads around each of its own
+MiddlewareMixin built-ins. Counts the sync/async thread hops Django inserts
+per request for each.
+
+Usage:
+    python -m benchmarks.asgi_load --requests 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+django.setup()
+
+from asgiref import sync  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from api.middlewares.handlers import QueueingFileHandler  # noqa: E402
+
+SYNC_CHAIN = "api.middlewares.syncchain.SyncChainMiddleware"
+
+
+class HopCounter:
+    """Counts sync_to_async/async_to_sync calls, keyed by the wrapped callable."""
+
+    def __init__(self):
+        self.hops = collections.Counter()
+
+    def __enter__(self):
+        self.originals = sync.SyncToAsync.__call__, sync.AsyncToSync.__call__
+        hops = self.hops
+
+        def count(original, attribute):
+            def wrapper(adapter, *args, **kwargs):
+                wrapped = getattr(adapter, attribute)
+                hops[getattr(wrapped, "__qualname__", repr(wrapped))] += 1
+                return original(adapter, *args, **kwargs)
+
+            return wrapper
+
+        sync.SyncToAsync.__call__ = count(self.originals[0], "func")
+        sync.AsyncToSync.__call__ = count(self.originals[1], "awaitable")
+        return self
+
+    def __exit__(self, *exc_info):
+        sync.SyncToAsync.__call__, sync.AsyncToSync.__call__ = self.originals
+
+
+def client_ip(n):
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+async def send_request(application, n, path, headers=()):
+    disconnected = asyncio.Event()
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), *headers],
+        "client": (client_ip(n), 50000),
+        "server": ("localhost", 8000),
+    }
+    await application(scope, receive, send)
+    disconnected.set()
+    return statuses[0]
+
+
+async def run_load(application, requests, concurrency, path, headers=()):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def worker(n):
+        async with semaphore:
+            started = time.perf_counter()
+            status = await send_request(application, n, path, headers)
+            latencies.append(time.perf_counter() - started)
+            return status
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(worker(n) for n in range(requests)))
+    return time.perf_counter() - started, sorted(latencies), statuses
+
+
+def measure(middleware, requests, concurrency, path):
+    with override_settings(MIDDLEWARE=middleware):
+        application = ASGIHandler()
+        with HopCounter() as counter:
+            elapsed, latencies, statuses = asyncio.run(
+                run_load(application, requests, concurrency, path)
+            )
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1e3,
+        "hops_per_request": sum(counter.hops.values()) / requests,
+        "hops": {name: count / requests for name, count in counter.hops.items()},
+        "errors": sum(status >= 400 for status in statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--path", default="/")
+    parser.add_argument(
+        "--show-hops", action="store_true", help="break hops down by callable"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        logger = logging.getLogger("request_logger")
+        logger.handlers = [QueueingFileHandler(os.path.join(directory, "asgi.log"))]
+
+        default = list(settings.MIDDLEWARE)
+        mixed = [path for path in default if path != SYNC_CHAIN]
+
+        print(
+            f"{'middlewares':<12} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'hops/req':>9} {'errors':>7}"
+        )
+        for name, middleware in (("mixed", mixed), ("default", default)):
+            result = measure(middleware, args.requests, args.concurrency, args.path)
+            print(
+                f"{name:<12} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['hops_per_request']:>9.1f} "
+                f"{result['errors']:>7}"
+            )
+            if args.show_hops:
+                for callable_name, count in sorted(result["hops"].items()):
+                    print(f"{'':<12} {count:>5.1f}  {callable_name}")
+        logger.handlers[0].close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare two benchmarks.run result files and flag regressions.
+
+A metric regresses when it gets worse by more than ``--threshold``: ``rps``
+should go up, every other metric (latency, memory, errors) should go down.
+Exits with status 1 if anything regressed.
+
+Usage:
+    python -m benchmarks.compare base.json head.json --threshold 0.10
+"""
+
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = {"rps"}
+# Bookkeeping values that are not performance measurements.
+IGNORED = {"entries"}
+
+
+def compare(base, head, threshold):
+    rows = []
+    for name in sorted(set(base) & set(head)):
+        for metric in sorted(set(base[name]) & set(head[name]) - IGNORED):
+            old, new = base[name][metric], head[name][metric]
+            if old == new:
+                change = 0.0
+            elif old == 0:
+                change = float("inf")
+            else:
+                change = (new - old) / abs(old)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            rows.append((name, metric, old, new, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+
+    print(f"base {base['meta'].get('commit')}  head {head['meta'].get('commit')}")
+    print(f"{'benchmark':<32} {'metric':<16} {'base':>12} {'head':>12} {'change':>8}")
+    rows = compare(base["results"], head["results"], args.threshold)
+    for name, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(
+            f"{name:<32} {metric:<16} {old:>12.1f} {new:>12.1f} "
+            f"{change:>+7.1%}{flag}"
+        )
+
+    for name in sorted(set(base["results"]) ^ set(head["results"])):
+        side = "base" if name in base["results"] else "head"
+        print(f"{name:<32} only in {side}")
+
+    regressions = sum(row[-1] for row in rows)
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Memory profile of the rate limiter counter store under a flood of distinct keys.
+
+Usage:
+    python -m benchmarks.counter_store_memory --keys 10000000
+    python -m benchmarks.counter_store_memory --algorithm SlidingLog --limit 10
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from django.utils.module_loading import import_string
+
+from api.middlewares.stores import LocMemCounterStore
+
+
+def fake_ip(n):
+    return f"{n >> 24 & 255}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def profile(keys, max_entries, algorithm="FixedWindow", limit=10, report=None):
+    """
+    Hit the store once for each of ``keys`` distinct keys and return the
+    traced memory, calling ``report(keys_so_far, store)`` along the way.
+    """
+    algorithm = import_string(f"api.middlewares.algorithms.{algorithm}")()
+    store = LocMemCounterStore(max_entries=max_entries)
+    tracemalloc.start()
+    started = time.perf_counter()
+    now = time.time()
+
+    for n in range(1, keys + 1):
+        store.hit(fake_ip(n), algorithm, limit, 60, now + n / 1_000_000)
+        if report is not None:
+            report(n, store)
+
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "entries": len(store),
+        "current_mib": current / 2**20,
+        "peak_mib": peak / 2**20,
+        "bytes_per_entry": current / max(len(store), 1),
+        "us_per_key": elapsed / keys * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--max-entries", type=int, default=100_000)
+    parser.add_argument("--report-every", type=int, default=1_000_000)
+    parser.add_argument("--algorithm", default="FixedWindow")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    def report(n, store):
+        if n % args.report_every == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                f"{n:>12,} {len(store):>9,} "
+                f"{current / 2**20:>12.1f} {peak / 2**20:>9.1f}"
+            )
+
+    print(f"{'keys':>12} {'entries':>9} {'current MiB':>12} {'peak MiB':>9}")
+    result = profile(
+        args.keys, args.max_entries, args.algorithm, args.limit, report=report
+    )
+    print(
+        f"{args.keys:,} keys, {result['bytes_per_entry']:.0f} bytes/entry, "
+        f"{result['us_per_key']:.2f} us/key"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Per-request cost of getting a database connection: a new connection for
+every request (the old settings), a persistent connection with health
+checks, and a psycopg connection pool. Each simulated request runs the
+start/end-of-request cleanup Django runs and one small query.
+
+Connects to the database configured by the DB_* environment variables (see
+custom/database.py); the pool is only measured on PostgreSQL with psycopg 3.
+
+Usage:
+    DB_HOST=... python -m benchmarks.db_connections --requests 2000
+    DB_ENGINE=sqlite python -m benchmarks.db_connections
+"""
+
+import argparse
+import copy
+import os
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+django.setup()
+
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+from django.db.utils import ConnectionHandler  # noqa: E402
+
+from custom.database import database_config, pool_options  # noqa: E402
+
+
+def profiles(base):
+    fresh = dict(base, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+    fresh["OPTIONS"] = {}
+    yield "new connection per request", fresh
+
+    persistent = dict(base, CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+    persistent["OPTIONS"] = {}
+    yield "persistent + health checks", persistent
+
+    if base["ENGINE"] != "django.db.backends.postgresql":
+        return
+    try:
+        pool = pool_options(os.environ)
+    except ImproperlyConfigured as e:
+        print(f"pool skipped: {e}")
+        return
+    pooled = dict(base, CONN_MAX_AGE=0)
+    pooled["OPTIONS"] = dict(base.get("OPTIONS", {}), pool=pool)
+    yield "psycopg pool", pooled
+
+
+def per_request_ms(config, requests):
+    connection = ConnectionHandler({"default": copy.deepcopy(config)})["default"]
+    try:
+        # The first pass warms up (imports, the SQLite file, the pool).
+        for _ in range(2):
+            started = time.perf_counter()
+            for _ in range(requests):
+                # What request_started and request_finished do around a view.
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()
+        return (time.perf_counter() - started) / requests * 1e3
+    finally:
+        connection.close()
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2_000)
+    args = parser.parse_args()
+
+    base = database_config(os.environ, tempfile.mkdtemp(prefix="benchmarks-"))
+    print(f"{base['ENGINE']}, {args.requests} requests")
+    baseline = None
+    for name, config in profiles(base):
+        elapsed = per_request_ms(config, args.requests)
+        if baseline is None:
+            baseline = elapsed
+        saved = (1 - elapsed / baseline) * 100
+        print(f"{name:<28} {elapsed:>8.3f} ms/request  {saved:>5.1f}% saved")
+
+
+if __name__ == "__main__":
+    main()
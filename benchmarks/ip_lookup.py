@@ -0,0 +1,58 @@
+"""
+Lookup cost of IPNetworkSet, the index behind IP_ALLOWLIST and IP_DENYLIST,
+with 100k random IPv4 and IPv6 CIDR ranges.
+
+Usage:
+    python -m benchmarks.ip_lookup --networks 100000 --lookups 200000
+"""
+
+import argparse
+import ipaddress
+import random
+import time
+
+from api.middlewares.clientip import IPNetworkSet
+
+
+def random_networks(rng, count):
+    networks = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            network = ipaddress.IPv4Network(
+                (rng.getrandbits(32), rng.randint(16, 32)), strict=False
+            )
+        else:
+            network = ipaddress.IPv6Network(
+                (rng.getrandbits(128), rng.randint(32, 64)), strict=False
+            )
+        networks.append(str(network))
+    return networks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--networks", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    networks = random_networks(rng, args.networks)
+    started = time.perf_counter()
+    index = IPNetworkSet(networks)
+    build = time.perf_counter() - started
+
+    hits = [str(ipaddress.ip_network(rng.choice(networks))[0]) for _ in range(1000)]
+    misses = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(1000)]
+    print(f"{args.networks:,} networks, {len(index):,} merged ranges")
+    print(f"{'build':<10} {build * 1e3:>8.1f} ms")
+    for name, ips in (("hit", hits), ("random", misses)):
+        lookups = (ips * (args.lookups // len(ips) + 1))[: args.lookups]
+        started = time.perf_counter()
+        for ip in lookups:
+            ip in index
+        elapsed = time.perf_counter() - started
+        print(f"{name:<10} {elapsed / args.lookups * 1e6:>8.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Simulated database slowdown with and without adaptive load shedding.
+
+Requests arrive at a steady rate from a mix of roles and run a view that
+queries a stand-in for PostgreSQL with a fixed number of connections.
+In the middle phase queries get ten times slower. Without shedding every
+request is admitted and queues for a connection, so latency climbs for
+every role. With LoadSheddingMiddleware the limit shrinks until latency is
+back near the target, and the requests turned away are mostly
+unauthenticated and bronze ones.
+
+Usage:
+    python -m benchmarks.load_shedding --rate 500 --phase 3
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import AsyncRequestFactory  # noqa: E402
+
+from api.middlewares.shedding import AdaptiveLimit  # noqa: E402
+from api.middlewares.shedding import LoadSheddingMiddleware  # noqa: E402
+
+ROLE_MIX = {"gold": 10, "silver": 20, "bronze": 30, "unauthenticated": 40}
+PHASES = (("normal", 1), ("slow", 10), ("recovered", 1))
+TICK = 0.01
+
+
+class Database:
+    """``connections`` connections; each query holds one for ``query_time``."""
+
+    def __init__(self, connections, query_time):
+        self.connections = asyncio.Semaphore(connections)
+        self.base_query_time = self.query_time = query_time
+
+    async def query(self):
+        async with self.connections:
+            await asyncio.sleep(self.query_time)
+
+
+async def simulate(limit, args):
+    database = Database(args.connections, args.query_ms / 1000)
+
+    async def view(request):
+        await database.query()
+        return HttpResponse()
+
+    middleware = LoadSheddingMiddleware(view)
+    middleware.limit = limit
+    factory = AsyncRequestFactory()
+    rng = random.Random(0)
+    roles = list(ROLE_MIX)
+    results = defaultdict(list)
+    tasks = set()
+
+    async def client(phase, role):
+        request = factory.get("/")
+        request.user = SimpleNamespace(
+            is_authenticated=role != "unauthenticated", id=1, role=role
+        )
+        started = time.perf_counter()
+        response = await middleware(request)
+        latency = time.perf_counter() - started
+        results[phase, role].append((response.status_code == 200, latency))
+
+    per_tick = args.rate * TICK
+    limits = {}
+    for phase, slowdown in PHASES:
+        database.query_time = database.base_query_time * slowdown
+        due = 0.0
+        deadline = time.perf_counter() + args.phase
+        while time.perf_counter() < deadline:
+            due += per_tick
+            while due >= 1:
+                due -= 1
+                role = rng.choices(roles, ROLE_MIX.values())[0]
+                task = asyncio.create_task(client(phase, role))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.sleep(TICK)
+        limits[phase] = limit.limit
+    await asyncio.gather(*tasks)
+    return results, limits
+
+
+def report(title, results, limits):
+    print(f"\n{title}")
+    print(f"{'phase':<10} {'role':<16} {'admitted':>9} {'p50':>9} {'p99':>9}")
+    for phase, _ in PHASES:
+        for role in ROLE_MIX:
+            outcomes = results[phase, role]
+            latencies = sorted(latency for ok, latency in outcomes if ok)
+            admitted = len(latencies) / max(len(outcomes), 1)
+            if latencies:
+                p50 = statistics.median(latencies) * 1e3
+                p99 = latencies[int(len(latencies) * 0.99)] * 1e3
+            else:
+                p50 = p99 = float("nan")
+            print(
+                f"{phase:<10} {role:<16} {admitted:>8.0%} {p50:>7.0f}ms {p99:>7.0f}ms"
+            )
+        if limits[phase] < 10**6:
+            print(f"{'':<10} limit at the end: {limits[phase]:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=500, help="requests/second")
+    parser.add_argument("--phase", type=float, default=3, help="seconds per phase")
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--query-ms", type=float, default=10)
+    parser.add_argument("--latency-target", type=float, default=0.25)
+    args = parser.parse_args()
+
+    unlimited = AdaptiveLimit(initial_limit=10**9, max_limit=10**9)
+    report("No shedding", *asyncio.run(simulate(unlimited, args)))
+    adaptive = AdaptiveLimit(latency_target=args.latency_target)
+    report("Adaptive load shedding", *asyncio.run(simulate(adaptive, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-request overhead of LoggingMiddleware with a synchronous FileHandler
+versus the queued, batching QueueingFileHandler.
+
+Usage:
+    python -m benchmarks.logging_overhead --requests 20000 --disk-latency-us 200
+    python -m benchmarks.logging_overhead --sample-rate 0.01
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+django.setup()
+
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from api.middlewares.handlers import QueueingFileHandler  # noqa: E402
+from api.middlewares.logging import LoggingMiddleware, request_logger  # noqa: E402
+from api.middlewares.sampling import RequestSampler  # noqa: E402
+
+
+class SlowStream:
+    """Stands in for a slow or busy disk: every flush takes ``latency`` seconds."""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def close(self):
+        self.stream.close()
+
+
+def measure(handler, requests, sample_rate):
+    request_logger.handlers = [handler]
+    middleware = LoggingMiddleware(get_response=lambda r: HttpResponse("OK"))
+    middleware.sampler = RequestSampler(rate=sample_rate)
+    request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.1")
+    request.user = AnonymousUser()
+
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        middleware(request)
+        timings.append(time.perf_counter() - started)
+
+    handler.close()
+    timings.sort()
+    return {
+        "mean": statistics.fmean(timings) * 1e6,
+        "p50": timings[len(timings) // 2] * 1e6,
+        "p99": timings[int(len(timings) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--disk-latency-us", type=float, default=0.0)
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    args = parser.parse_args()
+    latency = args.disk_latency_us / 1e6
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync = logging.FileHandler(os.path.join(directory, "sync.log"))
+        sync.stream = SlowStream(sync.stream, latency)
+        queued = QueueingFileHandler(os.path.join(directory, "queued.log"))
+        queued.target.stream = SlowStream(queued.target._open(), latency)
+
+        print(f"{'handler':<22} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+        for name, handler in (("FileHandler", sync), ("QueueingFileHandler", queued)):
+            result = measure(handler, args.requests, args.sample_rate)
+            print(
+                f"{name:<22} {result['mean']:>9.1f} "
+                f"{result['p50']:>9.1f} {result['p99']:>9.1f}"
+            )
+        print(f"dropped by QueueingFileHandler: {queued.dropped}")
+
+
+if __name__ == "__main__":
+    main()
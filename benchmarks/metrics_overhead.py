@@ -0,0 +1,52 @@
+"""
+Cost of recording request metrics: a bare Histogram.record, and
+TimingMiddleware wrapped around a trivial view compared with the view alone.
+
+Usage:
+    python -m benchmarks.metrics_overhead --requests 200000
+"""
+
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.urls import resolve  # noqa: E402
+
+from api.middlewares.metrics import Histogram, TimingMiddleware  # noqa: E402
+
+
+def per_call_us(function, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    histogram = Histogram()
+    record = per_call_us(lambda: histogram.record(1234), args.requests)
+
+    request = RequestFactory().get("/")
+    request.resolver_match = resolve("/")
+    view = lambda r: HttpResponse()  # noqa: E731
+    middleware = TimingMiddleware(view)
+    bare = per_call_us(lambda: view(request), args.requests)
+    timed = per_call_us(lambda: middleware(request), args.requests)
+
+    print(f"Histogram.record          {record:>7.2f} us")
+    print(f"TimingMiddleware overhead {timed - bare:>7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
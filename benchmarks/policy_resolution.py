@@ -0,0 +1,90 @@
+"""
+Cost of resolving a request to its rate limit policy with 1,000 rules, next
+to the per-request dict the middleware used to build.
+
+Usage:
+    python -m benchmarks.policy_resolution --policies 1000 --lookups 200000
+"""
+
+import argparse
+import os
+import random
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+django.setup()
+
+from api.middlewares.policies import PolicyTable  # noqa: E402
+
+ROLES = ["gold", "silver", "bronze", "unauthenticated", "Default"]
+METHODS = ["GET", "POST", "PUT", "DELETE"]
+
+
+def old_get_request_limit(path, method, role):
+    limits = {
+        "gold": 10,
+        "silver": 5,
+        "bronze": 2,
+        "unauthenticated": 1,
+    }
+    return limits.get(role.lower(), 1)
+
+
+def build_rules(count):
+    rules = []
+    for i in range(count):
+        if i % 3 == 0:
+            rule = {"prefix": f"/api/v{i % 7}/resource{i}/"}
+        else:
+            rule = {"path": f"/api/v{i % 7}/resource{i}/"}
+        rule["limits"] = {ROLES[i % 4]: i + 1}
+        if i % 2:
+            rule["methods"] = [METHODS[i % 4]]
+        rules.append(rule)
+    return rules
+
+
+def per_lookup_ns(function, requests):
+    started = time.perf_counter_ns()
+    for path, method, role in requests:
+        function(path, method, role)
+    return (time.perf_counter_ns() - started) / len(requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--paths", type=int, default=5_000)
+    args = parser.parse_args()
+
+    limits = {"gold": 10, "silver": 5, "bronze": 2, "unauthenticated": 1, "*": 1}
+    table = PolicyTable(limits, build_rules(args.policies))
+
+    rng = random.Random(0)
+    paths = [
+        f"/api/v{rng.randrange(7)}/resource{rng.randrange(args.policies * 2)}/"
+        + ("item/" if rng.random() < 0.3 else "")
+        for _ in range(args.paths)
+    ]
+    requests = [
+        (rng.choice(paths), rng.choice(METHODS), rng.choice(ROLES))
+        for _ in range(args.lookups)
+    ]
+
+    cold = per_lookup_ns(table.resolve, requests[: args.paths])
+    table.scope_for.cache_clear()
+    per_lookup_ns(table.resolve, requests)
+    warm = per_lookup_ns(table.resolve, requests)
+    old = per_lookup_ns(old_get_request_limit, requests)
+
+    print(f"{args.policies} policies, {args.paths} distinct paths")
+    print(f"{'dict rebuilt per request':<28} {old:>7.0f} ns")
+    print(f"{'PolicyTable, cached path':<28} {warm:>7.0f} ns")
+    print(f"{'PolicyTable, first sight':<28} {cold:>7.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Role queries on a generated user table (1M users by default), with and
+without the (role, email) index: counting one role, the admin's first page
+of a role filtered in email order, and the per-role counts a report runs.
+
+Runs on the benchmark SQLite database unless DJANGO_SETTINGS_MODULE points
+elsewhere, e.g. custom.settings with the DB_* variables for PostgreSQL.
+
+Usage:
+    python -m benchmarks.role_queries --users 1000000
+"""
+
+import argparse
+import os
+import random
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count  # noqa: E402
+
+User = get_user_model()
+
+ROLE_WEIGHTS = {"gold": 5, "silver": 15, "bronze": 30, "default": 50}
+INSERT_BATCH = 50_000
+
+
+def generate_users(count):
+    existing = User.objects.count()
+    if existing >= count:
+        return existing
+    rng = random.Random(0)
+    roles = rng.choices(list(ROLE_WEIGHTS), list(ROLE_WEIGHTS.values()), k=count)
+    table = User._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (password, is_superuser, email, first_name, "
+        "last_name, is_active, is_staff, role) "
+        "VALUES ('!', %s, %s, '', '', %s, %s, %s)"
+    )
+    with connection.cursor() as cursor:
+        for start in range(existing, count, INSERT_BATCH):
+            rows = [
+                (
+                    False,
+                    f"{rng.getrandbits(48):012x}.{i}@example.com",
+                    True,
+                    False,
+                    roles[i],
+                )
+                for i in range(start, min(start + INSERT_BATCH, count))
+            ]
+            with transaction.atomic():
+                cursor.executemany(sql, rows)
+    return count
+
+
+def queries():
+    yield "count role=silver", lambda: User.objects.filter(role="silver").count()
+    yield "role=silver first page", lambda: list(
+        User.objects.filter(role="silver").order_by("email").only("email")[:100]
+    )
+    yield "count per role", lambda: list(
+        User.objects.values("role").annotate(n=Count("pk")).order_by()
+    )
+
+
+def best_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1e3
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    started = time.perf_counter()
+    users = generate_users(args.users)
+    print(f"{users:,} users ({time.perf_counter() - started:.1f}s to generate)")
+
+    (index,) = (i for i in User._meta.indexes if i.name == "api_user_role_email_idx")
+    results = {}
+    for indexed in (True, False):
+        with connection.schema_editor() as editor:
+            if not indexed:
+                editor.remove_index(User, index)
+        analyze()
+        for name, function in queries():
+            results[name, indexed] = best_ms(function, args.repeat)
+    with connection.schema_editor() as editor:
+        editor.add_index(User, index)
+
+    print(f"{'query':<26} {'no index':>10} {'index':>10}")
+    for name, _ in queries():
+        print(
+            f"{name:<26} {results[name, False]:>8.1f}ms {results[name, True]:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
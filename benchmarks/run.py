@@ -0,0 +1,295 @@
+"""
+Benchmark suite for the middleware stack, run against benchmarks.settings
+(SQLite and LocMem, so no services are needed).
+
+Scenarios:
+    micro    per-call overhead of each project middleware around a bare view
+    wsgi     the full MIDDLEWARE chain through WSGIHandler, on threads
+    asgi     the full MIDDLEWARE chain through ASGIHandler, on asyncio tasks
+    memory   rate limiter counter store growth, per algorithm
+
+Results are written as JSON keyed by benchmark name, so two runs can be
+compared with benchmarks.compare.
+
+Usage:
+    python -m benchmarks.run --output base.json
+    python -m benchmarks.run --scenarios micro,wsgi --concurrency 1,8,32
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import Client, RequestFactory  # noqa: E402
+
+from api.middlewares.concurrency import ConcurrencyLimitMiddleware  # noqa: E402
+from api.middlewares.logging import LoggingMiddleware  # noqa: E402
+from api.middlewares.metrics import TimingMiddleware  # noqa: E402
+from api.middlewares.policies import PolicyLoader  # noqa: E402
+from api.middlewares.responsecache import ResponseCacheMiddleware  # noqa: E402
+from api.middlewares.role_based_ratelimit import RateLimitMiddleware  # noqa: E402
+from benchmarks import counter_store_memory  # noqa: E402
+from benchmarks.asgi_load import client_ip, run_load  # noqa: E402
+
+SCENARIOS = {}
+ALGORITHMS = (
+    "FixedWindow",
+    "SlidingWindowCounter",
+    "SlidingLog",
+    "TokenBucket",
+    "GCRA",
+)
+
+
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+
+    return register
+
+
+def summarize(latencies, elapsed=None):
+    latencies = sorted(latencies)
+    result = {
+        "mean_us": statistics.fmean(latencies) * 1e6,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+    if elapsed is not None:
+        result["rps"] = len(latencies) / elapsed
+    return result
+
+
+def time_calls(function, argument, count):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+@scenario("micro")
+def micro(args):
+    factory = RequestFactory()
+    ok = HttpResponse()
+
+    def view(request):
+        return ok
+
+    def anonymous_request():
+        request = factory.get("/", REMOTE_ADDR="10.0.0.1")
+        request.user = AnonymousUser()
+        return request
+
+    rejecting = RateLimitMiddleware(view)
+    rejecting.policies = PolicyLoader({"limits": {"*": 1}})
+    rejected_request = anonymous_request()
+    rejecting(rejected_request)
+
+    cases = {
+        "view": (view, anonymous_request()),
+        "timing": (TimingMiddleware(view), anonymous_request()),
+        "logging": (LoggingMiddleware(view), anonymous_request()),
+        "ratelimit_allowed": (RateLimitMiddleware(view), anonymous_request()),
+        "ratelimit_rejected": (rejecting, rejected_request),
+        "concurrency": (ConcurrencyLimitMiddleware(view), anonymous_request()),
+        "response_cache_hit": (ResponseCacheMiddleware(view), anonymous_request()),
+    }
+    results = {}
+    for name, (middleware, request) in cases.items():
+        time_calls(middleware, request, args.warmup)
+        results[f"micro.{name}"] = summarize(
+            time_calls(middleware, request, args.requests)
+        )
+    return results
+
+
+def session_cookie():
+    user, _ = get_user_model().objects.get_or_create(
+        email="benchmark@example.com", defaults={"role": "gold"}
+    )
+    client = Client()
+    client.force_login(user)
+    name = settings.SESSION_COOKIE_NAME
+    return f"{name}={client.cookies[name].value}"
+
+
+def targets():
+    """(name, path, cookie) for an anonymous page and a logged-in page."""
+    return [
+        ("anonymous", "/", None),
+        ("authenticated", "/protected/", session_cookie()),
+    ]
+
+
+def wsgi_request(application, n, path, cookie):
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "8000",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": client_ip(n),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.url_scheme": "http",
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if cookie:
+        environ["HTTP_COOKIE"] = cookie
+    statuses = []
+    response = application(environ, lambda status, headers: statuses.append(status))
+    for _ in response:
+        pass
+    response.close()
+    return int(statuses[0].split()[0])
+
+
+@scenario("wsgi")
+def wsgi(args):
+    application = WSGIHandler()
+    results = {}
+    for name, path, cookie in targets():
+        for concurrency in args.concurrency:
+            latencies, statuses = [], []
+
+            def worker(n):
+                started = time.perf_counter()
+                statuses.append(wsgi_request(application, n, path, cookie))
+                latencies.append(time.perf_counter() - started)
+
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(worker, range(args.warmup)))
+                latencies.clear()
+                statuses.clear()
+                started = time.perf_counter()
+                list(pool.map(worker, range(args.requests)))
+                elapsed = time.perf_counter() - started
+
+            result = summarize(latencies, elapsed)
+            result["errors"] = sum(status >= 400 for status in statuses)
+            results[f"wsgi.{name}.c{concurrency}"] = result
+    return results
+
+
+@scenario("asgi")
+def asgi(args):
+    application = ASGIHandler()
+    results = {}
+    for name, path, cookie in targets():
+        headers = [(b"cookie", cookie.encode())] if cookie else []
+        for concurrency in args.concurrency:
+            asyncio.run(run_load(application, args.warmup, concurrency, path, headers))
+            elapsed, latencies, statuses = asyncio.run(
+                run_load(application, args.requests, concurrency, path, headers)
+            )
+            result = summarize(latencies, elapsed)
+            result["errors"] = sum(status >= 400 for status in statuses)
+            results[f"asgi.{name}.c{concurrency}"] = result
+    return results
+
+
+@scenario("memory")
+def memory(args):
+    return {
+        f"memory.{algorithm}": counter_store_memory.profile(
+            args.keys, args.keys // 2, algorithm
+        )
+        for algorithm in ALGORITHMS
+    }
+
+
+def run(args):
+    results = {}
+    for name in args.scenarios:
+        runs = [SCENARIOS[name](args) for _ in range(args.repeat)]
+        # Keep the median of each metric across repeats.
+        for key in runs[0]:
+            results[key] = {
+                metric: statistics.median(run[key][metric] for run in runs)
+                for metric in runs[0][key]
+            }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,16")
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios.split(",")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    call_command("migrate", verbosity=0)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "platform": platform.platform(),
+            "settings": os.environ["DJANGO_SETTINGS_MODULE"],
+            "options": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+        },
+        "results": run(args),
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as results_file:
+            results_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
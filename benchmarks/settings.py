@@ -0,0 +1,44 @@
+"""
+Settings for the benchmark suite: the project's settings and MIDDLEWARE,
+but with SQLite and LocMem instead of PostgreSQL, logs in a scratch
+directory, and limits high enough that the rate, concurrency and load
+shedding limiters do all their work without rejecting the load.
+"""
+
+import copy
+import os
+import tempfile
+
+from custom.settings import *  # noqa: F401,F403
+from custom.settings import LOGGING
+
+BENCHMARK_DIR = os.environ.get("BENCHMARK_DIR") or tempfile.mkdtemp(
+    prefix="benchmarks-"
+)
+
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BENCHMARK_DIR, "db.sqlite3"),
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+LOGGING = copy.deepcopy(LOGGING)
+for handler in LOGGING["handlers"].values():
+    if "filename" in handler:
+        handler["filename"] = os.path.join(
+            BENCHMARK_DIR, os.path.basename(handler["filename"])
+        )
+
+RATELIMIT_POLICIES = {"limits": {"*": 10**9}}
+CONCURRENCY_LIMIT_OPTIONS = {"client_limits": {"*": 10**9}}
+LOAD_SHEDDING_OPTIONS = {"initial_limit": 10**9, "max_limit": 10**9}
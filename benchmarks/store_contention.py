@@ -0,0 +1,56 @@
+"""
+Throughput of the in-process counter stores with many threads hitting
+spread keys at once: one lock for the whole store against lock striping.
+
+Usage:
+    python -m benchmarks.store_contention --threads 1,8,32 --hits 20000
+"""
+
+import argparse
+import threading
+import time
+
+from api.middlewares.algorithms import FixedWindow
+from api.middlewares.stores import LocMemCounterStore, ShardedLocMemCounterStore
+
+STORES = {
+    "single lock": lambda: LocMemCounterStore(),
+    "16 shards": lambda: ShardedLocMemCounterStore(shards=16),
+}
+
+
+def run(store, threads, hits, keys=1000):
+    """Hits per second with ``threads`` threads doing ``hits`` hits each."""
+    algorithm = FixedWindow()
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        start.wait()
+        for i in range(hits):
+            store.hit(f"10.0.{offset}.{i % keys}", algorithm, 10**9, 60, now=0)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    started = time.perf_counter()
+    start.wait()
+    for thread in workers:
+        thread.join()
+    return threads * hits / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", default="1,8,32")
+    parser.add_argument("--hits", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'store':<12} {'threads':>8} {'hits/s':>12}")
+    for threads in map(int, args.threads.split(",")):
+        for name, factory in STORES.items():
+            rate = run(factory(), threads, args.hits)
+            print(f"{name:<12} {threads:>8} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "custom.settings")
+# Read by custom/database.py: persistent connections are off by default here.
+os.environ.setdefault("DJANGO_ASGI", "1")
 
 application = get_asgi_application()
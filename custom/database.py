@@ -0,0 +1,85 @@
+"""
+DATABASES["default"] from environment variables, so one settings file serves
+development, tests and production.
+
+    DB_ENGINE             "postgresql" (default) or "sqlite"
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE       seconds to keep a connection between requests (60,
+                          or 0 when served by custom/asgi.py)
+    DB_CONN_HEALTH_CHECKS check a reused connection before a request (on)
+    DB_POOL               use a psycopg 3 connection pool instead (off)
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+
+Persistent connections belong to the thread that opened them. Under WSGI that
+is one of a fixed set of worker threads, so a worker holds at most one. Under
+ASGI, sync code runs on whichever executor thread is free, and a connection
+is only closed by the request_finished of the thread that opened it: with
+CONN_MAX_AGE > 0, every thread the server ever used can keep its own idle
+connection open until it expires, and enough of them exhaust the server's
+max_connections. custom/asgi.py sets DJANGO_ASGI, and then CONN_MAX_AGE
+defaults to 0: a connection per request, closed when the request finishes.
+Use DB_POOL=1 under ASGI to reuse connections with a hard upper bound.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def env_flag(environ, name, default):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in TRUE_VALUES
+
+
+def database_config(environ=os.environ, base_dir="."):
+    engine = environ.get("DB_ENGINE", "postgresql")
+    if engine == "sqlite":
+        return {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": environ.get("DB_NAME", os.path.join(base_dir, "db.sqlite3")),
+        }
+    if engine != "postgresql":
+        raise ImproperlyConfigured(
+            f"DB_ENGINE must be 'postgresql' or 'sqlite', not {engine!r}."
+        )
+
+    default_max_age = 0 if env_flag(environ, "DJANGO_ASGI", False) else 60
+    config = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": environ.get("DB_NAME", "custom_db"),
+        "USER": environ.get("DB_USER", "admin"),
+        "PASSWORD": environ.get("DB_PASSWORD", "admin123"),
+        "HOST": environ.get("DB_HOST", "localhost"),
+        "PORT": environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(environ.get("DB_CONN_MAX_AGE", default_max_age)),
+        "CONN_HEALTH_CHECKS": env_flag(environ, "DB_CONN_HEALTH_CHECKS", True),
+        "OPTIONS": {},
+    }
+    if env_flag(environ, "DB_POOL", False):
+        config["OPTIONS"]["pool"] = pool_options(environ)
+        # Connections go back to the pool at the end of each request, which
+        # Django only allows with CONN_MAX_AGE = 0.
+        config["CONN_MAX_AGE"] = 0
+    return config
+
+
+def pool_options(environ):
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "DB_POOL needs psycopg 3 with its pool: pip install 'psycopg[pool]'."
+        ) from e
+
+    return {
+        "min_size": int(environ.get("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(environ.get("DB_POOL_MAX_SIZE", 10)),
+        "timeout": float(environ.get("DB_POOL_TIMEOUT", 10)),
+        # Test each connection as it is handed out, so one the server or a
+        # firewall dropped is replaced instead of failing the request.
+        "check": ConnectionPool.check_connection,
+    }
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 
+from custom.database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -44,6 +46,21 @@ LOGGING = {
             "class": "logging.FileHandler",
             "filename": os.path.join(LOG_DIR, "requests.log"),
         },
+        "requests": {
+            "level": "INFO",
+            "class": "api.middlewares.handlers.QueueingFileHandler",
+            "filename": os.path.join(LOG_DIR, "requests.jsonl"),
+            "max_queue_size": 10_000,
+            # "drop", "block" or "sample" once the queue is full.
+            "overflow": "drop",
+            "batch_size": 256,
+            # "text", "jsonl" or "binary".
+            "record_format": "jsonl",
+            "max_bytes": 50 * 1024 * 1024,
+            "rotate_interval": 24 * 60 * 60,
+            "backup_count": 14,
+            "compress": True,
+        },
     },
     "loggers": {
         "django": {
@@ -52,7 +69,7 @@ LOGGING = {
             "propagate": True,
         },
         "request_logger": {
-            "handlers": ["file"],
+            "handlers": ["requests"],
             "level": "INFO",
             "propagate": False,
         },
@@ -60,6 +77,20 @@ LOGGING = {
 }
 
 
+# Which requests LoggingMiddleware logs. Decided from the path and client IP
+# before the view runs; 5xx responses and always_log_statuses are logged
+# regardless of sampling.
+REQUEST_LOG_SAMPLING = {
+    "rate": 1.0,
+    # Longest matching prefix wins, e.g. {"/metrics/": 0, "/login/": 1.0}.
+    "path_rates": {},
+    "always_log_statuses": [429],
+    # Most records per client IP per interval (seconds); 0 for no cap.
+    "per_ip_limit": 0,
+    "interval": 60,
+}
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -73,6 +104,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so denied clients cost nothing further.
+    "api.middlewares.ipfilter.IPFilterMiddleware",
+    # Next, so request latency covers the rest of the middleware stack.
+    "api.middlewares.metrics.TimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,14 +115,164 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # Serve cached pages before the rate limiter and logging, so a hit costs
+    # one cache lookup.
+    "api.middlewares.responsecache.ResponseCacheMiddleware",
+    # Outside everything that can reject a request, so the log has the final
+    # status, including the 429s and 503s of the limiters below.
     "api.middlewares.logging.LoggingMiddleware",
+    # Rate limit before anything below loads the user, so rejecting
+    # over-limit traffic costs no database work.
     # "api.middlewares.ratelimit.RateLimitMiddleware",
     "api.middlewares.role_based_ratelimit.RateLimitMiddleware",
+    # After the rate limiter, so rejected requests never take a slot.
+    "api.middlewares.concurrency.ConcurrencyLimitMiddleware",
+    # Innermost, so the latency it adapts to is the server's own.
+    "api.middlewares.shedding.LoadSheddingMiddleware",
+    # Last, so under ASGI Django runs the chain in one sync block rather than
+    # hopping threads around each of its own middlewares above.
+    "api.middlewares.syncchain.SyncChainMiddleware",
 ]
 
 ROOT_URLCONF = "custom.urls"
 
 
+# REDIS_URL (e.g. redis://cache:6379/0) shares the default cache between all
+# workers and needs the redis package. Without it each process has its own.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Sessions are read from the cache and only written through to the database,
+# and the logged-in user is rebuilt from a cached snapshot of its row, so
+# authenticated requests need no queries. A multi-worker deployment needs a
+# shared cache (REDIS_URL): saving a user only drops the snapshot from the
+# cache of the worker that saved it, and the others keep serving the old row,
+# a deactivated user included, until USER_SNAPSHOT_TIMEOUT runs out. So that
+# bound stays short with per-process caches. The snapshot holds the password
+# hash, so keep the cache as private as the database.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+AUTHENTICATION_BACKENDS = ["api.backends.CachedModelBackend"]
+USER_SNAPSHOT_CACHE = "default"
+USER_SNAPSHOT_TIMEOUT = 300 if REDIS_URL else 30
+
+
+RATELIMIT_WINDOW = 60
+
+# Requests per window by role ("*" for any other role), plus rules for one
+# path, every path under a prefix, or a URL name, optionally per method.
+# Requests a rule covers are counted separately from other traffic.
+RATELIMIT_POLICIES = {
+    "limits": {"gold": 10, "silver": 5, "bronze": 2, "unauthenticated": 1, "*": 1},
+    "rules": [
+        # {"path": "/login/", "methods": ["POST"], "limits": {"*": 5}},
+        # {"view": "protected", "limits": {"gold": 20}, "window": 60},
+        # {"prefix": "/admin/", "limits": {"*": 100}},
+    ],
+}
+# A JSON file with the same structure, reloaded without a restart when it
+# changes. Checked at most every RATELIMIT_POLICY_RELOAD_INTERVAL seconds.
+# RATELIMIT_POLICY_FILE = os.path.join(BASE_DIR, "ratelimit_policies.json")
+RATELIMIT_POLICY_RELOAD_INTERVAL = 5
+
+# One of FixedWindow, SlidingWindowCounter, SlidingLog, TokenBucket or GCRA.
+RATELIMIT_ALGORITHM = "api.middlewares.algorithms.FixedWindow"
+
+# Identify clients from the session cookie and a short-lived cache of
+# session -> (user id, role), so over-limit requests are rejected before the
+# session or user is loaded.
+RATELIMIT_FAST_REJECT = True
+RATELIMIT_IDENTITY_CACHE_OPTIONS = {"max_entries": 10_000, "ttl": 60}
+
+# Requests each client (user, or IP) and each role may have in progress at
+# once. Requests over a limit wait up to `timeout` seconds in a queue of
+# `queue_size`, then get a 503.
+CONCURRENCY_LIMIT_OPTIONS = {
+    "client_limits": {"gold": 8, "silver": 4, "bronze": 2, "*": 2},
+    "role_limits": {"gold": 64, "silver": 32, "bronze": 16, "*": 16},
+    "queue_size": 16,
+    "timeout": 0.5,
+}
+
+# Requests the whole server may have in progress, adapted to latency: the
+# limit shrinks while requests take longer than `latency_target` seconds and
+# grows back when they don't. Each role may use its share of the limit, so
+# lower tiers are shed first.
+LOAD_SHEDDING_OPTIONS = {
+    "initial_limit": 100,
+    "min_limit": 8,
+    "max_limit": 1000,
+    "latency_target": 0.25,
+    "backoff": 0.9,
+    "shares": {"gold": 1.0, "silver": 0.9, "bronze": 0.7, "*": 0.5},
+}
+
+# GET responses of views decorated with @cache_response, or listed here by
+# URL name with a timeout, are cached: once for every anonymous client and
+# per user for logged-in ones. Only for views whose response depends on the
+# URL and the user alone.
+RESPONSE_CACHE_OPTIONS = {"cache_alias": "default", "timeout": 60, "lock_timeout": 5}
+RESPONSE_CACHE_VIEWS = {}
+
+# How many requests a request to a view counts as, by URL name, overriding
+# @ratelimit_cost on the view. A cost never exceeds the client's limit.
+RATELIMIT_COSTS = {
+    # "protected": 2,
+    # "login": {"POST": 5, "GET": 1},
+}
+
+# Paths the rate limiter lets through untouched, e.g. for metric scrapers.
+RATELIMIT_EXEMPT_PATHS = ["/metrics/"]
+
+# Addresses or CIDR ranges allowed to scrape /metrics/, besides staff users.
+# Add the Prometheus server's network, e.g. "10.0.0.0/8".
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+# Reverse proxies / load balancers in front of the app, as addresses or CIDR
+# ranges. The client IP is taken from CLIENT_IP_HEADER ("X-Forwarded-For" or
+# "Forwarded") only when the request comes through one of them; otherwise the
+# socket address is used, so clients can't pick their own IP. IPv6 clients
+# are rate limited per CLIENT_IPV6_PREFIX network.
+TRUSTED_PROXIES = []
+CLIENT_IP_HEADER = "X-Forwarded-For"
+CLIENT_IPV6_PREFIX = 64
+
+# Addresses or CIDR ranges that are never rate limited, and that are refused
+# with a 403. The *_FILE settings add one entry per line from a file.
+IP_ALLOWLIST = []
+IP_DENYLIST = []
+# IP_DENYLIST_FILE = os.path.join(BASE_DIR, "ip_denylist.txt")
+
+# Escalating blocks for repeat offenders, used by the blocking
+# api.middlewares.ratelimit.RateLimitMiddleware: base * factor ** (strikes - 1)
+# seconds, with one strike forgiven per `decay` seconds of good behaviour.
+RATELIMIT_PENALTY_OPTIONS = {
+    "base": 60,
+    "factor": 2,
+    "max_duration": 24 * 60 * 60,
+    "decay": 60 * 60,
+    "max_entries": 100_000,
+}
+
+RATELIMIT_STORE = "api.middlewares.stores.ShardedLocMemCounterStore"
+RATELIMIT_STORE_OPTIONS = {"max_entries": 100_000, "shards": 16}
+# Share counters between workers and nodes through a cache such as Redis
+# (FixedWindow and SlidingWindowCounter only):
+# RATELIMIT_STORE = "api.middlewares.stores.CacheCounterStore"
+# RATELIMIT_STORE_OPTIONS = {"cache_alias": "default"}
+
+
 AUTH_USER_MODEL = "api.CustomUser"
 
 TEMPLATES = [
@@ -114,7 +299,7 @@ WSGI_APPLICATION = "custom.wsgi.application"
 
 AUTH_PASSWORD_VALIDATORS = [
     {
-        "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
+        "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",  # noqa: E501
     },
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
@@ -127,6 +312,25 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with the first hasher; the others still verify
+# existing hashes, which are upgraded on the user's next login. For Argon2,
+# `pip install argon2-cffi` and put
+# "django.contrib.auth.hashers.Argon2PasswordHasher" first.
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+# Login and registration hash passwords in this many worker processes (0 for
+# a thread). Past max_pending queued hashes they answer 503 instead of
+# queueing more.
+PASSWORD_HASHING_OPTIONS = {"workers": 2, "max_pending": 64}
+
+# Login attempts allowed per email address per window (seconds), checked
+# before the password is hashed.
+LOGIN_THROTTLE_OPTIONS = {"limit": 5, "window": 300}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -150,13 +354,8 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "custom_db",
-        "USER": "admin",
-        "PASSWORD": "admin123",
-        "HOST": "localhost",
-        "PORT": "5432",
-    }
-}
+# PostgreSQL with persistent, health-checked connections by default (a
+# connection per request under ASGI, where persistent ones leak). Set
+# DB_POOL=1 for a psycopg connection pool, or DB_ENGINE=sqlite to run locally
+# and in tests without a database server. See custom/database.py.
+DATABASES = {"default": database_config(os.environ, BASE_DIR)}